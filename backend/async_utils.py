@@ -0,0 +1,36 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Executor dedicado para chamadas bloqueantes (Spotify, yt-dlp, SQLite)
+# feitas a partir de handlers async, para não travar o event loop do uvicorn
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BLOCKING_WORKERS", "16")),
+    thread_name_prefix="blocking"
+)
+
+async def run_blocking(func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Executa função bloqueante no executor dedicado
+
+    Args:
+        func: Função bloqueante
+        timeout: Tempo máximo de espera em segundos (None = sem limite)
+
+    Returns:
+        Resultado da função
+
+    Raises:
+        asyncio.TimeoutError: Se o timeout estourar. A thread continua
+            rodando até a função retornar; só a request deixa de esperar.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    future = loop.run_in_executor(blocking_executor, call)
+
+    if timeout is None:
+        return await future
+
+    return await asyncio.wait_for(future, timeout)
@@ -1,33 +1,147 @@
 import os
-import sqlite3
-import yt_dlp
+import asyncio
+import json
+import queue
+import subprocess
 import threading
 import time
 from pathlib import Path
-from typing import Optional, Callable, Dict
+from typing import Optional, Callable, Dict, Iterable, List
+
+from ytdl_pool import YoutubeDLPool
+from download_scheduler import DownloadScheduler, DownloadCancelled
+from sqlite_store import SQLiteStore
+from partial_stream import PartialFileSource
 
 class AudioCache:
     """
     Sistema de cache para arquivos de áudio com suporte a streaming progressivo
     """
     
-    def __init__(self, cache_dir: str = "../cache"):
+    EVICTION_POLICIES = ('lru', 'lfu')
+    
+    # Extensões de áudio guardadas no cache (opus transcodificado ou container nativo)
+    AUDIO_EXTENSIONS = ('opus', 'webm', 'm4a')
+    
+    # Intervalo mínimo entre eventos de progresso do mesmo download (segundos)
+    PROGRESS_EVENT_INTERVAL = 0.5
+    
+    # Dono registrado no DownloadScheduler por downloads de playback: um job
+    # de batch/prefetch que o play reaproveitou não é interrompido quando a
+    # playlist é pausada/cancelada
+    PLAYBACK_OWNER = 'playback'
+    
+    def __init__(
+        self,
+        cache_dir: str = "../cache",
+        ytdl_pool: Optional[YoutubeDLPool] = None,
+        max_cache_bytes: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+        eviction_policy: str = 'lru',
+        sweep_interval: float = 300,
+        transcode_native: bool = False,
+        scheduler: Optional[DownloadScheduler] = None
+    ):
+        """
+        Args:
+            cache_dir: Diretório dos arquivos de áudio e do banco
+            ytdl_pool: Pool de YoutubeDL compartilhado (cria um próprio se None)
+            max_cache_bytes: Orçamento de espaço em bytes (None = ilimitado)
+            max_age_days: Remove músicas não tocadas há X dias (None = nunca)
+            eviction_policy: 'lru' (menos recente) ou 'lfu' (menos tocada)
+            sweep_interval: Intervalo entre varreduras de eviction (segundos)
+            transcode_native: Converte downloads progressivos (webm/m4a) para
+                Opus em background depois de completos
+            scheduler: Fila de downloads compartilhada (cria uma própria se None)
+        """
+        if eviction_policy not in self.EVICTION_POLICIES:
+            raise ValueError(f"Invalid eviction policy: {eviction_policy}")
+        
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         
+        # Política de eviction
+        self.max_cache_bytes = max_cache_bytes
+        self.max_age_days = max_age_days
+        self.eviction_policy = eviction_policy
+        self.sweep_interval = sweep_interval
+        
+        # Eviction libera até este percentual do orçamento (evita thrashing)
+        self.eviction_low_watermark = 0.9
+        
+        # Perfil de download: bestaudio convertido para Opus 192kbps
+        self.ytdl_pool = ytdl_pool or YoutubeDLPool()
+        self.ytdl_pool.register_profile('download_opus', {
+            'format': 'bestaudio/best',
+            'outtmpl': str(self.cache_dir / "%(id)s.%(ext)s"),
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'opus',
+                'preferredquality': '192',
+            }],
+            'quiet': True,
+            'no_warnings': True,
+        })
+        
+        # Perfil de streaming: container nativo, sem transcode, gravado direto
+        # no arquivo final (sem .part) para o player ler enquanto baixa
+        self.ytdl_pool.register_profile('download_native', {
+            'format': 'bestaudio[ext=webm]/bestaudio[ext=m4a]/bestaudio/best',
+            'outtmpl': str(self.cache_dir / "%(id)s.%(ext)s"),
+            'nopart': True,
+            'quiet': True,
+            'no_warnings': True,
+        })
+        
+        # Transcode opcional em background
+        self.transcode_native = transcode_native
+        self._transcode_queue: "queue.Queue[tuple]" = queue.Queue()
+        self._transcode_thread: Optional[threading.Thread] = None
+        
+        # Banco em WAL: leitura por thread, writer único com commits em lote
         self.db_path = self.cache_dir / "cache.db"
-        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.store = SQLiteStore(self.db_path)
         self._init_db()
         
+        # Downloads passam pela fila com prioridades (play > prefetch > batch)
+        self.scheduler = scheduler or DownloadScheduler()
+        
         # Tracking de downloads progressivos
         self.progressive_downloads: Dict[str, Dict] = {}
         self.download_lock = threading.Lock()
+        
+        # Sinalização de prontidão (setada pelo hook de progresso do yt-dlp)
+        self._ready_events: Dict[str, threading.Event] = {}
+        self._async_waiters: Dict[str, List] = {}
+        
+        # Notificada a cada bloco baixado (leitores de arquivo parcial)
+        self._data_cond = threading.Condition()
+        
+        # Ouvintes de progresso (ex: canal WebSocket)
+        self._progress_listeners: List[Callable[[str, Dict], None]] = []
+        self._last_progress_event: Dict[str, float] = {}
+        
+        # Acessos pendentes (spotify_id → [last_accessed, hits]), gravados pelo sweeper
+        self._pending_access: Dict[str, List] = {}
+        self._access_lock = threading.Lock()
+        
+        # Fontes de músicas fixadas (playlists cacheadas, favoritos, etc)
+        self._pin_sources: List[Callable[[], Iterable[str]]] = []
+        
+        # Sweeper em background
+        self._sweeper_thread: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+        self._sweep_requested = threading.Event()
+        self.last_sweep: Optional[Dict] = None
     
     def _init_db(self):
         """
         Inicializa banco de dados SQLite
         """
-        self.db.execute("""
+        self.store.transaction(self._create_schema, wait=True)
+    
+    def _create_schema(self, conn):
+        conn.execute("""
             CREATE TABLE IF NOT EXISTS cache (
                 spotify_id TEXT PRIMARY KEY,
                 youtube_url TEXT NOT NULL,
@@ -38,7 +152,43 @@ class AudioCache:
                 download_complete BOOLEAN DEFAULT 0
             )
         """)
-        self.db.commit()
+        
+        # Migração: colunas de contabilidade LRU/LFU e pinning
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        if 'last_accessed' not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN last_accessed REAL")
+        if 'hit_count' not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN hit_count INTEGER DEFAULT 0")
+        if 'pinned' not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN pinned BOOLEAN DEFAULT 0")
+    
+    def _save_entry(
+        self,
+        spotify_id: str,
+        youtube_url: str,
+        file_path: str,
+        duration_ms: int,
+        complete: bool,
+        wait: bool = True
+    ):
+        """
+        Registra arquivo no banco
+        
+        Entradas incompletas (streaming) nunca sobrescrevem uma entrada existente,
+        para não rebaixar um download que já terminou.
+        """
+        verb = "INSERT OR REPLACE" if complete else "INSERT OR IGNORE"
+        self.store.write(f"""
+            {verb} INTO cache (spotify_id, youtube_url, file_path, file_size, duration_ms, download_complete)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            spotify_id,
+            youtube_url,
+            file_path,
+            os.path.getsize(file_path) if os.path.exists(file_path) else 0,
+            duration_ms,
+            1 if complete else 0
+        ), wait=wait)
     
     def get_cached_audio(self, spotify_id: str) -> Optional[str]:
         """
@@ -50,205 +200,611 @@ class AudioCache:
         Returns:
             Caminho do arquivo ou None se não existir
         """
-        cursor = self.db.execute(
+        result = self.store.read_one(
             "SELECT file_path, download_complete FROM cache WHERE spotify_id = ?",
             (spotify_id,)
         )
         
-        result = cursor.fetchone()
+        # Incompleto sem download rodando: sobra de um download que falhou
+        if result and not result[1] and self._discard_stale_partial(spotify_id, result[0]):
+            return None
         
         if result and os.path.exists(result[0]):
+            self._record_access(spotify_id)
             # Retorna mesmo se download não estiver completo (streaming)
             return result[0]
         
         # Se registro existe mas arquivo não, remove do banco
         if result:
-            self.db.execute("DELETE FROM cache WHERE spotify_id = ?", (spotify_id,))
-            self.db.commit()
+            self.store.write("DELETE FROM cache WHERE spotify_id = ?", (spotify_id,))
         
         return None
     
-    def download_and_cache(self, youtube_url: str, spotify_id: str) -> str:
+    def get_cached_audio_bulk(self, spotify_ids: Iterable[str]) -> Dict[str, str]:
+        """
+        Busca vários arquivos no cache de uma vez
+        
+        Uma consulta (json_each sobre a chave primária) e uma varredura do
+        diretório, em vez de uma consulta + stat por música. Não conta como
+        acesso para LRU/LFU (é checagem de presença, não reprodução).
+        
+        Args:
+            spotify_ids: IDs das músicas no Spotify
+        
+        Returns:
+            Dict spotify_id → caminho, só com as músicas presentes
+        """
+        ids = list(dict.fromkeys(spotify_ids))
+        if not ids:
+            return {}
+        
+        rows = self.store.read(
+            "SELECT spotify_id, file_path, download_complete FROM cache "
+            "WHERE spotify_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)
+        )
+        
+        cache_dir = os.path.abspath(self.cache_dir)
+        try:
+            with os.scandir(cache_dir) as entries:
+                present = {entry.name for entry in entries}
+        except OSError:
+            present = set()
+        
+        found = {}
+        missing = []
+        for spotify_id, file_path, complete in rows:
+            if not complete and self._discard_stale_partial(spotify_id, file_path):
+                continue
+            
+            if os.path.dirname(os.path.abspath(file_path)) == cache_dir:
+                exists = os.path.basename(file_path) in present
+            else:
+                exists = os.path.exists(file_path)
+            
+            if exists:
+                found[spotify_id] = file_path
+            else:
+                missing.append((spotify_id,))
+        
+        # Registros sem arquivo são removidos do banco
+        if missing:
+            self.store.write_many("DELETE FROM cache WHERE spotify_id = ?", missing)
+        
+        return found
+    
+    def download_and_cache(
+        self,
+        youtube_url: str,
+        spotify_id: str,
+        cancel_event: Optional[threading.Event] = None
+    ) -> str:
         """
         Baixa áudio do YouTube e armazena em cache (modo tradicional)
         
         Args:
             youtube_url: URL do vídeo no YouTube
             spotify_id: ID da música no Spotify
+            cancel_event: Interrompe o download quando setado (o .part
+                fica no disco e o yt-dlp continua dele na próxima vez)
         
         Returns:
             Caminho do arquivo baixado
+        
+        Raises:
+            DownloadCancelled: Se cancel_event foi setado
         """
         output_template = str(self.cache_dir / f"{spotify_id}.%(ext)s")
-        
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': output_template,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'opus',
-                'preferredquality': '192',
-            }],
-            'quiet': True,
-            'no_warnings': True,
-        }
+        hooks = [self._cancel_hook(cancel_event)] if cancel_event else None
         
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self.ytdl_pool.acquire('download_opus', outtmpl=output_template, progress_hooks=hooks) as ydl:
                 info = ydl.extract_info(youtube_url, download=True)
                 
                 # Caminho final do arquivo
                 file_path = str(self.cache_dir / f"{spotify_id}.opus")
                 
                 # Salva no banco
-                self.db.execute("""
-                    INSERT OR REPLACE INTO cache (spotify_id, youtube_url, file_path, file_size, duration_ms, download_complete)
-                    VALUES (?, ?, ?, ?, ?, 1)
-                """, (
-                    spotify_id,
-                    youtube_url,
-                    file_path,
-                    os.path.getsize(file_path) if os.path.exists(file_path) else 0,
-                    info.get('duration', 0) * 1000
-                ))
-                self.db.commit()
+                self._save_entry(spotify_id, youtube_url, file_path, info.get('duration', 0) * 1000, True)
                 
                 return file_path
         
+        except DownloadCancelled:
+            print(f"Download cancelled: {spotify_id}")
+            raise
         except Exception as e:
             print(f"Error downloading audio: {e}")
             raise
     
+    @staticmethod
+    def _cancel_hook(cancel_event: threading.Event) -> Callable:
+        """
+        Hook de progresso do yt-dlp que aborta o download (a exceção sobe
+        por extract_info) quando cancel_event é setado
+        """
+        def hook(d):
+            if cancel_event.is_set():
+                raise DownloadCancelled("Download cancelled")
+        return hook
+    
     def download_progressive(
         self,
         youtube_url: str,
         spotify_id: str,
         playback_ready_callback: Optional[Callable] = None,
-        min_buffer_percent: float = 10.0
-    ) -> str:
+        min_buffer_percent: float = 10.0,
+        timeout: float = 30,
+        native: bool = True,
+        priority: str = DownloadScheduler.INTERACTIVE
+    ) -> Optional[str]:
         """
         Baixa áudio com streaming progressivo
         
         Inicia playback quando min_buffer_percent% foi baixado,
         continua download em background
         
+        No modo native (default) o áudio é gravado no container original
+        (webm/opus ou m4a) conforme chega, então o arquivo existe e pode ser
+        tocado (via open_partial_stream) antes do download terminar. Com
+        native=False o áudio passa pelo FFmpegExtractAudio e o .opus só
+        existe no fim.
+        
         Args:
             youtube_url: URL do vídeo
             spotify_id: ID da música
             playback_ready_callback: Função chamada quando pronto para tocar
             min_buffer_percent: % mínima para iniciar playback (default 10%)
+            timeout: Tempo máximo de espera pelo buffer (segundos)
+            native: Guarda o container nativo sem transcode
+            priority: Classe no DownloadScheduler (default interactive)
         
         Returns:
             Caminho do arquivo (mesmo que incompleto)
         """
-        file_path = str(self.cache_dir / f"{spotify_id}.opus")
+        try:
+            self._start_progressive(
+                youtube_url, spotify_id, playback_ready_callback, min_buffer_percent, native, priority
+            )
+            
+            # Esperar buffer mínimo (acorda assim que o hook sinalizar)
+            self.wait_until_ready(spotify_id, timeout)
+            
+            return self._register_partial(spotify_id, youtube_url)
+        
+        except Exception as e:
+            print(f"Error in progressive download: {e}")
+            raise
+    
+    async def download_progressive_async(
+        self,
+        youtube_url: str,
+        spotify_id: str,
+        playback_ready_callback: Optional[Callable] = None,
+        min_buffer_percent: float = 10.0,
+        timeout: float = 30,
+        native: bool = True,
+        priority: str = DownloadScheduler.INTERACTIVE
+    ) -> Optional[str]:
+        """
+        Versão async de download_progressive (não bloqueia o event loop)
+        """
+        self._start_progressive(
+            youtube_url, spotify_id, playback_ready_callback, min_buffer_percent, native, priority
+        )
+        
+        await self.wait_until_ready_async(spotify_id, timeout)
+        
+        return self._register_partial(spotify_id, youtube_url, wait=False)
+    
+    def _register_partial(self, spotify_id: str, youtube_url: str, wait: bool = True) -> Optional[str]:
+        """
+        Registra no banco o arquivo de um download em andamento
+        
+        Returns:
+            Caminho do arquivo
+        """
+        with self.download_lock:
+            file_path = self.progressive_downloads[spotify_id]['file_path']
+        
+        # Registrar no banco (mesmo que incompleto)
+        if file_path and os.path.exists(file_path):
+            # Duration desconhecido ainda
+            self._save_entry(spotify_id, youtube_url, file_path, 0, False, wait=wait)
+        
+        return file_path
+    
+    def _start_progressive(
+        self,
+        youtube_url: str,
+        spotify_id: str,
+        playback_ready_callback: Optional[Callable],
+        min_buffer_percent: float,
+        native: bool = True,
+        priority: str = DownloadScheduler.INTERACTIVE
+    ):
+        """
+        Agenda download progressivo no DownloadScheduler
+        
+        Se a música já está sendo baixada, só promove o job existente; quem
+        chamou espera pelo mesmo download e vira dono dele (o job não é mais
+        cancelado por quem o criou).
+        """
+        # No modo native a extensão só é conhecida quando o download começa
+        file_path = None if native else str(self.cache_dir / f"{spotify_id}.opus")
         
         # Inicializar tracking
         with self.download_lock:
-            self.progressive_downloads[spotify_id] = {
-                'file_path': file_path,
-                'progress': 0,
-                'complete': False,
-                'ready_for_playback': False,
-                'total_size': 0,
-                'downloaded_size': 0
-            }
+            state = self.progressive_downloads.get(spotify_id)
+            if state and not state['complete'] and state['error'] is None:
+                in_flight = self.scheduler.is_pending(spotify_id)
+            else:
+                in_flight = False
+            
+            if not in_flight:
+                self.progressive_downloads[spotify_id] = {
+                    'file_path': file_path,
+                    'native': native,
+                    'progress': 0,
+                    'complete': False,
+                    'ready_for_playback': False,
+                    'total_size': 0,
+                    'downloaded_size': 0,
+                    'error': None
+                }
+                self._ready_events[spotify_id] = threading.Event()
         
         # Hook de progresso do yt-dlp
         def progress_hook(d):
             if d['status'] == 'downloading':
                 downloaded = d.get('downloaded_bytes', 0)
                 total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                became_ready = False
                 
-                if total > 0:
-                    progress = (downloaded / total) * 100
+                with self.download_lock:
+                    state = self.progressive_downloads[spotify_id]
+                    if native and d.get('filename'):
+                        state['file_path'] = d['filename']
                     
-                    with self.download_lock:
-                        self.progressive_downloads[spotify_id]['progress'] = progress
-                        self.progressive_downloads[spotify_id]['downloaded_size'] = downloaded
-                        self.progressive_downloads[spotify_id]['total_size'] = total
+                    if total > 0:
+                        progress = (downloaded / total) * 100
+                        state['progress'] = progress
+                        state['downloaded_size'] = downloaded
+                        state['total_size'] = total
                         
-                        # Callback quando buffer mínimo atingido
-                        if progress >= min_buffer_percent and not self.progressive_downloads[spotify_id]['ready_for_playback']:
-                            self.progressive_downloads[spotify_id]['ready_for_playback'] = True
-                            print(f"✅ Ready for playback: {progress:.1f}% buffered")
-                            
-                            if playback_ready_callback:
-                                playback_ready_callback(file_path)
+                        if progress >= min_buffer_percent and not state['ready_for_playback']:
+                            state['ready_for_playback'] = True
+                            became_ready = True
+                    
+                    current_path = state['file_path']
+                
+                self._notify_data()
+                self._emit_progress(spotify_id, force=became_ready)
+                
+                # Callback quando buffer mínimo atingido
+                if became_ready:
+                    print(f"✅ Ready for playback: {progress:.1f}% buffered")
+                    self._signal_ready(spotify_id)
+                    
+                    if playback_ready_callback:
+                        playback_ready_callback(current_path)
             
             elif d['status'] == 'finished':
                 print(f"✅ Download complete: {spotify_id}")
                 with self.download_lock:
-                    self.progressive_downloads[spotify_id]['complete'] = True
-                    self.progressive_downloads[spotify_id]['progress'] = 100
+                    state = self.progressive_downloads[spotify_id]
+                    if native and d.get('filename'):
+                        state['file_path'] = d['filename']
+                    state['complete'] = True
+                    state['progress'] = 100
+                    became_ready = not state['ready_for_playback']
+                    state['ready_for_playback'] = True
+                    current_path = state['file_path']
+                
+                self._notify_data()
+                self._signal_ready(spotify_id)
+                self._emit_progress(spotify_id, force=True)
+                
+                if became_ready and playback_ready_callback:
+                    playback_ready_callback(current_path)
         
         output_template = str(self.cache_dir / f"{spotify_id}.%(ext)s")
+        profile = 'download_native' if native else 'download_opus'
         
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': output_template,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'opus',
-                'preferredquality': '192',
-            }],
-            'progress_hooks': [progress_hook],
-            'quiet': True,
-            'no_warnings': True,
-        }
-        
-        try:
-            # Download em thread separada
-            def download_worker():
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        def download_worker(cancel_event: threading.Event):
+            try:
+                with self.ytdl_pool.acquire(
+                    profile,
+                    outtmpl=output_template,
+                    progress_hooks=[self._cancel_hook(cancel_event), progress_hook]
+                ) as ydl:
                     info = ydl.extract_info(youtube_url, download=True)
                     
-                    # Salvar no banco após completar
-                    self.db.execute("""
-                        INSERT OR REPLACE INTO cache (spotify_id, youtube_url, file_path, file_size, duration_ms, download_complete)
-                        VALUES (?, ?, ?, ?, ?, 1)
-                    """, (
-                        spotify_id,
-                        youtube_url,
-                        file_path,
-                        os.path.getsize(file_path) if os.path.exists(file_path) else 0,
-                        info.get('duration', 0) * 1000
-                    ))
-                    self.db.commit()
+                    with self.download_lock:
+                        final_path = self.progressive_downloads[spotify_id]['file_path']
+                        if native and not final_path:
+                            # Já existia no disco (yt-dlp não chamou o hook)
+                            final_path = ydl.prepare_filename(info)
+                            self.progressive_downloads[spotify_id]['file_path'] = final_path
+                
+                # Salvar no banco após completar
+                self._save_entry(spotify_id, youtube_url, final_path, info.get('duration', 0) * 1000, True)
+                
+                if native and self.transcode_native:
+                    self._queue_transcode(spotify_id, final_path)
+                
+                return final_path
+            except Exception as e:
+                print(f"Error in progressive download worker: {e}")
+                with self.download_lock:
+                    state = self.progressive_downloads[spotify_id]
+                    state['error'] = str(e)
+                    partial_path = state['file_path'] if native and not state['complete'] else None
+                
+                # Com nopart o arquivo truncado tem o nome final: o yt-dlp
+                # o daria por baixado na próxima vez
+                self._discard_partial(spotify_id, partial_path)
+                
+                # Acorda quem está esperando (não vai ficar pronto)
+                self._notify_data()
+                self._signal_ready(spotify_id)
+                self._emit_progress(spotify_id, force=True)
+                raise
+        
+        # Mesmo spotify_id já na fila: o job é reaproveitado (e promovido se
+        # ainda não começou, passando a rodar este download_worker)
+        future = self.scheduler.submit(spotify_id, download_worker, priority, owner=self.PLAYBACK_OWNER)
+        future.add_done_callback(lambda f: self._finish_progressive(spotify_id, f))
+    
+    def _finish_progressive(self, spotify_id: str, future):
+        """
+        Fecha o tracking quando o job termina sem passar pelo hook de
+        progresso (deduplicado com um download do batch/prefetch, ou cancelado)
+        """
+        with self.download_lock:
+            state = self.progressive_downloads.get(spotify_id)
+            if not state or state['complete'] or state['error'] is not None:
+                return
+            
+            if future.cancelled():
+                state['error'] = 'cancelled'
+            elif future.exception() is not None:
+                state['error'] = str(future.exception())
+            else:
+                state['file_path'] = future.result()
+                state['complete'] = True
+                state['progress'] = 100
+                state['ready_for_playback'] = True
+        
+        self._notify_data()
+        self._signal_ready(spotify_id)
+        self._emit_progress(spotify_id, force=True)
+    
+    def _discard_partial(self, spotify_id: str, file_path: Optional[str]):
+        """
+        Apaga o arquivo truncado e o registro incompleto de um download que
+        não terminou (chamada fora do download_lock: faz I/O)
+        """
+        if file_path and os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+            except OSError as e:
+                print(f"Error removing partial file {file_path}: {e}")
+        
+        self.store.write(
+            "DELETE FROM cache WHERE spotify_id = ? AND download_complete = 0",
+            (spotify_id,)
+        )
+    
+    def _discard_stale_partial(self, spotify_id: str, file_path: str) -> bool:
+        """
+        Descarta registro incompleto se não há download da música em andamento
+        
+        Returns:
+            True se o registro foi descartado
+        """
+        with self.download_lock:
+            state = self.progressive_downloads.get(spotify_id)
+            if state and not state['complete'] and state['error'] is None:
+                return False
+            if self.scheduler.is_pending(spotify_id):
+                return False
+        
+        # Um download novo só escreve no arquivo depois de passar pela fila
+        # e pela extração do yt-dlp, então o I/O pode ficar fora do lock
+        self._discard_partial(spotify_id, file_path)
+        return True
+    
+    def _notify_data(self):
+        with self._data_cond:
+            self._data_cond.notify_all()
+    
+    def add_progress_listener(self, listener: Callable[[str, Dict], None]):
+        """
+        Registra função chamada com (spotify_id, estado) durante downloads progressivos
+        
+        Chamada da thread de download, no máximo a cada PROGRESS_EVENT_INTERVAL
+        por download (mudanças de prontidão, fim e erro sempre são enviadas).
+        """
+        self._progress_listeners.append(listener)
+    
+    def _emit_progress(self, spotify_id: str, force: bool = False):
+        if not self._progress_listeners:
+            return
+        
+        now = time.time()
+        with self.download_lock:
+            last = self._last_progress_event.get(spotify_id, 0)
+            if not force and now - last < self.PROGRESS_EVENT_INTERVAL:
+                return
             
-            # Iniciar download em background
-            thread = threading.Thread(target=download_worker, daemon=True)
-            thread.start()
+            state = self.progressive_downloads.get(spotify_id)
+            if state is None:
+                return
             
-            # Esperar buffer mínimo
-            timeout = 30  # 30 segundos timeout
-            start_time = time.time()
+            self._last_progress_event[spotify_id] = now
+            snapshot = {
+                'progress': state['progress'],
+                'complete': state['complete'],
+                'ready_for_playback': state['ready_for_playback'],
+                'downloaded_size': state['downloaded_size'],
+                'total_size': state['total_size'],
+                'error': state['error']
+            }
             
-            while time.time() - start_time < timeout:
-                with self.download_lock:
-                    if self.progressive_downloads[spotify_id]['ready_for_playback']:
-                        break
-                time.sleep(0.1)
+            if state['complete'] or state['error'] is not None:
+                self._last_progress_event.pop(spotify_id, None)
+        
+        for listener in self._progress_listeners:
+            try:
+                listener(spotify_id, snapshot)
+            except Exception as e:
+                print(f"Progress listener error: {e}")
+    
+    def _is_download_finished(self, spotify_id: str) -> bool:
+        """
+        True se o download terminou, falhou ou não está sendo acompanhado
+        """
+        with self.download_lock:
+            state = self.progressive_downloads.get(spotify_id)
+            return state is None or state['complete'] or state['error'] is not None
+    
+    def open_partial_stream(self, spotify_id: str) -> Optional[PartialFileSource]:
+        """
+        Cria leitor para tocar um download progressivo ainda em andamento
+        
+        Returns:
+            PartialFileSource, ou None se não há download em andamento
+            (nesse caso basta tocar o arquivo direto)
+        """
+        with self.download_lock:
+            state = self.progressive_downloads.get(spotify_id)
+            if not state or state['complete'] or not state['file_path']:
+                return None
+            file_path = state['file_path']
+        
+        def wait_for_data(timeout: float):
+            with self._data_cond:
+                self._data_cond.wait(timeout)
+        
+        def get_total_size() -> int:
+            with self.download_lock:
+                state = self.progressive_downloads.get(spotify_id)
+                return state['total_size'] if state else 0
+        
+        return PartialFileSource(
+            file_path,
+            is_complete=lambda: self._is_download_finished(spotify_id),
+            wait_for_data=wait_for_data,
+            get_total_size=get_total_size
+        )
+    
+    def _queue_transcode(self, spotify_id: str, source_path: str):
+        """
+        Agenda conversão para Opus em background
+        """
+        self._transcode_queue.put((spotify_id, source_path))
+        
+        if not self._transcode_thread or not self._transcode_thread.is_alive():
+            self._transcode_thread = threading.Thread(target=self._transcode_worker, daemon=True)
+            self._transcode_thread.start()
+    
+    def _transcode_worker(self):
+        """
+        Converte downloads nativos para Opus 192kbps, um por vez
+        """
+        while True:
+            try:
+                spotify_id, source_path = self._transcode_queue.get(timeout=60)
+            except queue.Empty:
+                return
             
-            # Registrar no banco (mesmo que incompleto)
-            if os.path.exists(file_path):
-                self.db.execute("""
-                    INSERT OR REPLACE INTO cache (spotify_id, youtube_url, file_path, file_size, duration_ms, download_complete)
-                    VALUES (?, ?, ?, ?, ?, 0)
-                """, (
-                    spotify_id,
-                    youtube_url,
-                    file_path,
-                    os.path.getsize(file_path),
-                    0  # Duration desconhecido ainda
-                ))
-                self.db.commit()
+            target_path = str(self.cache_dir / f"{spotify_id}.opus")
+            if source_path == target_path:
+                continue
             
-            return file_path
+            try:
+                subprocess.run(
+                    ['ffmpeg', '-y', '-loglevel', 'error', '-i', source_path,
+                     '-vn', '-c:a', 'libopus', '-b:a', '192k', target_path],
+                    check=True
+                )
+                
+                self.store.write(
+                    "UPDATE cache SET file_path = ?, file_size = ? WHERE spotify_id = ?",
+                    (target_path, os.path.getsize(target_path), spotify_id),
+                    wait=True
+                )
+                
+                with self.download_lock:
+                    state = self.progressive_downloads.get(spotify_id)
+                    if state:
+                        state['file_path'] = target_path
+                
+                os.remove(source_path)
+                print(f"🎚️ Transcoded {spotify_id} to Opus")
+            except Exception as e:
+                print(f"Error transcoding {source_path}: {e}")
+    
+    def _signal_ready(self, spotify_id: str):
+        """
+        Acorda threads e coroutines esperando por este download
+        """
+        # event.set() antes de soltar o lock: wait_until_ready_async checa o
+        # evento e se registra sob o mesmo lock, então não fica esperando um
+        # sinal que já passou
+        with self.download_lock:
+            event = self._ready_events.get(spotify_id)
+            if event:
+                event.set()
+            waiters = self._async_waiters.pop(spotify_id, [])
         
-        except Exception as e:
-            print(f"Error in progressive download: {e}")
-            raise
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(
+                lambda f=future: f.done() or f.set_result(True)
+            )
+    
+    def wait_until_ready(self, spotify_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Bloqueia até o download atingir o buffer mínimo (sem polling)
+        
+        Returns:
+            True se pronto para playback
+        """
+        with self.download_lock:
+            event = self._ready_events.get(spotify_id)
+        
+        if event is None:
+            return self.is_playback_ready(spotify_id)
+        
+        event.wait(timeout)
+        return self.is_playback_ready(spotify_id)
+    
+    async def wait_until_ready_async(self, spotify_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Versão awaitable de wait_until_ready
+        
+        Returns:
+            True se pronto para playback
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        with self.download_lock:
+            event = self._ready_events.get(spotify_id)
+            if event is not None and not event.is_set():
+                self._async_waiters.setdefault(spotify_id, []).append((loop, future))
+            else:
+                future.set_result(True)
+        
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self.download_lock:
+                waiters = self._async_waiters.get(spotify_id, [])
+                if (loop, future) in waiters:
+                    waiters.remove((loop, future))
+        
+        return self.is_playback_ready(spotify_id)
     
     def is_playback_ready(self, spotify_id: str) -> bool:
         """
@@ -261,10 +817,11 @@ class AudioCache:
             True se pode começar a tocar
         """
         with self.download_lock:
-            if spotify_id in self.progressive_downloads:
-                return self.progressive_downloads[spotify_id]['ready_for_playback']
+            state = self.progressive_downloads.get(spotify_id)
+            if state is not None and state['error'] is None:
+                return state['ready_for_playback']
         
-        # Se não está em download progressivo, verificar se existe completo
+        # Se não está em download progressivo (ou ele falhou), verificar se existe completo
         return self.get_cached_audio(spotify_id) is not None
     
     def get_download_progress(self, spotify_id: str) -> Optional[Dict]:
@@ -280,6 +837,197 @@ class AudioCache:
         with self.download_lock:
             return self.progressive_downloads.get(spotify_id)
     
+    # ========== EVICTION ==========
+    
+    def _record_access(self, spotify_id: str):
+        """
+        Registra acesso em memória (gravado no banco pelo sweeper)
+        """
+        with self._access_lock:
+            entry = self._pending_access.get(spotify_id)
+            if entry:
+                entry[0] = time.time()
+                entry[1] += 1
+            else:
+                self._pending_access[spotify_id] = [time.time(), 1]
+    
+    def _flush_access_log(self):
+        """
+        Grava acessos pendentes (last_accessed/hit_count) em uma transação
+        """
+        with self._access_lock:
+            pending = self._pending_access
+            self._pending_access = {}
+        
+        if not pending:
+            return
+        
+        self.store.write_many("""
+            UPDATE cache
+            SET last_accessed = ?, hit_count = COALESCE(hit_count, 0) + ?
+            WHERE spotify_id = ?
+        """, [(last, hits, spotify_id) for spotify_id, (last, hits) in pending.items()], wait=True)
+    
+    def add_pin_source(self, source: Callable[[], Iterable[str]]):
+        """
+        Registra fonte de músicas que nunca devem ser removidas pelo eviction
+        
+        Args:
+            source: Função que retorna IDs do Spotify (ex: favoritos)
+        """
+        self._pin_sources.append(source)
+    
+    def pin(self, spotify_id: str, pinned: bool = True):
+        """
+        Fixa (ou libera) uma música no cache
+        """
+        self.store.write(
+            "UPDATE cache SET pinned = ? WHERE spotify_id = ?",
+            (1 if pinned else 0, spotify_id),
+            wait=True
+        )
+    
+    def _get_pinned_ids(self) -> set:
+        """
+        Raises:
+            RuntimeError: Uma fonte de pins falhou (a lista estaria incompleta)
+        """
+        pinned = set()
+        
+        for source in self._pin_sources:
+            try:
+                pinned.update(source())
+            except Exception as e:
+                raise RuntimeError(f"Error reading pin source, skipping eviction: {e}") from e
+        
+        # Downloads em andamento nunca são removidos
+        with self.download_lock:
+            pinned.update(
+                spotify_id for spotify_id, d in self.progressive_downloads.items()
+                if not d['complete']
+            )
+        
+        return pinned
+    
+    def evict(self) -> Dict:
+        """
+        Aplica a política de eviction (idade máxima e orçamento de bytes)
+        
+        Deve rodar no sweeper em background, nunca no caminho de uma request.
+        
+        Returns:
+            Dict com evicted, freed_mb, total_size_mb
+        
+        Raises:
+            RuntimeError: Alguma fonte de pins falhou; nada é removido nesta rodada
+        """
+        self._flush_access_log()
+        pinned = self._get_pinned_ids()
+        
+        if self.eviction_policy == 'lfu':
+            order_by = "COALESCE(hit_count, 0) ASC, last_used ASC"
+        else:
+            order_by = "last_used ASC"
+        
+        rows = self.store.read(f"""
+            SELECT spotify_id, file_path, COALESCE(file_size, 0),
+                   COALESCE(last_accessed, CAST(strftime('%s', created_at) AS REAL)) AS last_used
+            FROM cache
+            WHERE download_complete = 1 AND COALESCE(pinned, 0) = 0
+            ORDER BY {order_by}
+        """)
+        
+        total_size = self.store.read_one(
+            "SELECT COALESCE(SUM(file_size), 0) FROM cache"
+        )[0]
+        
+        to_evict = []
+        
+        # Idade máxima
+        if self.max_age_days:
+            cutoff = time.time() - self.max_age_days * 24 * 3600
+            for row in rows:
+                if row[3] is not None and row[3] < cutoff and row[0] not in pinned:
+                    to_evict.append(row)
+        
+        # Orçamento de bytes
+        if self.max_cache_bytes:
+            remaining = total_size - sum(row[2] for row in to_evict)
+            if remaining > self.max_cache_bytes:
+                target = self.max_cache_bytes * self.eviction_low_watermark
+                selected = {row[0] for row in to_evict}
+                for row in rows:
+                    if remaining <= target:
+                        break
+                    if row[0] in pinned or row[0] in selected:
+                        continue
+                    to_evict.append(row)
+                    remaining -= row[2]
+        
+        freed = 0
+        evicted_ids = []
+        for spotify_id, file_path, file_size, _ in to_evict:
+            try:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            except Exception as e:
+                print(f"Error evicting {file_path}: {e}")
+                continue
+            freed += file_size
+            evicted_ids.append((spotify_id,))
+        
+        if evicted_ids:
+            self.store.write_many("DELETE FROM cache WHERE spotify_id = ?", evicted_ids, wait=True)
+            print(f"🧹 Cache eviction: removed {len(evicted_ids)} tracks ({freed / (1024 * 1024):.1f} MB)")
+        
+        self.last_sweep = {
+            'at': time.time(),
+            'evicted': len(evicted_ids),
+            'freed_mb': freed / (1024 * 1024),
+            'total_size_mb': (total_size - freed) / (1024 * 1024)
+        }
+        return self.last_sweep
+    
+    def start_sweeper(self):
+        """
+        Inicia thread de eviction em background
+        """
+        if self._sweeper_thread and self._sweeper_thread.is_alive():
+            return
+        
+        self._sweeper_stop.clear()
+        self._sweeper_thread = threading.Thread(target=self._sweeper_loop, daemon=True)
+        self._sweeper_thread.start()
+    
+    def stop_sweeper(self):
+        """
+        Para thread de eviction
+        """
+        self._sweeper_stop.set()
+        self._sweep_requested.set()
+        
+        if self._sweeper_thread:
+            self._sweeper_thread.join(timeout=1)
+    
+    def request_sweep(self):
+        """
+        Pede uma varredura imediata ao sweeper (não bloqueia)
+        """
+        self._sweep_requested.set()
+    
+    def _sweeper_loop(self):
+        while not self._sweeper_stop.is_set():
+            self._sweep_requested.wait(self.sweep_interval)
+            self._sweep_requested.clear()
+            
+            if self._sweeper_stop.is_set():
+                break
+            
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"Error in cache sweeper: {e}")
+    
     def get_stats(self) -> dict:
         """
         Retorna estatísticas do cache (alias para get_cache_stats)
@@ -290,14 +1038,12 @@ class AudioCache:
         """
         Retorna estatísticas do cache
         """
-        cursor = self.db.execute("""
+        count, total_size, total_duration, complete_count = self.store.read_one("""
             SELECT COUNT(*), SUM(file_size), SUM(duration_ms), 
                    COUNT(CASE WHEN download_complete = 1 THEN 1 END)
             FROM cache
         """)
         
-        count, total_size, total_duration, complete_count = cursor.fetchone()
-        
         # Downloads progressivos ativos
         active_downloads = 0
         with self.download_lock:
@@ -308,7 +1054,11 @@ class AudioCache:
             'complete_tracks': complete_count or 0,
             'total_size_mb': (total_size or 0) / (1024 * 1024),
             'total_duration_hours': (total_duration or 0) / (1000 * 60 * 60),
-            'active_downloads': active_downloads
+            'active_downloads': active_downloads,
+            'max_size_mb': (self.max_cache_bytes / (1024 * 1024)) if self.max_cache_bytes else None,
+            'max_age_days': self.max_age_days,
+            'eviction_policy': self.eviction_policy,
+            'last_sweep': self.last_sweep
         }
     
     def clear_cache(self):
@@ -316,31 +1066,33 @@ class AudioCache:
         Limpa todo o cache
         """
         # Remove arquivos
-        for file in self.cache_dir.glob("*.opus"):
-            try:
-                file.unlink()
-            except Exception as e:
-                print(f"Error deleting {file}: {e}")
+        for extension in self.AUDIO_EXTENSIONS:
+            for file in self.cache_dir.glob(f"*.{extension}"):
+                try:
+                    file.unlink()
+                except Exception as e:
+                    print(f"Error deleting {file}: {e}")
         
         # Limpa banco
-        self.db.execute("DELETE FROM cache")
-        self.db.commit()
+        self.store.write("DELETE FROM cache", wait=True)
         
         # Limpa tracking
         with self.download_lock:
             self.progressive_downloads.clear()
+            self._ready_events.clear()
+        
+        with self._access_lock:
+            self._pending_access.clear()
     
     def remove_from_cache(self, spotify_id: str):
         """
         Remove música específica do cache
         """
-        cursor = self.db.execute(
+        result = self.store.read_one(
             "SELECT file_path FROM cache WHERE spotify_id = ?",
             (spotify_id,)
         )
         
-        result = cursor.fetchone()
-        
         if result:
             file_path = result[0]
             
@@ -349,17 +1101,21 @@ class AudioCache:
                 os.remove(file_path)
             
             # Remove do banco
-            self.db.execute("DELETE FROM cache WHERE spotify_id = ?", (spotify_id,))
-            self.db.commit()
+            self.store.write("DELETE FROM cache WHERE spotify_id = ?", (spotify_id,), wait=True)
         
         # Remove tracking
         with self.download_lock:
             if spotify_id in self.progressive_downloads:
                 del self.progressive_downloads[spotify_id]
+            self._ready_events.pop(spotify_id, None)
     
     def __del__(self):
         """
         Fecha conexão com banco ao destruir objeto
         """
-        if hasattr(self, 'db'):
-            self.db.close()
\ No newline at end of file
+        if hasattr(self, '_sweeper_stop'):
+            self._sweeper_stop.set()
+            self._sweep_requested.set()
+        
+        if hasattr(self, 'store'):
+            self.store.close()
\ No newline at end of file
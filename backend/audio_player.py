@@ -1,12 +1,37 @@
 import vlc
+import ctypes
+import random
+import threading
 import time
 import os
-from typing import Optional
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pcm_tap import PCMRingBuffer, VlcPcmTap
 
 class AudioPlayer:
-    def __init__(self):
+    """
+    VLC playback engine with two media players
+    
+    While one player is audible the next queue item is preloaded
+    (opened, buffered and paused) on the other one. At the end of the
+    track the standby player is unpaused (gapless) or faded in over
+    crossfade_ms, and track-end listeners are notified, so clients don't
+    have to call /next.
+    """
+    
+    # Start preloading the next track this long before the end (ms)
+    PRELOAD_AHEAD_MS = 20000
+    
+    # Resync the PCM tap when it drifts further than this (ms)
+    TAP_MAX_DRIFT_MS = 150
+    
+    # Player slot used by the PCM tap in _stream_callbacks / _sources
+    TAP_INDEX = 2
+    
+    def __init__(self, crossfade_ms: int = 0):
         self.instance = vlc.Instance()
-        self.player = self.instance.media_player_new()
+        self.players = [self.instance.media_player_new(), self.instance.media_player_new()]
+        self._active = 0
         self.current_track = None
         self.is_playing = False
         self.queue = []
@@ -16,35 +41,376 @@ class AudioPlayer:
         self.user_data = None
         self.history = []  # Track history for previous functionality
         self.max_history = 50  # Keep last 50 tracks
+        self._stream_callbacks = [None, None, None]  # Keep ctypes callbacks alive while playing
+        self._sources = [None, None, None]  # (audio_path, stream) loaded on each player
+        
+        # Optional PCM tap (silent player mirroring the audible one)
+        self._tap: Optional[VlcPcmTap] = None
+        self._tap_source = None
+        self._tap_wanted: Callable[[], bool] = lambda: True
+        
+        # Native libvlc equalizer (None = off), applied to every player
+        self._equalizer = None
+        
+        # Queue change tracking (used by the prefetcher)
+        self.queue_version = 0
+        self._queue_listeners: List[Callable[[], None]] = []
+        self._queue_lock = threading.RLock()
+        self._shuffle_ahead: List[int] = []  # Pre-picked shuffle indices
+        
+        # Transition engine
+        self.crossfade_ms = crossfade_ms  # 0 = gapless
+        self.volume = 100
+        self.next_resolver: Optional[Callable[[str], Optional[Tuple]]] = None
+        self._preloaded: Optional[Dict] = None
+        self._play_generation = 0  # Bumped by play()/stop(); invalidates in-flight preloads
+        self._fading = False
+        self._end_reached = threading.Event()
+        self._engine_lock = threading.RLock()
+        self._track_end_listeners: List[Callable[[Optional[dict], Optional[dict]], None]] = []
         
-    def play(self, audio_path: str, track_info: dict):
-        """Play audio file"""
+        for index, media_player in enumerate(self.players):
+            media_player.event_manager().event_attach(
+                vlc.EventType.MediaPlayerEndReached,
+                lambda event, i=index: self._on_end_reached(i)
+            )
+        
+        self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor_thread.start()
+    
+    @property
+    def player(self):
+        """Currently audible VLC media player"""
+        return self.players[self._active]
+    
+    @property
+    def _standby(self) -> int:
+        return 1 - self._active
+        
+    def play(self, audio_path: str, track_info: dict, stream=None):
+        """
+        Play audio file
+        
+        If stream (PartialFileSource) is given, VLC reads through it so
+        playback can start while the file is still being downloaded.
+        """
         if not os.path.exists(audio_path):
             raise FileNotFoundError(f"Audio file not found: {audio_path}")
         
-        # Add current track to history before playing new one
+        with self._engine_lock:
+            # Manual play cancels any preloaded/fading transition
+            self._play_generation += 1
+            self._drop_preload()
+            self._fading = False
+            self.players[self._standby].stop()
+            
+            # Add current track to history before playing new one
+            self._push_history()
+            
+            media = self._create_media(self._active, audio_path, stream)
+            self.player.set_media(media)
+            self.player.audio_set_volume(self.volume)
+            self.player.play()
+            
+            self.current_track = track_info
+            self.is_playing = True
+            self._end_reached.clear()
+        
+        self._log_play(track_info)
+    
+    def _push_history(self):
         if self.current_track:
             self.history.append(self.current_track.copy())
             # Limit history size
             if len(self.history) > self.max_history:
                 self.history.pop(0)
+    
+    def _log_play(self, track_info: dict):
+        """Log to user data"""
+        if self.user_data:
+            self.user_data.add_to_history(track_info)
+    
+    def _create_media(self, index: int, audio_path: str, stream=None):
+        self._sources[index] = (audio_path, stream)
+        if stream:
+            return self._media_from_stream(index, stream)
+        self._stream_callbacks[index] = None
+        return self.instance.media_new(audio_path)
+    
+    def _media_from_stream(self, index: int, stream):
+        """Create VLC media that pulls bytes from a PartialFileSource"""
         
-        media = self.instance.media_new(audio_path)
-        self.player.set_media(media)
-        self.player.play()
+        @vlc.CallbackDecorators.MediaOpenCb
+        def open_cb(opaque, datap, sizep):
+            try:
+                stream.open()
+            except Exception as e:
+                print(f"Error opening stream: {e}")
+                return -1
+            # UINT64_MAX = unknown size
+            sizep[0] = stream.size() or 0xFFFFFFFFFFFFFFFF
+            return 0
         
-        self.current_track = track_info
-        self.is_playing = True
+        @vlc.CallbackDecorators.MediaReadCb
+        def read_cb(opaque, buf, length):
+            try:
+                data = stream.read(length)
+            except Exception as e:
+                print(f"Error reading stream: {e}")
+                return -1
+            ctypes.memmove(buf, data, len(data))
+            return len(data)
         
-        # Log to user data
-        if self.user_data:
-            self.user_data.add_to_history(
-                track_info['id'],
-                track_info['name'],
-                track_info['artist'],
-                track_info.get('album', ''),
-                track_info.get('duration', 0)
-            )
+        @vlc.CallbackDecorators.MediaSeekCb
+        def seek_cb(opaque, offset):
+            try:
+                stream.seek(offset)
+                return 0
+            except Exception:
+                return -1
+        
+        @vlc.CallbackDecorators.MediaCloseCb
+        def close_cb(opaque):
+            stream.close()
+        
+        self._stream_callbacks[index] = (open_cb, read_cb, seek_cb, close_cb)
+        return self.instance.media_new_callbacks(open_cb, read_cb, seek_cb, close_cb, None)
+    
+    # ========== PCM TAP ==========
+    
+    def enable_pcm_tap(
+        self,
+        ring: PCMRingBuffer,
+        rate: int = 44100,
+        channels: int = 2,
+        wanted: Optional[Callable[[], bool]] = None
+    ):
+        """
+        Feed decoded PCM of whatever is playing into ring (e.g. the visualizer's)
+        
+        libvlc audio callbacks replace the audio output, so the tap runs on
+        a third, silent player that the monitor thread keeps on the same
+        media and position as the audible one. wanted() (e.g. "the visualizer
+        has subscribers") gates it: while it returns False the tap player is
+        paused, so nothing is decoded twice without a consumer.
+        """
+        self._tap = VlcPcmTap(self.instance.media_player_new(), ring, rate, channels)
+        if wanted is not None:
+            self._tap_wanted = wanted
+        self._tap.player.set_equalizer(self._equalizer)
+    
+    def _sync_tap(self):
+        tap_player = self._tap.player
+        source = self._sources[self._active] if self.current_track else None
+        
+        if not self.is_playing or source is None or not self._tap_wanted():
+            if tap_player.is_playing():
+                tap_player.set_pause(1)
+            if source is None and self._tap_source is not None:
+                tap_player.stop()
+                self._tap_source = None
+            return
+        
+        position = self.player.get_time()
+        
+        if source is not self._tap_source:
+            audio_path, stream = source
+            media = self._create_media(self.TAP_INDEX, audio_path, stream.clone() if stream else None)
+            tap_player.set_media(media)
+            tap_player.play()
+            tap_player.set_time(max(0, position))
+            self._tap_source = source
+            return
+        
+        if not tap_player.is_playing():
+            tap_player.set_pause(0)
+        
+        if position >= 0 and abs(tap_player.get_time() - position) > self.TAP_MAX_DRIFT_MS:
+            tap_player.set_time(position)
+    
+    # ========== TRANSITION ENGINE ==========
+    
+    def set_crossfade(self, crossfade_ms: int):
+        """Set crossfade duration (0 = gapless)"""
+        self.crossfade_ms = max(0, min(12000, crossfade_ms))
+    
+    def add_track_end_listener(self, callback: Callable[[Optional[dict], Optional[dict]], None]):
+        """
+        Register callback(ended_track, next_track) fired when a track ends
+        
+        next_track is None when nothing was preloaded (e.g. next track not
+        cached yet or end of queue); the listener can then resolve it.
+        """
+        self._track_end_listeners.append(callback)
+    
+    def _fire_track_end(self, ended: Optional[dict], started: Optional[dict]):
+        for callback in self._track_end_listeners:
+            try:
+                callback(ended, started)
+            except Exception as e:
+                print(f"Track end listener error: {e}")
+    
+    def _on_end_reached(self, index: int):
+        # Runs on a VLC thread: libvlc must not be called from here
+        if index == self._active:
+            self._end_reached.set()
+    
+    def _drop_preload(self):
+        if self._preloaded:
+            self.players[self._preloaded['index']].stop()
+            self._preloaded = None
+    
+    def _preload_next(self):
+        """Open, buffer and pause the next queue item on the standby player"""
+        upcoming = self.peek_upcoming(1)
+        if not upcoming or not self.next_resolver:
+            return
+        
+        track_id = upcoming[0]
+        with self._engine_lock:
+            version = self.queue_version
+            generation = self._play_generation
+        
+        # May block (cache lookup); runs on the monitor thread
+        resolved = self.next_resolver(track_id)
+        if not resolved:
+            return
+        
+        audio_path, track_info, stream = resolved
+        
+        with self._engine_lock:
+            if version != self.queue_version or generation != self._play_generation or not self.current_track:
+                return
+            
+            index = self._standby
+            standby = self.players[index]
+            standby.set_media(self._create_media(index, audio_path, stream))
+            
+            # Preroll muted until demux/decoder are up, then pause at 0
+            standby.audio_set_volume(0)
+            standby.play()
+        
+        deadline = time.time() + 3
+        while time.time() < deadline and standby.get_state() not in (vlc.State.Playing, vlc.State.Error):
+            time.sleep(0.02)
+        
+        with self._engine_lock:
+            # play()/stop() during the preroll already stopped (or reused) this player
+            if generation != self._play_generation:
+                return
+            
+            if version != self.queue_version or standby.get_state() == vlc.State.Error:
+                standby.stop()
+                return
+            
+            standby.set_pause(1)
+            standby.set_time(0)
+            standby.audio_set_volume(self.volume)
+            
+            self._preloaded = {
+                'track_id': track_id,
+                'track_info': track_info,
+                'index': index,
+                'version': version
+            }
+    
+    def _start_transition(self, fade: bool):
+        """Switch to the preloaded player (gapless or crossfade)"""
+        with self._engine_lock:
+            preloaded = self._preloaded
+            self._preloaded = None
+            
+            if not preloaded or preloaded['version'] != self.queue_version:
+                if preloaded:
+                    self.players[preloaded['index']].stop()
+                return False
+            
+            # Advance queue state to the preloaded track
+            next_id = self.play_next_in_queue()
+            if next_id != preloaded['track_id']:
+                self.players[preloaded['index']].stop()
+                return False
+            
+            old_index = self._active
+            old_player = self.players[old_index]
+            new_player = self.players[preloaded['index']]
+            ended = self.current_track
+            
+            if fade:
+                new_player.audio_set_volume(0)
+            new_player.set_pause(0)
+            
+            self._push_history()
+            self._active = preloaded['index']
+            self.current_track = preloaded['track_info']
+            self.is_playing = True
+            self._end_reached.clear()
+            self._fading = fade
+        
+        if fade:
+            self._crossfade(old_player, new_player)
+        else:
+            old_player.stop()
+        
+        self._log_play(self.current_track)
+        self._fire_track_end(ended, self.current_track)
+        return True
+    
+    def _crossfade(self, old_player, new_player):
+        steps = max(1, self.crossfade_ms // 50)
+        for step in range(1, steps + 1):
+            if not self._fading:
+                break
+            level = step / steps
+            new_player.audio_set_volume(int(self.volume * level))
+            old_player.audio_set_volume(int(self.volume * (1 - level)))
+            time.sleep(self.crossfade_ms / 1000 / steps)
+        
+        old_player.stop()
+        old_player.audio_set_volume(self.volume)
+        new_player.audio_set_volume(self.volume)
+        self._fading = False
+    
+    def _monitor_loop(self):
+        """Watch the active player: preload near the end, then switch"""
+        while True:
+            ended = self._end_reached.wait(0.1)
+            
+            try:
+                if self._tap:
+                    self._sync_tap()
+                
+                if not self.is_playing or not self.current_track or self._fading:
+                    continue
+                
+                if ended:
+                    self._end_reached.clear()
+                    if not self._start_transition(fade=False):
+                        # Nothing ready: let listeners resolve the next track
+                        ended_track = self.current_track
+                        self.is_playing = False
+                        self._fire_track_end(ended_track, None)
+                    continue
+                
+                length = self.player.get_length()
+                position = self.player.get_time()
+                if length <= 0 or position < 0:
+                    continue
+                remaining = length - position
+                
+                preloaded = self._preloaded
+                if preloaded and preloaded['version'] != self.queue_version:
+                    with self._engine_lock:
+                        self._drop_preload()
+                    preloaded = None
+                
+                if not preloaded and remaining <= self.PRELOAD_AHEAD_MS:
+                    self._preload_next()
+                elif preloaded and self.crossfade_ms and remaining <= self.crossfade_ms:
+                    self._start_transition(fade=True)
+            
+            except Exception as e:
+                print(f"Playback monitor error: {e}")
     
     def previous(self):
         """Go to previous track"""
@@ -55,8 +421,11 @@ class AudioPlayer:
         
         # If no history but we're in a queue, go back in queue
         if self.queue and self.queue_index > 0:
-            self.queue_index -= 1
-            return {'id': self.queue[self.queue_index]}
+            with self._queue_lock:
+                self.queue_index -= 1
+                track_id = self.queue[self.queue_index]
+            self._queue_changed()
+            return {'id': track_id}
         
         # If at beginning of track (< 3 seconds), go to previous
         # Otherwise, restart current track
@@ -69,6 +438,7 @@ class AudioPlayer:
     
     def pause(self):
         """Pause playback"""
+        self._fading = False
         self.player.pause()
         self.is_playing = False
     
@@ -79,9 +449,14 @@ class AudioPlayer:
     
     def stop(self):
         """Stop playback"""
-        self.player.stop()
-        self.is_playing = False
-        self.current_track = None
+        with self._engine_lock:
+            self._fading = False
+            self._play_generation += 1
+            self._drop_preload()
+            for media_player in self.players:
+                media_player.stop()
+            self.is_playing = False
+            self.current_track = None
     
     def get_position(self) -> int:
         """Get current position in milliseconds"""
@@ -97,15 +472,33 @@ class AudioPlayer:
     
     def set_volume(self, volume: int):
         """Set volume (0-100)"""
+        self.volume = volume
         self.player.audio_set_volume(volume)
     
+    def set_equalizer(self, equalizer):
+        """
+        Apply a vlc.AudioEqualizer (None disables it) to all players
+        
+        Includes the standby player, so the EQ survives gapless and
+        crossfade transitions, and the PCM tap, so the visualizer sees
+        the equalized signal. Takes effect live.
+        """
+        self._equalizer = equalizer
+        for media_player in self.players:
+            media_player.set_equalizer(equalizer)
+        if self._tap:
+            self._tap.player.set_equalizer(equalizer)
+    
     def get_volume(self) -> int:
         """Get current volume"""
         return self.player.audio_get_volume()
     
     def add_to_queue(self, track_id: str):
         """Add track to queue"""
-        self.queue.append(track_id)
+        with self._queue_lock:
+            self.queue.append(track_id)
+            self._shuffle_ahead.clear()
+        self._queue_changed()
     
     def get_queue(self):
         """Get current queue"""
@@ -113,38 +506,91 @@ class AudioPlayer:
     
     def clear_queue(self):
         """Clear queue"""
-        self.queue.clear()
-        self.queue_index = -1
+        with self._queue_lock:
+            self.queue.clear()
+            self.queue_index = -1
+            self._shuffle_ahead.clear()
+        self._queue_changed()
+    
+    def add_queue_listener(self, callback: Callable[[], None]):
+        """Register callback fired when queue, position or play modes change"""
+        self._queue_listeners.append(callback)
+    
+    def _queue_changed(self):
+        self.queue_version += 1
+        for callback in self._queue_listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Queue listener error: {e}")
+    
+    def peek_upcoming(self, count: int = 1) -> List[str]:
+        """
+        Get the next track IDs that play_next_in_queue would return,
+        without advancing the queue
+        """
+        with self._queue_lock:
+            if not self.queue:
+                return []
+            
+            if self.repeat == "one":
+                return [self.queue[self.queue_index]] if self.queue_index >= 0 else []
+            
+            if self.shuffle:
+                # Pick shuffle order ahead of time so prefetch and playback agree
+                while len(self._shuffle_ahead) < count:
+                    self._shuffle_ahead.append(random.randint(0, len(self.queue) - 1))
+                return [self.queue[i] for i in self._shuffle_ahead[:count]]
+            
+            upcoming = []
+            index = self.queue_index
+            for _ in range(count):
+                index += 1
+                if index >= len(self.queue):
+                    if self.repeat != "all":
+                        break
+                    index = 0
+                upcoming.append(self.queue[index])
+            return upcoming
     
     def play_next_in_queue(self):
         """Get next track from queue based on shuffle/repeat"""
-        if not self.queue:
-            return None
-        
-        # Handle repeat one
-        if self.repeat == "one":
-            return self.queue[self.queue_index] if self.queue_index >= 0 else None
-        
-        # Get next track
-        if self.shuffle:
-            import random
-            next_index = random.randint(0, len(self.queue) - 1)
-        else:
-            next_index = self.queue_index + 1
-        
-        # Handle end of queue
-        if next_index >= len(self.queue):
-            if self.repeat == "all":
-                next_index = 0
-            else:
+        with self._queue_lock:
+            if not self.queue:
                 return None
+            
+            # Handle repeat one
+            if self.repeat == "one":
+                return self.queue[self.queue_index] if self.queue_index >= 0 else None
+            
+            # Get next track
+            if self.shuffle:
+                if self._shuffle_ahead:
+                    next_index = self._shuffle_ahead.pop(0)
+                else:
+                    next_index = random.randint(0, len(self.queue) - 1)
+            else:
+                next_index = self.queue_index + 1
+            
+            # Handle end of queue
+            if next_index >= len(self.queue):
+                if self.repeat == "all":
+                    next_index = 0
+                else:
+                    return None
+            
+            self.queue_index = next_index
+            track_id = self.queue[next_index]
         
-        self.queue_index = next_index
-        return self.queue[next_index]
+        self._queue_changed()
+        return track_id
     
     def toggle_shuffle(self):
         """Toggle shuffle mode"""
-        self.shuffle = not self.shuffle
+        with self._queue_lock:
+            self.shuffle = not self.shuffle
+            self._shuffle_ahead.clear()
+        self._queue_changed()
         return self.shuffle
     
     def cycle_repeat(self):
@@ -153,18 +599,30 @@ class AudioPlayer:
         current_index = modes.index(self.repeat)
         next_index = (current_index + 1) % len(modes)
         self.repeat = modes[next_index]
+        self._queue_changed()
         return self.repeat
     
-    def get_status(self):
-        """Get player status"""
-        return {
+    def get_status(self, include_position: bool = True):
+        """
+        Get player status
+        
+        With include_position=False no VLC call is made (volume is the
+        tracked value), which is what the push channel samples for diffs.
+        """
+        status = {
             "is_playing": self.is_playing,
             "current_track": self.current_track,
-            "position": self.get_position(),
-            "duration": self.get_duration(),
-            "volume": self.get_volume(),
+            "volume": self.get_volume() if include_position else self.volume,
             "shuffle": self.shuffle,
             "repeat": self.repeat,
             "queue_length": len(self.queue),
-            "has_previous": len(self.history) > 0 or self.queue_index > 0
+            "has_previous": len(self.history) > 0 or self.queue_index > 0,
+            "crossfade_ms": self.crossfade_ms,
+            "next_preloaded": self._preloaded['track_id'] if self._preloaded else None
         }
+        
+        if include_position:
+            status["position"] = self.get_position()
+            status["duration"] = self.get_duration()
+        
+        return status
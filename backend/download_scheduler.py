@@ -0,0 +1,383 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+class DownloadCancelled(Exception):
+    """
+    Download interrompido pelo cancel_event do job (lançada pelo hook de progresso)
+    """
+
+class _DownloadJob:
+    """
+    Download agendado (um por spotify_id enquanto estiver na fila ou rodando)
+    """
+
+    def __init__(
+        self,
+        spotify_id: str,
+        fn: Callable[[threading.Event], Any],
+        priority: str,
+        not_before: float = 0
+    ):
+        self.spotify_id = spotify_id
+        self.fn = fn
+        self.priority = priority
+        # Não começa antes deste timestamp (retry com backoff)
+        self.not_before = not_before
+        self.future: Future = Future()
+        self.running = False
+
+        # Quem pediu o download (ex: playlists); cancela só quando todos desistem
+        self.owners: Set[str] = set()
+        # Setado para interromper o download em andamento (cooperativo)
+        self.cancel_event = threading.Event()
+
+class DownloadScheduler:
+    """
+    Fila única de downloads com classes de prioridade
+
+    - interactive (play do usuário) > prefetch (próximas da fila) > batch (playlists)
+    - Capacidade reservada: prefetch/batch nunca ocupam os últimos
+      reserved_interactive workers, então um play não espera um batch inteiro
+    - Limite de concorrência por classe, ajustável em runtime (set_limits)
+    - Deduplicação: o mesmo spotify_id na fila ou rodando devolve o mesmo
+      Future; pedido de prioridade maior promove o job que ainda está na fila
+    - Cancelamento: jobs na fila saem dela; jobs rodando recebem cancel_event,
+      que a fn checa (ex: no hook de progresso do yt-dlp)
+    - Agendamento no tempo: not_before por job (backoff de retry) e hold()
+      por classe (disjuntor de rate limit segura prefetch/batch)
+    """
+
+    INTERACTIVE = 'interactive'
+    PREFETCH = 'prefetch'
+    BATCH = 'batch'
+
+    # Ordem de prioridade (maior primeiro)
+    PRIORITIES = (INTERACTIVE, PREFETCH, BATCH)
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        reserved_interactive: int = 1,
+        limits: Optional[Dict[str, int]] = None
+    ):
+        """
+        Args:
+            max_workers: Downloads simultâneos no total
+            reserved_interactive: Workers que só downloads interativos usam
+            limits: Máximo simultâneo por classe (ex: {'batch': 3, 'prefetch': 1})
+        """
+        self.max_workers = max(1, max_workers)
+        self.reserved_interactive = max(0, min(reserved_interactive, self.max_workers - 1))
+        self.limits = {self.INTERACTIVE: self.max_workers, self.PREFETCH: 1, self.BATCH: self.max_workers}
+        self.limits.update(limits or {})
+
+        self._queues: Dict[str, Deque[_DownloadJob]] = {p: deque() for p in self.PRIORITIES}
+        self._jobs: Dict[str, _DownloadJob] = {}
+        self._running = {p: 0 for p in self.PRIORITIES}
+        self._hold_until = {p: 0.0 for p in self.PRIORITIES}
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+
+        # Estatísticas
+        self.completed = {p: 0 for p in self.PRIORITIES}
+        self.deduplicated = 0
+        self.promoted = 0
+
+        with self._cond:
+            self._spawn_workers()
+
+    def _spawn_workers(self):
+        while len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    # ========== SUBMISSÃO ==========
+
+    def submit(
+        self,
+        spotify_id: str,
+        fn: Callable[[threading.Event], Any],
+        priority: str = BATCH,
+        owner: Optional[str] = None,
+        not_before: float = 0
+    ) -> Future:
+        """
+        Agenda um download
+
+        Se já existe job para o spotify_id, devolve o Future dele (fn é
+        ignorada). Se o job ainda está na fila e o pedido novo tem prioridade
+        maior, o job é promovido e passa a rodar a fn do pedido novo.
+
+        Args:
+            spotify_id: ID da música (chave de deduplicação)
+            fn: Função (cancel_event) que faz o download (roda em um worker)
+                e deve desistir quando cancel_event for setado
+            priority: interactive, prefetch ou batch
+            owner: Quem pediu (ex: playlist_id), usado por cancel()
+            not_before: Timestamp (time.time) antes do qual o job não começa
+
+        Returns:
+            Future com o resultado de fn
+        """
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"Invalid download priority: {priority}")
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("DownloadScheduler is closed")
+
+            job = self._jobs.get(spotify_id)
+            # Já resolvido (worker ainda não limpou o índice): conta como novo
+            if job is not None and job.future.done():
+                job = None
+            if job is not None:
+                self.deduplicated += 1
+                if owner is not None:
+                    job.owners.add(owner)
+                if not job.running and self._rank(priority) < self._rank(job.priority):
+                    self._queues[job.priority].remove(job)
+                    job.priority = priority
+                    job.fn = fn
+                    job.not_before = not_before
+                    self._queues[priority].append(job)
+                    self.promoted += 1
+                    self._cond.notify_all()
+                return job.future
+
+            job = _DownloadJob(spotify_id, fn, priority, not_before)
+            if owner is not None:
+                job.owners.add(owner)
+            self._jobs[spotify_id] = job
+            self._queues[priority].append(job)
+            # notify_all: o worker acordado por notify() pode ser um excedente
+            # (acima de max_workers) e voltar a dormir sem pegar o job
+            self._cond.notify_all()
+            return job.future
+
+    def cancel(
+        self,
+        spotify_id: str,
+        only_priority: Optional[str] = None,
+        owner: Optional[str] = None,
+        interrupt: bool = True
+    ) -> bool:
+        """
+        Cancela um download: sai da fila se ainda não começou, ou recebe
+        cancel_event se já está rodando
+
+        Args:
+            spotify_id: ID da música
+            only_priority: Só cancela se o job estiver nessa classe (ex: o
+                prefetch desiste, mas não cancela um play que o promoveu)
+            owner: Retira só este dono; o job continua enquanto houver outros
+            interrupt: Também interrompe job em andamento
+
+        Returns:
+            True se o job foi cancelado ou interrompido
+        """
+        with self._cond:
+            job = self._jobs.get(spotify_id)
+            if job is None:
+                return False
+            if owner is not None:
+                job.owners.discard(owner)
+            if job.owners:
+                return False
+            if only_priority and job.priority != only_priority:
+                return False
+
+            if job.running:
+                if not interrupt:
+                    return False
+                # Sai do índice: um pedido novo do mesmo id cria outro job
+                job.cancel_event.set()
+                del self._jobs[spotify_id]
+                return True
+
+            self._queues[job.priority].remove(job)
+            del self._jobs[spotify_id]
+
+        job.future.cancel()
+        return True
+
+    def is_pending(self, spotify_id: str) -> bool:
+        """
+        True se há download na fila ou rodando para o spotify_id
+        """
+        with self._cond:
+            return spotify_id in self._jobs
+
+    # ========== WORKERS ==========
+
+    def _rank(self, priority: str) -> int:
+        return self.PRIORITIES.index(priority)
+
+    def _next_job(self) -> Optional[_DownloadJob]:
+        """
+        Próximo job que pode começar dentro dos limites (com o lock)
+        """
+        total = sum(self._running.values())
+        if total >= self.max_workers:
+            return None
+
+        now = time.time()
+        for priority in self.PRIORITIES:
+            queue = self._queues[priority]
+            if not queue or self._running[priority] >= self.limits[priority]:
+                continue
+            if priority != self.INTERACTIVE and total >= self.max_workers - self.reserved_interactive:
+                continue
+            if self._hold_until[priority] > now:
+                continue
+
+            # Primeiro job da classe cujo backoff já passou
+            for index, job in enumerate(queue):
+                if job.not_before <= now:
+                    del queue[index]
+                    return job
+
+        return None
+
+    def _wait_timeout(self) -> Optional[float]:
+        """
+        Tempo até o próximo job adiado ficar elegível (None = só por notify)
+        """
+        now = time.time()
+        wakeups = []
+        for priority, queue in self._queues.items():
+            if not queue:
+                continue
+            if self._hold_until[priority] > now:
+                wakeups.append(self._hold_until[priority])
+            delayed = [job.not_before for job in queue if job.not_before > now]
+            if delayed:
+                wakeups.append(min(delayed))
+
+        return max(0.01, min(wakeups) - now) if wakeups else None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+
+                    # Workers além de max_workers (reduzido em runtime) ficam parados
+                    if self._threads.index(threading.current_thread()) < self.max_workers:
+                        job = self._next_job()
+                        if job is not None:
+                            break
+                    self._cond.wait(self._wait_timeout())
+
+                job.running = True
+                priority = job.priority
+                self._running[priority] += 1
+
+            self._run(job)
+
+            with self._cond:
+                self._running[priority] -= 1
+                self.completed[priority] += 1
+                if self._jobs.get(job.spotify_id) is job:
+                    del self._jobs[job.spotify_id]
+                self._cond.notify_all()
+
+    def _run(self, job: _DownloadJob):
+        if not job.future.set_running_or_notify_cancel():
+            return
+
+        try:
+            result = job.fn(job.cancel_event)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+
+    # ========== CONFIGURAÇÃO ==========
+
+    def hold(self, until: float, priorities=(PREFETCH, BATCH)):
+        """
+        Segura classes até o timestamp until (jobs em andamento continuam)
+
+        Usado pelo disjuntor de rate limit; interactive normalmente fica de fora.
+        """
+        with self._cond:
+            for priority in priorities:
+                self._hold_until[priority] = max(self._hold_until[priority], until)
+            self._cond.notify_all()
+
+    def set_limits(
+        self,
+        max_workers: Optional[int] = None,
+        reserved_interactive: Optional[int] = None,
+        **class_limits: int
+    ) -> Dict:
+        """
+        Ajusta limites em runtime (vale para os próximos jobs)
+
+        Args:
+            max_workers: Downloads simultâneos no total
+            reserved_interactive: Workers reservados para play do usuário
+            class_limits: Máximo por classe (interactive=, prefetch=, batch=)
+
+        Returns:
+            Estado atual (get_stats)
+        """
+        for priority in class_limits:
+            if priority not in self.PRIORITIES:
+                raise ValueError(f"Invalid download priority: {priority}")
+
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, max_workers)
+                self._spawn_workers()
+            if reserved_interactive is not None:
+                self.reserved_interactive = reserved_interactive
+            self.reserved_interactive = max(0, min(self.reserved_interactive, self.max_workers - 1))
+
+            for priority, limit in class_limits.items():
+                if limit is not None:
+                    self.limits[priority] = max(0, limit)
+
+            self._cond.notify_all()
+
+        return self.get_stats()
+
+    def get_stats(self) -> Dict:
+        """
+        Retorna limites, fila e downloads em andamento por classe
+        """
+        with self._cond:
+            return {
+                'max_workers': self.max_workers,
+                'reserved_interactive': self.reserved_interactive,
+                'limits': dict(self.limits),
+                'running': dict(self._running),
+                'queued': {p: len(q) for p, q in self._queues.items()},
+                'delayed': sum(1 for q in self._queues.values() for job in q if job.not_before > time.time()),
+                'held_until': {p: t for p, t in self._hold_until.items() if t > time.time()},
+                'completed': dict(self.completed),
+                'deduplicated': self.deduplicated,
+                'promoted': self.promoted
+            }
+
+    def close(self):
+        """
+        Cancela jobs na fila e encerra os workers (downloads em andamento terminam)
+        """
+        with self._cond:
+            self._closed = True
+            pending = [job for queue in self._queues.values() for job in queue]
+            for queue in self._queues.values():
+                queue.clear()
+            for job in pending:
+                self._jobs.pop(job.spotify_id, None)
+            self._cond.notify_all()
+
+        for job in pending:
+            job.future.cancel()
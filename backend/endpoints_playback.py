@@ -1,52 +1,105 @@
 # Playback control endpoints
 # To be included in main.py
 
+import asyncio
 from fastapi import HTTPException
 
+from async_utils import run_blocking, blocking_executor
+
+# Timeouts per stage (seconds). On timeout the request fails with 504,
+# the worker thread finishes in the background.
+SPOTIFY_TIMEOUT = 10
+MATCH_TIMEOUT = 45
+DOWNLOAD_TIMEOUT = 60
+
+def _build_track_info(track_id: str, track: dict, youtube_url: str = None) -> dict:
+    """Build track info dict from a Spotify track"""
+    return {
+        'id': track_id,
+        'name': track['name'],
+        'artist': track['artists'][0]['name'],
+        'album': track['album']['name'],
+        'album_art': track['album']['images'][0]['url'] if track['album']['images'] else None,
+        'duration': track['duration_ms'],
+        'youtube_url': youtube_url
+    }
+
+async def _fetch_track(track_id: str) -> dict:
+    """Spotify track lookup (through the prefetcher's metadata cache), off the event loop"""
+    try:
+        return await run_blocking(prefetcher.get_track, track_id, timeout=SPOTIFY_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Spotify lookup timed out")
+
+async def _resolve_audio(track_id: str, track: dict, youtube_url: str = None, download: bool = True):
+    """
+    Find (or download) audio for a track without blocking the event loop
+    
+    Returns:
+        (audio_path, youtube_url, stream) - stream is a PartialFileSource
+        when the file is still downloading, else None. audio_path is None
+        if not cached and download=False.
+    """
+    cached_path = await run_blocking(cache.get_cached_audio, track_id)
+    if cached_path:
+        return cached_path, youtube_url, cache.open_partial_stream(track_id)
+    
+    if not download:
+        return None, youtube_url, None
+    
+    if not youtube_url:
+        try:
+            youtube_url = await run_blocking(
+                matcher.spotify_to_youtube,
+                track['name'],
+                track['artists'][0]['name'],
+                track['duration_ms'],
+                spotify_id=track_id,
+                timeout=MATCH_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="YouTube matching timed out")
+    
+    if not youtube_url:
+        raise HTTPException(status_code=404, detail="No YouTube match found")
+    
+    # Progressive download: returns as soon as the buffer is ready
+    audio_path = await cache.download_progressive_async(
+        youtube_url, track_id, timeout=DOWNLOAD_TIMEOUT
+    )
+    
+    progress = cache.get_download_progress(track_id)
+    if progress and progress['error']:
+        raise HTTPException(status_code=502, detail=f"Download failed: {progress['error']}")
+    
+    if not audio_path or not cache.is_playback_ready(track_id):
+        raise HTTPException(status_code=504, detail="Download timed out")
+    
+    return audio_path, youtube_url, cache.open_partial_stream(track_id)
+
 @app.post("/play/{track_id}")
 async def play_track(track_id: str, background_tasks: BackgroundTasks):
     """Play a track by Spotify ID"""
     try:
         # Get track info from Spotify
-        track = sp.track(track_id)
-        
-        # Find YouTube video
-        youtube_url = matcher.find_youtube_match(
-            track['name'],
-            track['artists'][0]['name']
-        )
-        
-        if not youtube_url:
-            raise HTTPException(status_code=404, detail="No YouTube match found")
-        
-        # Check cache
-        cached_path = cache.get_cached_audio(youtube_url)
+        track = await _fetch_track(track_id)
         
-        if cached_path:
-            audio_path = cached_path
-        else:
-            # Download in background
-            audio_path = cache.download_audio(youtube_url)
+        # Find YouTube video + cache/download
+        audio_path, youtube_url, stream = await _resolve_audio(track_id, track)
         
         # Prepare track info
-        track_info = {
-            'id': track_id,
-            'name': track['name'],
-            'artist': track['artists'][0]['name'],
-            'album': track['album']['name'],
-            'album_art': track['album']['images'][0]['url'] if track['album']['images'] else None,
-            'duration': track['duration_ms'],
-            'youtube_url': youtube_url
-        }
+        track_info = _build_track_info(track_id, track, youtube_url)
         
         # Play
-        player.play(audio_path, track_info)
+        player.play(audio_path, track_info, stream=stream)
         
         return {
             "message": "Playing track",
             "track": track_info
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -63,30 +116,20 @@ async def previous_track():
             }
         
         if result and isinstance(result, dict) and 'id' in result:
-            # Play the previous track
+            # Play the previous track (only if still cached)
             track_id = result['id']
-            track = sp.track(track_id)
+            track = await _fetch_track(track_id)
             
-            youtube_url = result.get('youtube_url') or matcher.find_youtube_match(
-                track['name'],
-                track['artists'][0]['name']
+            cached_path, youtube_url, stream = await _resolve_audio(
+                track_id, track, result.get('youtube_url'), download=False
             )
             
-            cached_path = cache.get_cached_audio(youtube_url)
             if cached_path:
-                track_info = {
-                    'id': track_id,
-                    'name': track['name'],
-                    'artist': track['artists'][0]['name'],
-                    'album': track['album']['name'],
-                    'album_art': track['album']['images'][0]['url'] if track['album']['images'] else None,
-                    'duration': track['duration_ms'],
-                    'youtube_url': youtube_url
-                }
+                track_info = _build_track_info(track_id, track, youtube_url)
                 
                 # Don't add to history when going back
                 temp_history = player.history.copy()
-                player.play(cached_path, track_info)
+                player.play(cached_path, track_info, stream=stream)
                 player.history = temp_history  # Restore history
                 
                 return {
@@ -99,6 +142,8 @@ async def previous_track():
             "action": "none"
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -112,32 +157,20 @@ async def next_track():
             return {"message": "No more tracks in queue"}
         
         # Play the next track
-        track = sp.track(next_id)
-        youtube_url = matcher.find_youtube_match(
-            track['name'],
-            track['artists'][0]['name']
-        )
+        track = await _fetch_track(next_id)
+        audio_path, youtube_url, stream = await _resolve_audio(next_id, track)
         
-        cached_path = cache.get_cached_audio(youtube_url)
-        if not cached_path:
-            cached_path = cache.download_audio(youtube_url)
-        
-        track_info = {
-            'id': next_id,
-            'name': track['name'],
-            'artist': track['artists'][0]['name'],
-            'album': track['album']['name'],
-            'album_art': track['album']['images'][0]['url'] if track['album']['images'] else None,
-            'duration': track['duration_ms']
-        }
+        track_info = _build_track_info(next_id, track, youtube_url)
         
-        player.play(cached_path, track_info)
+        player.play(audio_path, track_info, stream=stream)
         
         return {
             "message": "Playing next track",
             "track": track_info
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -185,3 +218,64 @@ async def set_volume(level: int):
         raise HTTPException(status_code=400, detail="Volume must be 0-100")
     player.set_volume(level)
     return {"volume": level}
+
+@app.post("/crossfade/{crossfade_ms}")
+async def set_crossfade(crossfade_ms: int):
+    """Set crossfade between tracks in ms (0 = gapless)"""
+    if crossfade_ms < 0 or crossfade_ms > 12000:
+        raise HTTPException(status_code=400, detail="Crossfade must be 0-12000 ms")
+    player.set_crossfade(crossfade_ms)
+    return {"crossfade_ms": player.crossfade_ms}
+
+# ========== AUTO-ADVANCE ==========
+
+def _resolve_cached_track(track_id: str):
+    """Preload resolver: (path, info, stream) only if the audio is already cached"""
+    audio_path = cache.get_cached_audio(track_id)
+    if not audio_path:
+        return None
+    track = prefetcher.get_track(track_id)
+    return audio_path, _build_track_info(track_id, track), cache.open_partial_stream(track_id)
+
+def _play_next_blocking():
+    """Resolve, download if needed and play the next queue item (worker thread)"""
+    try:
+        next_id = player.play_next_in_queue()
+        if not next_id:
+            return
+        
+        track = prefetcher.get_track(next_id)
+        youtube_url = None
+        audio_path = cache.get_cached_audio(next_id)
+        
+        if not audio_path:
+            youtube_url = matcher.spotify_to_youtube(
+                track['name'],
+                track['artists'][0]['name'],
+                track['duration_ms'],
+                spotify_id=next_id
+            )
+            if not youtube_url:
+                print(f"Auto-advance: no YouTube match for {track['name']}")
+                return
+            audio_path = cache.download_progressive(youtube_url, next_id, timeout=DOWNLOAD_TIMEOUT)
+        
+        if not audio_path or not cache.is_playback_ready(next_id):
+            print(f"Auto-advance: {track['name']} not ready")
+            return
+        
+        player.play(
+            audio_path,
+            _build_track_info(next_id, track, youtube_url),
+            stream=cache.open_partial_stream(next_id)
+        )
+    except Exception as e:
+        print(f"Auto-advance error: {e}")
+
+def _on_track_end(ended_track, next_track):
+    # Gapless/crossfade transitions already started the next track
+    if next_track is None:
+        blocking_executor.submit(_play_next_blocking)
+
+player.next_resolver = _resolve_cached_track
+player.add_track_end_listener(_on_track_end)
@@ -1,16 +1,38 @@
-import json
-import os
-from typing import Dict, Optional
+import math
+from typing import Dict, List, Optional, Sequence
 import logging
 
+import numpy as np
+import vlc
+
+from settings_store import SettingsStore
+
+try:
+    from scipy.signal import sosfilt
+except ImportError:
+    sosfilt = None
+
 logger = logging.getLogger(__name__)
 
 class Equalizer:
     """
-    3-band equalizer with bass, mid, treble controls
+    Equalizador de 10 bandas aplicado nativamente pela libvlc (vlc.AudioEqualizer)
+    
+    Bandas nas frequências padrão do VLC, mais preamp. Os controles
+    bass/mid/treble continuam funcionando e movem grupos de bandas.
     Valores em dB (-12 a +12)
     """
     
+    # Frequências centrais das 10 bandas do equalizador do VLC (Hz)
+    BAND_FREQUENCIES = [60, 170, 310, 600, 1000, 3000, 6000, 12000, 14000, 16000]
+    
+    # Bandas controladas por bass/mid/treble
+    BAND_GROUPS = {
+        'bass': range(0, 3),
+        'mid': range(3, 7),
+        'treble': range(7, 10)
+    }
+    
     PRESETS = {
         'flat': {'bass': 0, 'mid': 0, 'treble': 0},
         'bass_boost': {'bass': 8, 'mid': 0, 'treble': -2},
@@ -23,13 +45,35 @@ class Equalizer:
         'electronic': {'bass': 10, 'mid': 0, 'treble': 6}
     }
     
-    def __init__(self, settings_file: str = 'equalizer_settings.json'):
+    def __init__(
+        self,
+        settings_file: str = 'equalizer_settings.json',
+        profile: str = 'default',
+        store: Optional[SettingsStore] = None
+    ):
+        """
+        Args:
+            settings_file: Arquivo JSON de configurações (todos os perfis)
+            profile: Perfil ativo (ex: usuário ou dispositivo)
+            store: SettingsStore compartilhado (cria um para settings_file se None)
+        """
         self.settings_file = settings_file
+        self.store = store or SettingsStore(settings_file)
+        self.profile = profile
         self.bass = 0
         self.mid = 0
         self.treble = 0
+        self.bands = [0.0] * len(self.BAND_FREQUENCIES)
+        self.preamp = 0.0
         self.enabled = False
         
+        # AudioPlayer que recebe o equalizador (ver attach)
+        self.player = None
+        
+        # Incrementado a cada mudança (invalida coeficientes em cache)
+        self.version = 0
+        self._filter_banks: Dict[tuple, "BiquadFilterBank"] = {}
+        
         # Load saved settings
         self.load_settings()
         
@@ -49,18 +93,16 @@ class Equalizer:
         # Clamp value
         value = max(-12, min(12, value))
         
-        if band == 'bass':
-            self.bass = value
-        elif band == 'mid':
-            self.mid = value
-        elif band == 'treble':
-            self.treble = value
-        else:
+        if band not in self.BAND_GROUPS:
             logger.error(f"Invalid band: {band}")
             return False
         
+        setattr(self, band, value)
+        for index in self.BAND_GROUPS[band]:
+            self.bands[index] = value
+        
         logger.info(f"EQ {band} set to {value}dB")
-        self.save_settings()
+        self._changed()
         return True
     
     def set_all_bands(self, bass: float, mid: float, treble: float):
@@ -71,9 +113,89 @@ class Equalizer:
         self.mid = max(-12, min(12, mid))
         self.treble = max(-12, min(12, treble))
         
+        for group, indexes in self.BAND_GROUPS.items():
+            for index in indexes:
+                self.bands[index] = getattr(self, group)
+        
         logger.info(f"EQ set to bass={self.bass}, mid={self.mid}, treble={self.treble}")
+        self._changed()
+    
+    def set_bands(self, bands: Sequence[float], preamp: Optional[float] = None) -> bool:
+        """
+        Define as 10 bandas (e opcionalmente o preamp) de uma vez
+        
+        Args:
+            bands: Lista com um valor em dB por banda (BAND_FREQUENCIES)
+            preamp: Preamp em dB (None = mantém)
+        
+        Returns:
+            True se sucesso
+        """
+        if len(bands) != len(self.BAND_FREQUENCIES):
+            logger.error(f"Expected {len(self.BAND_FREQUENCIES)} bands, got {len(bands)}")
+            return False
+        
+        self.bands = [max(-12, min(12, float(b))) for b in bands]
+        if preamp is not None:
+            self.preamp = max(-12, min(12, float(preamp)))
+        
+        # bass/mid/treble passam a ser a média de cada grupo
+        for group, indexes in self.BAND_GROUPS.items():
+            setattr(self, group, round(sum(self.bands[i] for i in indexes) / len(indexes), 1))
+        
+        logger.info(f"EQ bands set to {self.bands} (preamp {self.preamp}dB)")
+        self._changed()
+        return True
+    
+    def set_preamp(self, value: float):
+        """
+        Define preamp (-12 a +12 dB)
+        """
+        self.preamp = max(-12, min(12, value))
+        logger.info(f"EQ preamp set to {self.preamp}dB")
+        self._changed()
+    
+    def _changed(self):
+        """
+        Aplica e salva depois de qualquer mudança
+        """
+        self.version += 1
+        self.apply()
         self.save_settings()
     
+    # ========== APLICAÇÃO NO VLC ==========
+    
+    def attach(self, player):
+        """
+        Conecta ao AudioPlayer e aplica as configurações atuais
+        """
+        self.player = player
+        self.apply()
+    
+    def build_vlc_equalizer(self) -> "vlc.AudioEqualizer":
+        """
+        Cria vlc.AudioEqualizer com preamp e as 10 bandas atuais
+        """
+        eq = vlc.AudioEqualizer()
+        eq.set_preamp(self.preamp)
+        for index, value in enumerate(self.bands):
+            eq.set_amp_at_index(value, index)
+        return eq
+    
+    def apply(self):
+        """
+        Aplica (ou remove, se desligado) o equalizador nos players do VLC
+        
+        libvlc copia os valores na hora, então é reaplicado a cada mudança.
+        """
+        if not self.player:
+            return
+        
+        try:
+            self.player.set_equalizer(self.build_vlc_equalizer() if self.enabled else None)
+        except Exception as e:
+            logger.error(f"Error applying EQ: {e}")
+    
     def load_preset(self, preset_name: str) -> bool:
         """
         Carrega um preset pré-definido
@@ -99,9 +221,13 @@ class Equalizer:
         Retorna configurações atuais
         """
         return {
+            'profile': self.profile,
             'bass': self.bass,
             'mid': self.mid,
             'treble': self.treble,
+            'bands': list(self.bands),
+            'frequencies': self.BAND_FREQUENCIES,
+            'preamp': self.preamp,
             'enabled': self.enabled
         }
     
@@ -114,7 +240,7 @@ class Equalizer:
         """
         self.enabled = not self.enabled
         logger.info(f"Equalizer {'enabled' if self.enabled else 'disabled'}")
-        self.save_settings()
+        self._changed()
         return self.enabled
     
     def set_enabled(self, enabled: bool):
@@ -123,14 +249,14 @@ class Equalizer:
         """
         self.enabled = enabled
         logger.info(f"Equalizer {'enabled' if enabled else 'disabled'}")
-        self.save_settings()
+        self._changed()
     
     def get_vlc_equalizer_string(self) -> str:
         """
         Gera string de configuração para VLC
         
         VLC usa formato: "preamp=XX:bands=XX XX XX XX XX XX XX XX XX XX"
-        Vamos simplificar para 3 bandas principais
+        (opções --equalizer-preamp/--equalizer-bands; o player usa apply())
         
         Returns:
             String de configuração VLC
@@ -138,59 +264,115 @@ class Equalizer:
         if not self.enabled:
             return "preamp=0:bands=0 0 0 0 0 0 0 0 0 0"
         
-        # Map our 3 bands to VLC's 10 bands
-        # Bass: bands 0-2 (60Hz, 170Hz, 310Hz)
-        # Mid: bands 3-6 (600Hz, 1kHz, 3kHz, 6kHz)
-        # Treble: bands 7-9 (12kHz, 14kHz, 16kHz)
+        bands_str = ' '.join([f"{b:g}" for b in self.bands])
+        return f"preamp={self.preamp:g}:bands={bands_str}"
+    
+    # ========== FILTROS EM NUMPY ==========
+    
+    def get_filter_bank(self, sample_rate: int = 44100, num_bands: Optional[int] = None) -> "BiquadFilterBank":
+        """
+        Banco de biquads equivalente às configurações atuais, para áudio
+        processado em Python (offline/streaming)
+        
+        O banco é reaproveitado entre chamadas; coeficientes só são
+        recalculados quando as configurações mudam.
         
-        bands = [
-            self.bass, self.bass, self.bass,  # Low
-            self.mid, self.mid, self.mid, self.mid,  # Mid
-            self.treble, self.treble, self.treble  # High
-        ]
+        Args:
+            sample_rate: Taxa de amostragem do áudio
+            num_bands: Número de bandas (None = as 10 do VLC); com outro
+                valor as bandas são espaçadas em log e os ganhos interpolados
         
-        bands_str = ' '.join([str(int(b)) for b in bands])
-        return f"preamp=0:bands={bands_str}"
+        Returns:
+            BiquadFilterBank configurado
+        """
+        if num_bands is None:
+            frequencies = self.BAND_FREQUENCIES
+            gains = self.bands
+        else:
+            frequencies = np.geomspace(31.25, 16000, num_bands).tolist()
+            gains = np.interp(
+                np.log10(frequencies),
+                np.log10(self.BAND_FREQUENCIES),
+                self.bands
+            ).tolist()
+        
+        key = (sample_rate, num_bands)
+        bank = self._filter_banks.get(key)
+        if bank is None:
+            bank = BiquadFilterBank(frequencies, sample_rate)
+            self._filter_banks[key] = bank
+        
+        if self.enabled:
+            bank.set_gains(gains, self.preamp, self.version)
+        else:
+            bank.set_gains([0.0] * len(frequencies), 0.0, self.version)
+        return bank
     
     def save_settings(self):
         """
-        Salva configurações em arquivo JSON
+        Salva configurações do perfil ativo
+        
+        Não bloqueia: o SettingsStore agrupa mudanças seguidas (ex: slider
+        sendo arrastado) e grava o arquivo em background.
         """
-        try:
-            settings = {
-                'bass': self.bass,
-                'mid': self.mid,
-                'treble': self.treble,
-                'enabled': self.enabled
-            }
-            
-            with open(self.settings_file, 'w') as f:
-                json.dump(settings, f, indent=2)
-            
-            logger.debug(f"EQ settings saved to {self.settings_file}")
-        except Exception as e:
-            logger.error(f"Error saving EQ settings: {e}")
+        self.store.set({
+            'bass': self.bass,
+            'mid': self.mid,
+            'treble': self.treble,
+            'bands': self.bands,
+            'preamp': self.preamp,
+            'enabled': self.enabled
+        }, self.profile)
     
     def load_settings(self):
         """
-        Carrega configurações do arquivo JSON
+        Carrega configurações do perfil ativo
         """
-        if not os.path.exists(self.settings_file):
-            logger.info("No saved EQ settings found, using defaults")
+        settings = self.store.get(self.profile)
+        if settings is None:
+            logger.info(f"No saved EQ settings for profile '{self.profile}', using defaults")
             return
         
-        try:
-            with open(self.settings_file, 'r') as f:
-                settings = json.load(f)
-            
-            self.bass = settings.get('bass', 0)
-            self.mid = settings.get('mid', 0)
-            self.treble = settings.get('treble', 0)
-            self.enabled = settings.get('enabled', False)
-            
-            logger.info(f"EQ settings loaded from {self.settings_file}")
-        except Exception as e:
-            logger.error(f"Error loading EQ settings: {e}")
+        self.bass = settings.get('bass', 0)
+        self.mid = settings.get('mid', 0)
+        self.treble = settings.get('treble', 0)
+        self.preamp = settings.get('preamp', 0.0)
+        self.enabled = settings.get('enabled', False)
+        
+        bands = settings.get('bands')
+        if bands and len(bands) == len(self.BAND_FREQUENCIES):
+            self.bands = [float(b) for b in bands]
+        else:
+            # Arquivo antigo (só 3 bandas)
+            for group, indexes in self.BAND_GROUPS.items():
+                for index in indexes:
+                    self.bands[index] = getattr(self, group)
+        
+        logger.info(f"EQ settings loaded (profile '{self.profile}')")
+    
+    def switch_profile(self, profile: str):
+        """
+        Troca o perfil ativo e aplica suas configurações
+        
+        Perfil novo começa flat (e é salvo no primeiro ajuste).
+        """
+        self.profile = profile
+        self.bass = self.mid = self.treble = 0
+        self.bands = [0.0] * len(self.BAND_FREQUENCIES)
+        self.preamp = 0.0
+        self.enabled = False
+        
+        self.load_settings()
+        self.version += 1
+        self.apply()
+        
+        logger.info(f"EQ profile switched to '{profile}'")
+    
+    def list_profiles(self) -> List[str]:
+        """
+        Retorna perfis salvos
+        """
+        return self.store.list_profiles()
     
     def get_presets(self) -> Dict:
         """
@@ -202,5 +384,204 @@ class Equalizer:
         """
         Reseta equalizer para flat (0,0,0)
         """
+        self.preamp = 0.0
         self.load_preset('flat')
-        logger.info("Equalizer reset to flat")
\ No newline at end of file
+        logger.info("Equalizer reset to flat")
+
+class BiquadFilterBank:
+    """
+    Cascata de filtros peaking (RBJ Audio EQ Cookbook) em NumPy
+    
+    Para o caminho em Python (offline/streaming); o player usa o
+    equalizador nativo do VLC. Usa scipy.signal.sosfilt se disponível;
+    sem scipy, filtra em blocos de BLOCK_SIZE samples com matrizes de
+    estado (o laço em Python é por bloco, não por sample).
+    O estado dos filtros é mantido entre chamadas de process().
+    """
+    
+    # Tamanho do bloco do fallback sem scipy
+    BLOCK_SIZE = 256
+    
+    def __init__(self, frequencies: Sequence[float], sample_rate: int = 44100, q: float = 1.41):
+        """
+        Args:
+            frequencies: Frequência central de cada banda (Hz)
+            sample_rate: Taxa de amostragem (Hz)
+            q: Fator Q dos filtros
+        """
+        self.frequencies = [f for f in frequencies if f < sample_rate / 2]
+        self.sample_rate = sample_rate
+        self.q = q
+        
+        # Seções em formato SOS: (n_bandas, 6) = b0 b1 b2 a0 a1 a2
+        self.sos = np.tile(np.array([1, 0, 0, 1, 0, 0], dtype=np.float64), (len(self.frequencies), 1))
+        self.gain = 1.0
+        self.version = None
+        self._gains: List[float] = []
+        self._zi: Optional[np.ndarray] = None
+        
+        # Matrizes do fallback por (seção, tamanho do bloco), refeitas ao mudar ganhos
+        self._block_cache: Dict = {}
+    
+    def set_gains(self, gains_db: Sequence[float], preamp_db: float = 0.0, version=None):
+        """
+        Define ganhos; só recalcula coeficientes se algo mudou
+        
+        Args:
+            gains_db: Ganho de cada banda em dB
+            preamp_db: Preamp em dB
+            version: Versão das configurações (evita comparar listas)
+        """
+        gains = list(gains_db[:len(self.frequencies)])
+        if version is not None and version == self.version:
+            return
+        if gains == self._gains and 10 ** (preamp_db / 20) == self.gain:
+            self.version = version
+            return
+        
+        self.version = version
+        self._gains = gains
+        self.gain = 10 ** (preamp_db / 20)
+        
+        for index, (frequency, gain_db) in enumerate(zip(self.frequencies, gains)):
+            self.sos[index] = self._peaking(frequency, gain_db)
+        self._block_cache = {}
+    
+    def _peaking(self, frequency: float, gain_db: float) -> np.ndarray:
+        a = 10 ** (gain_db / 40)
+        w0 = 2 * math.pi * frequency / self.sample_rate
+        alpha = math.sin(w0) / (2 * self.q)
+        cos_w0 = math.cos(w0)
+        
+        a0 = 1 + alpha / a
+        return np.array([
+            (1 + alpha * a) / a0,
+            -2 * cos_w0 / a0,
+            (1 - alpha * a) / a0,
+            1.0,
+            -2 * cos_w0 / a0,
+            (1 - alpha / a) / a0
+        ])
+    
+    def reset(self):
+        """
+        Zera o estado dos filtros (ex: ao trocar de música)
+        """
+        self._zi = None
+    
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Filtra um bloco de samples
+        
+        Args:
+            samples: float32 com shape (n,) ou (n, canais)
+        
+        Returns:
+            Samples filtrados (float32, mesmo shape)
+        """
+        x = np.asarray(samples, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[:, None]
+        
+        if self._zi is None or self._zi.shape[2] != x.shape[1]:
+            self._zi = np.zeros((len(self.sos), 2, x.shape[1]))
+        
+        if sosfilt is not None:
+            y, self._zi = sosfilt(self.sos, x, axis=0, zi=self._zi)
+        else:
+            y = self._sosfilt(x)
+        
+        y *= self.gain
+        return y.reshape(np.shape(samples)).astype(np.float32)
+    
+    def _sosfilt(self, x: np.ndarray) -> np.ndarray:
+        """
+        Fallback sem scipy: cada seção roda em blocos via espaço de estados
+        
+        Para a Direct Form II transposta com estado s = (z1, z2):
+            y[n] = C A^n s0 + h * x (convolução com a resposta ao impulso)
+            s[L] = A^L s0 + sum A^(L-1-k) B x[k]
+        Saída e contribuição da entrada no estado saem de produtos de
+        matrizes para todos os blocos de uma vez; só a propagação do
+        estado (2 valores por canal) é sequencial, uma vez por bloco.
+        """
+        y = x
+        size = self.BLOCK_SIZE
+        
+        for section, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+            if b0 == 1 and b1 == a1 and b2 == a2:
+                continue  # ganho 0 dB: seção é identidade
+            
+            out = np.empty_like(y)
+            state = self._zi[section]
+            blocks = len(y) // size
+            
+            if blocks:
+                state = self._filter_blocks(section, y[:blocks * size], out[:blocks * size], state, size)
+            if len(y) > blocks * size:
+                state = self._filter_blocks(section, y[blocks * size:], out[blocks * size:], state, len(y) - blocks * size)
+            
+            self._zi[section] = state
+            y = out
+        
+        return y if y is not x else x.copy()
+    
+    def _filter_blocks(self, section: int, x: np.ndarray, out: np.ndarray, state: np.ndarray, size: int) -> np.ndarray:
+        """
+        Filtra x (múltiplo de size samples) com uma seção, escrevendo em out
+        
+        Returns:
+            Estado (z1, z2) por canal depois do último sample
+        """
+        to_output, impulse, to_state, step = self._block_matrices(section, size)
+        channels = x.shape[1]
+        
+        # (size, blocos * canais): cada coluna é um bloco de um canal (GEMM único)
+        columns = x.reshape(-1, size, channels).transpose(1, 0, 2).reshape(size, -1)
+        forced = (to_state @ columns).reshape(2, -1, channels)
+        
+        # Estado no início de cada bloco (recorrência de 2x2 por bloco)
+        starts = np.empty_like(forced)
+        for index in range(forced.shape[1]):
+            starts[:, index] = state
+            state = step @ state + forced[:, index]
+        
+        y = impulse @ columns + to_output @ starts.reshape(2, -1)
+        out[:] = y.reshape(size, -1, channels).transpose(1, 0, 2).reshape(out.shape)
+        
+        return state
+    
+    def _block_matrices(self, section: int, size: int):
+        """
+        Matrizes de bloco de uma seção (cacheadas até os ganhos mudarem)
+        
+        Returns:
+            (C A^n, Toeplitz da resposta ao impulso, colunas A^(L-1-k) B, A^L)
+        """
+        key = (section, size)
+        cached = self._block_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        b0, b1, b2, _, a1, a2 = self.sos[section]
+        a = np.array([[-a1, 1.0], [-a2, 0.0]])
+        b = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        
+        powers = np.empty((size + 1, 2, 2))
+        powers[0] = np.eye(2)
+        for n in range(1, size + 1):
+            powers[n] = powers[n - 1] @ a
+        
+        to_output = powers[:size, 0, :]
+        
+        response = np.empty(size)
+        response[0] = b0
+        response[1:] = powers[:size - 1, 0, :] @ b
+        lag = np.arange(size)[:, None] - np.arange(size)[None, :]
+        impulse = np.where(lag >= 0, response[np.clip(lag, 0, None)], 0.0)
+        
+        to_state = (powers[size - 1::-1] @ b).T
+        
+        cached = (to_output, impulse, to_state, powers[size])
+        self._block_cache[key] = cached
+        return cached
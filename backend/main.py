@@ -1,19 +1,27 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import List, Optional
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+import asyncio
 import os
 from dotenv import load_dotenv
 
 from music_matcher import MusicMatcher
+from match_cache import MatchCache
+from ytdl_pool import YoutubeDLPool
 from audio_cache import AudioCache
+from download_scheduler import DownloadScheduler
 from audio_player import AudioPlayer
 from lyrics_fetcher import LyricsFetcher
 from equalizer import Equalizer
 from user_data import UserData
 from playlist_manager import PlaylistManager
-from visualizer import AudioVisualizer
+from visualizer import AudioVisualizer, SpectrumEncoder
+from prefetcher import QueuePrefetcher
+from async_utils import run_blocking
+from push_hub import PushHub
 
 load_dotenv()
 
@@ -40,24 +48,86 @@ sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
     scope="user-library-read playlist-read-private user-top-read user-read-recently-played"
 ))
 
-matcher = MusicMatcher()
-cache = AudioCache()
-player = AudioPlayer()
+ytdl_pool = YoutubeDLPool(max_per_profile=8)
+match_cache = MatchCache()
+matcher = MusicMatcher(match_cache=match_cache, ytdl_pool=ytdl_pool)
+download_scheduler = DownloadScheduler(
+    max_workers=int(os.getenv("DOWNLOAD_WORKERS", "4")),
+    reserved_interactive=int(os.getenv("DOWNLOAD_RESERVED_INTERACTIVE", "1")),
+    limits={
+        "prefetch": int(os.getenv("DOWNLOAD_PREFETCH_LIMIT", "1")),
+        "batch": int(os.getenv("DOWNLOAD_BATCH_LIMIT", "3"))
+    }
+)
+cache = AudioCache(
+    ytdl_pool=ytdl_pool,
+    scheduler=download_scheduler,
+    max_cache_bytes=int(float(os.getenv("CACHE_MAX_MB", "0")) * 1024 * 1024) or None,
+    max_age_days=float(os.getenv("CACHE_MAX_AGE_DAYS", "0")) or None,
+    eviction_policy=os.getenv("CACHE_EVICTION_POLICY", "lru"),
+    transcode_native=os.getenv("CACHE_TRANSCODE_NATIVE", "0") == "1"
+)
+player = AudioPlayer(crossfade_ms=int(os.getenv("PLAYER_CROSSFADE_MS", "0")))
 lyrics_fetcher = LyricsFetcher()
 equalizer = Equalizer()
 user_data = UserData()
-playlist_manager = PlaylistManager(matcher, cache, max_workers=3)
-visualizer = AudioVisualizer(num_bands=64)
+playlist_manager = PlaylistManager(matcher, cache)
+visualizer = AudioVisualizer(num_bands=64, playback_active=lambda: player.is_playing)
+prefetcher = QueuePrefetcher(
+    player, matcher, cache,
+    track_loader=sp.track,
+    depth=int(os.getenv("PREFETCH_DEPTH", "2"))
+)
+push_hub = PushHub(
+    status_provider=lambda: player.get_status(include_position=False),
+    position_provider=lambda: {"position": player.get_position(), "duration": player.get_duration()}
+)
 
-# Connect user_data to player
+# Connect user_data and the equalizer to player
 player.user_data = user_data
+equalizer.attach(player)
+
+# Cache eviction: never evict playlist tracks, favorites or the current track
+cache.add_pin_source(playlist_manager.get_cached_track_ids)
+cache.add_pin_source(user_data.get_favorite_ids)
+cache.add_pin_source(lambda: [player.current_track['id']] if player.current_track else [])
+cache.start_sweeper()
 
-# Start visualizer
+# Warm upcoming queue tracks in the background
+prefetcher.start()
+
+# Push channel: status changes and download progress
+player.add_queue_listener(push_hub.poke_status)
+player.add_track_end_listener(lambda *args: push_hub.poke_status())
+cache.add_progress_listener(
+    lambda track_id, state: push_hub.publish("downloads", {"track_id": track_id, **state})
+)
+playlist_manager.add_progress_listener(
+    lambda playlist_id, state: push_hub.publish("playlists", {"playlist_id": playlist_id, **state})
+)
+
+# Start visualizer, fed with decoded PCM from the player
+player.enable_pcm_tap(visualizer.ring, rate=visualizer.sample_rate, wanted=visualizer.is_watched)
 visualizer.start()
 
+@app.on_event("startup")
+async def start_push_hub():
+    push_hub.start(asyncio.get_running_loop())
+
 class PlayRequest(BaseModel):
     track_id: str
 
+class EqualizerBandsRequest(BaseModel):
+    bands: List[float]
+    preamp: Optional[float] = None
+
+class DownloadLimitsRequest(BaseModel):
+    max_workers: Optional[int] = None
+    reserved_interactive: Optional[int] = None
+    interactive: Optional[int] = None
+    prefetch: Optional[int] = None
+    batch: Optional[int] = None
+
 @app.get("/")
 async def root():
     return {
@@ -70,7 +140,7 @@ async def root():
             "Progress tracking & seek",
             "Queue management",
             "Lyrics fetching",
-            "3-band Equalizer",
+            "10-band Equalizer",
             "History tracking",
             "Favorites system",
             "Statistics",
@@ -88,8 +158,43 @@ async def root():
 @app.get("/visualizer")
 async def get_visualizer_data():
     """Get current visualization data"""
+    # Polling keeps the analysis thread awake for a short lease
+    visualizer.touch()
     return visualizer.get_visualization_data()
 
+@app.websocket("/ws/visualizer")
+async def stream_visualizer(websocket: WebSocket, delta: bool = True, peaks: bool = True, fps: float = 0):
+    """
+    Binary spectrum stream, pushed at the analysis frame rate.
+
+    Frames are packed uint8 (optionally int8 deltas); see SpectrumEncoder
+    for the layout. fps > 0 caps the rate for this client. GET /visualizer
+    stays as the JSON fallback.
+    """
+    await websocket.accept()
+    encoder = SpectrumEncoder(use_delta=delta, include_peaks=peaks)
+    min_interval = 1 / fps if fps > 0 else 0
+    seq = visualizer.frame_seq
+    token = visualizer.subscribe(fps or None)
+
+    try:
+        while True:
+            new_seq = await visualizer.wait_frame_async(seq, timeout=1)
+            if new_seq == seq:
+                continue
+            seq = new_seq
+
+            frame = encoder.encode(*visualizer.get_quantized_frame())
+            if frame:
+                await websocket.send_bytes(frame)
+
+            if min_interval:
+                await asyncio.sleep(min_interval)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        visualizer.unsubscribe(token)
+
 @app.post("/visualizer/toggle")
 async def toggle_visualizer():
     """Toggle visualizer on/off"""
@@ -110,6 +215,169 @@ async def reset_visualizer_peaks():
     visualizer.reset_peaks()
     return {"message": "Peaks reset"}
 
+# ========== EQUALIZER ENDPOINTS ==========
+
+@app.post("/equalizer/bands")
+async def set_equalizer_bands(request: EqualizerBandsRequest):
+    """Set all 10 EQ bands (dB, VLC band frequencies) and optional preamp"""
+    if not equalizer.set_bands(request.bands, request.preamp):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expected {len(equalizer.BAND_FREQUENCIES)} bands"
+        )
+    return equalizer.get_settings()
+
+@app.get("/equalizer/profiles")
+async def list_equalizer_profiles():
+    """List saved EQ profiles (per user/device)"""
+    return {"active": equalizer.profile, "profiles": equalizer.list_profiles()}
+
+@app.post("/equalizer/profile/{profile}")
+async def switch_equalizer_profile(profile: str):
+    """Switch to an EQ profile (new profiles start flat)"""
+    equalizer.switch_profile(profile)
+    return equalizer.get_settings()
+
+@app.post("/equalizer/preamp/{value}")
+async def set_equalizer_preamp(value: float):
+    """Set EQ preamp (-12 to +12 dB)"""
+    equalizer.set_preamp(value)
+    return equalizer.get_settings()
+
+# ========== LISTENING ANALYTICS ==========
+
+@app.get("/stats/top-artists")
+async def get_top_artists(
+    days: int = Query(7, ge=1, le=UserData.MAX_STATS_DAYS),
+    limit: int = Query(10, ge=1, le=UserData.MAX_STATS_LIMIT)
+):
+    """Most played artists over the last N days (from daily rollups)"""
+    return await run_blocking(user_data.get_top_artists, days, limit)
+
+@app.get("/stats/top-tracks")
+async def get_top_tracks(
+    days: int = Query(30, ge=1, le=UserData.MAX_STATS_DAYS),
+    limit: int = Query(20, ge=1, le=UserData.MAX_STATS_LIMIT)
+):
+    """Most played tracks over the last N days (from daily rollups)"""
+    return await run_blocking(user_data.get_top_tracks, days, limit)
+
+@app.get("/stats/listening-per-day")
+async def get_listening_per_day(days: int = Query(30, ge=1, le=UserData.MAX_STATS_DAYS)):
+    """Listening minutes and plays per day over the last N days"""
+    return await run_blocking(user_data.get_listening_per_day, days)
+
+# ========== PUSH CHANNEL ==========
+
+@app.websocket("/ws")
+async def push_channel(websocket: WebSocket):
+    """
+    Server-push channel replacing /status, /position and progress polling.
+
+    Client messages: {"subscribe": ["status", "position", "downloads", "playlists"], "position_hz": 4}
+    Server messages: {"type": "status", "data": {...changed fields}}, {"type": "position", ...}
+    """
+    await websocket.accept()
+    try:
+        await push_hub.serve(websocket)
+    except WebSocketDisconnect:
+        pass
+
+# ========== PLAYLIST DOWNLOAD CONTROL ==========
+
+@app.post("/playlist/download/{playlist_id}/pause")
+async def pause_playlist_download(playlist_id: str):
+    """Pause a batch download (queued tracks leave the scheduler, in-flight ones abort)"""
+    if not playlist_manager.pause_download(playlist_id):
+        raise HTTPException(status_code=404, detail="Playlist is not downloading")
+    return {"message": "Pausing", "playlist_id": playlist_id}
+
+@app.post("/playlist/download/{playlist_id}/cancel")
+async def cancel_playlist_download(playlist_id: str):
+    """Cancel a batch download (can still be resumed from its checkpoint)"""
+    if not playlist_manager.cancel_download(playlist_id):
+        raise HTTPException(status_code=404, detail="Playlist is not downloading")
+    return {"message": "Cancelling", "playlist_id": playlist_id}
+
+@app.post("/playlist/download/{playlist_id}/resume")
+async def resume_playlist_download(playlist_id: str):
+    """Resume a paused, cancelled or interrupted batch download (also after a restart)"""
+    status = await run_blocking(playlist_manager.resume_download, playlist_id)
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    return {"status": status, "progress": playlist_manager.get_progress(playlist_id)}
+
+@app.post("/playlist/download/{playlist_id}/retry-failed")
+async def retry_failed_playlist_tracks(playlist_id: str, include_permanent: bool = False):
+    """Re-run only the failed tracks of a playlist (permanent errors skipped by default)"""
+    status = await run_blocking(playlist_manager.retry_failed, playlist_id, include_permanent)
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    return {"status": status, "progress": playlist_manager.get_progress(playlist_id)}
+
+@app.get("/downloads/retry")
+async def get_retry_policy():
+    """Retry rules per error class and rate-limit circuit breaker state"""
+    return playlist_manager.retry_policy.get_state()
+
+# ========== MATCH CACHE ENDPOINTS ==========
+
+@app.get("/matches/stats")
+async def get_match_cache_stats():
+    """Get Spotify→YouTube match cache statistics"""
+    return match_cache.get_stats()
+
+@app.delete("/matches/{track_id}")
+async def invalidate_match(track_id: str):
+    """Forget cached match for a track (e.g. wrong video)"""
+    match_cache.invalidate(track_id)
+    return {"message": "Match invalidated", "track_id": track_id}
+
+# ========== CACHE ENDPOINTS ==========
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get audio cache statistics and eviction state"""
+    return cache.get_cache_stats()
+
+@app.post("/cache/sweep")
+async def sweep_cache():
+    """Ask the background sweeper to run eviction now"""
+    cache.request_sweep()
+    return {"message": "Sweep requested"}
+
+@app.post("/cache/pin/{track_id}")
+async def pin_cached_track(track_id: str, pinned: bool = True):
+    """Pin (or unpin) a cached track so eviction never removes it"""
+    cache.pin(track_id, pinned)
+    return {"track_id": track_id, "pinned": pinned}
+
+@app.get("/prefetch/status")
+async def get_prefetch_status():
+    """Get queue prefetcher state"""
+    return prefetcher.get_status()
+
+@app.get("/downloads/scheduler")
+async def get_download_scheduler():
+    """Get download queue state per priority class (interactive, prefetch, batch)"""
+    return download_scheduler.get_stats()
+
+@app.post("/downloads/scheduler/limits")
+async def set_download_limits(request: DownloadLimitsRequest):
+    """Tune download concurrency at runtime (total, reserved for play, per class)"""
+    return download_scheduler.set_limits(
+        max_workers=request.max_workers,
+        reserved_interactive=request.reserved_interactive,
+        interactive=request.interactive,
+        prefetch=request.prefetch,
+        batch=request.batch
+    )
+
+@app.get("/ytdl/pool")
+async def get_ytdl_pool_stats():
+    """Get YoutubeDL instance pool metrics (acquires, waits)"""
+    return ytdl_pool.get_stats()
+
 # All other endpoints remain the same as in the full version...
 # (search, play, pause, equalizer, history, favorites, playlists, etc.)
 
@@ -0,0 +1,201 @@
+import sqlite3
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, List
+
+class MatchCache:
+    """
+    Cache persistente de matches Spotify → YouTube
+
+    Guarda a URL vencedora, o score e a lista de candidatos de cada match,
+    indexado pelo ID do Spotify e por uma chave normalizada
+    (artista, título, faixa de duração). Resultados negativos (nenhum match)
+    também são guardados, com TTL menor.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "../cache",
+        ttl_days: float = 30,
+        negative_ttl_hours: float = 24
+    ):
+        """
+        Args:
+            cache_dir: Diretório onde fica o banco de matches
+            ttl_days: Validade de um match positivo (dias)
+            negative_ttl_hours: Validade de um resultado negativo (horas)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(exist_ok=True)
+
+        self.ttl = ttl_days * 24 * 3600
+        self.negative_ttl = negative_ttl_hours * 3600
+
+        self.db_path = self.cache_dir / "matches.db"
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._init_db()
+
+        # Estatísticas de uso
+        self.hits = 0
+        self.misses = 0
+
+        self.purge_expired()
+
+    def _init_db(self):
+        """
+        Inicializa banco de dados SQLite
+        """
+        with self.lock:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS matches (
+                    match_key TEXT PRIMARY KEY,
+                    spotify_id TEXT,
+                    youtube_url TEXT,
+                    score REAL,
+                    candidates TEXT,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_matches_spotify_id ON matches (spotify_id)"
+            )
+            self.db.commit()
+
+    def get(self, match_key: str, spotify_id: Optional[str] = None) -> Optional[Dict]:
+        """
+        Busca um match no cache
+
+        Args:
+            match_key: Chave normalizada (artista|título|duração)
+            spotify_id: ID da música no Spotify (opcional, tem prioridade)
+
+        Returns:
+            Dict com youtube_url (None se negativo), score e candidates,
+            ou None se não houver entrada válida
+        """
+        now = time.time()
+
+        with self.lock:
+            row = None
+            if spotify_id:
+                row = self.db.execute("""
+                    SELECT youtube_url, score, candidates FROM matches
+                    WHERE spotify_id = ? AND expires_at > ?
+                    ORDER BY created_at DESC LIMIT 1
+                """, (spotify_id, now)).fetchone()
+
+            if row is None:
+                row = self.db.execute("""
+                    SELECT youtube_url, score, candidates FROM matches
+                    WHERE match_key = ? AND expires_at > ?
+                """, (match_key, now)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        return {
+            'youtube_url': row[0],
+            'score': row[1],
+            'candidates': json.loads(row[2]) if row[2] else []
+        }
+
+    def put(
+        self,
+        match_key: str,
+        youtube_url: Optional[str],
+        score: float = 0,
+        candidates: Optional[List[Dict]] = None,
+        spotify_id: Optional[str] = None
+    ):
+        """
+        Salva resultado de um match
+
+        Args:
+            match_key: Chave normalizada (artista|título|duração)
+            youtube_url: URL vencedora, ou None para resultado negativo
+            score: Score do match vencedor
+            candidates: Lista de candidatos avaliados
+            spotify_id: ID da música no Spotify
+        """
+        now = time.time()
+        ttl = self.ttl if youtube_url else self.negative_ttl
+
+        with self.lock:
+            self.db.execute("""
+                INSERT OR REPLACE INTO matches
+                (match_key, spotify_id, youtube_url, score, candidates, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                match_key,
+                spotify_id,
+                youtube_url,
+                score,
+                json.dumps(candidates or []),
+                now,
+                now + ttl
+            ))
+            self.db.commit()
+
+    def invalidate(self, spotify_id: str):
+        """
+        Remove matches de uma música (ex: match errado reportado)
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM matches WHERE spotify_id = ?", (spotify_id,))
+            self.db.commit()
+
+    def purge_expired(self) -> int:
+        """
+        Remove entradas expiradas
+
+        Returns:
+            Número de entradas removidas
+        """
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM matches WHERE expires_at <= ?", (time.time(),)
+            )
+            self.db.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict:
+        """
+        Retorna estatísticas do cache de matches
+        """
+        with self.lock:
+            total, negative = self.db.execute("""
+                SELECT COUNT(*), COUNT(CASE WHEN youtube_url IS NULL THEN 1 END)
+                FROM matches
+            """).fetchone()
+
+        lookups = self.hits + self.misses
+
+        return {
+            'total_matches': total or 0,
+            'negative_matches': negative or 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / lookups * 100) if lookups else 0
+        }
+
+    def clear(self):
+        """
+        Limpa todo o cache de matches
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM matches")
+            self.db.commit()
+
+    def __del__(self):
+        """
+        Fecha conexão com banco ao destruir objeto
+        """
+        if hasattr(self, 'db'):
+            self.db.close()
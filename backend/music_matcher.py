@@ -1,13 +1,49 @@
-import yt_dlp
 import re
-from typing import Optional, Dict, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from typing import Optional, Dict, List, Iterator, Tuple
+
+from ytdl_pool import YoutubeDLPool
+
+class MatchSearchError(RuntimeError):
+    """
+    Busca no YouTube falhou (rede, rate limit...) sem nenhum resultado; diferente de "sem match"
+    """
 
 class MusicMatcher:
     """
     Classe responsável por fazer matching entre músicas do Spotify e vídeos do YouTube
     """
     
-    def __init__(self):
+    # Tamanho da faixa de duração usada na chave do cache (segundos)
+    DURATION_BUCKET_SECONDS = 5
+    
+    # Score a partir do qual um match é aceito sem esperar as outras buscas
+    ACCEPT_SCORE = 80
+    
+    def __init__(
+        self,
+        match_cache=None,
+        concurrent: bool = True,
+        max_search_workers: int = 8,
+        ytdl_pool: Optional[YoutubeDLPool] = None
+    ):
+        """
+        Args:
+            match_cache: Instância de MatchCache (opcional)
+            concurrent: Dispara as queries de busca em paralelo
+            max_search_workers: Número máximo de buscas simultâneas (todas as músicas)
+            ytdl_pool: Pool de YoutubeDL compartilhado (cria um próprio se None)
+        """
+        self.match_cache = match_cache
+        self.concurrent = concurrent
+        
+        # Executor compartilhado e limitado para as buscas em paralelo
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=max_search_workers,
+            thread_name_prefix="yt-search"
+        ) if concurrent else None
+        
         self.ydl_opts = {
             'format': 'bestaudio/best',
             'noplaylist': True,
@@ -15,8 +51,21 @@ class MusicMatcher:
             'no_warnings': True,
             'extract_flat': False,
         }
+        
+        search_opts = self.ydl_opts.copy()
+        search_opts['extract_flat'] = True
+        
+        self.ytdl_pool = ytdl_pool or YoutubeDLPool()
+        self.ytdl_pool.register_profile('search', search_opts)
     
-    def spotify_to_youtube(self, track_name: str, artist_name: str, duration_ms: int) -> Optional[str]:
+    def spotify_to_youtube(
+        self,
+        track_name: str,
+        artist_name: str,
+        duration_ms: int,
+        spotify_id: Optional[str] = None,
+        raise_on_error: bool = False
+    ) -> Optional[str]:
         """
         Encontra a melhor correspondência no YouTube para uma música do Spotify
         
@@ -24,10 +73,24 @@ class MusicMatcher:
             track_name: Nome da música
             artist_name: Nome do artista
             duration_ms: Duração em milissegundos
+            spotify_id: ID da música no Spotify (usado no cache de matches)
+            raise_on_error: Lança MatchSearchError se não achou match porque
+                alguma busca falhou (em vez de devolver None)
         
         Returns:
             URL do YouTube ou None se não encontrar
+        
+        Raises:
+            MatchSearchError: Busca falhou e raise_on_error=True
         """
+        match_key = self._match_key(track_name, artist_name, duration_ms)
+        
+        # Consulta cache de matches antes de ir para a rede
+        if self.match_cache:
+            cached = self.match_cache.get(match_key, spotify_id)
+            if cached is not None:
+                return cached['youtube_url']
+        
         # Limpa nome da música (remove features, remixes, etc)
         clean_track = self._clean_track_name(track_name)
         
@@ -41,39 +104,111 @@ class MusicMatcher:
         
         best_match = None
         best_score = 0
+        best_query = len(queries)
+        candidates = {}
+        search_error = None
         
-        for query in queries:
-            results = self._search_youtube(query, max_results=5)
-            
-            if not results:
-                continue
-            
-            # Score cada resultado
-            for result in results:
-                score = self._score_result(result, track_name, artist_name, duration_ms)
+        with closing(self._iter_search_results(queries)) as search_results:
+            for query_index, results, error in search_results:
+                if error is not None:
+                    search_error = error
+                    continue
                 
-                if score > best_score:
-                    best_score = score
-                    best_match = result
-            
-            # Se encontrou um match muito bom, para de buscar
-            if best_score >= 80:
-                break
+                # Score cada resultado
+                for result in results:
+                    score = self._score_result(result, track_name, artist_name, duration_ms)
+                    candidates.setdefault(result['url'], {**result, 'score': score})
+                    
+                    # Em empate, prefere a query mais específica (ordem da lista)
+                    if score > best_score or (
+                        best_match and score == best_score and query_index < best_query
+                    ):
+                        best_score = score
+                        best_match = result
+                        best_query = query_index
+                
+                # Se encontrou um match muito bom, para de buscar
+                if best_score >= self.ACCEPT_SCORE:
+                    break
+        
+        # Não guarda resultado negativo se a busca falhou (erro de rede, etc)
+        if self.match_cache and (best_match or search_error is None):
+            ranked = sorted(candidates.values(), key=lambda c: c['score'], reverse=True)
+            self.match_cache.put(
+                match_key,
+                best_match['url'] if best_match else None,
+                best_score,
+                ranked[:10],
+                spotify_id
+            )
         
         if best_match:
             return best_match['url']
         
+        if search_error is not None and raise_on_error:
+            raise MatchSearchError(f"YouTube search failed: {search_error}") from search_error
+        
         return None
     
+    def _iter_search_results(
+        self,
+        queries: List[str]
+    ) -> Iterator[Tuple[int, Optional[List[Dict]], Optional[Exception]]]:
+        """
+        Executa as queries e gera (índice da query, resultados, erro)
+        
+        Se a busca falhou, resultados é None e erro é a exceção.
+        
+        No modo concorrente todas as queries são disparadas de uma vez e os
+        resultados chegam na ordem em que terminam. Ao fechar o gerador
+        (match aceito), buscas que ainda não começaram são canceladas e as
+        que já estão rodando são ignoradas.
+        """
+        if not self.concurrent:
+            for index, query in enumerate(queries):
+                try:
+                    yield index, self._search_youtube(query, max_results=5), None
+                except Exception as e:
+                    yield index, None, e
+            return
+        
+        futures = {
+            self.search_executor.submit(self._search_youtube, query, 5): index
+            for index, query in enumerate(queries)
+        }
+        
+        try:
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    yield futures[future], None, error
+                else:
+                    yield futures[future], future.result(), None
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    def _match_key(self, track_name: str, artist_name: str, duration_ms: int) -> str:
+        """
+        Gera chave normalizada (artista|título|faixa de duração) para o cache
+        """
+        artist = self._normalize_string(artist_name)
+        title = self._normalize_string(self._clean_track_name(track_name))
+        bucket = round((duration_ms or 0) / 1000 / self.DURATION_BUCKET_SECONDS)
+        return f"{artist}|{title}|{bucket}"
+    
     def _search_youtube(self, query: str, max_results: int = 5) -> List[Dict]:
         """
         Busca vídeos no YouTube
-        """
-        search_opts = self.ydl_opts.copy()
-        search_opts['extract_flat'] = True
         
+        Returns:
+            Lista de resultados (vazia se a busca não achou nada)
+        
+        Raises:
+            Exception: Erro do yt-dlp (rede, rate limit...), depois de logado
+        """
         try:
-            with yt_dlp.YoutubeDL(search_opts) as ydl:
+            with self.ytdl_pool.acquire('search') as ydl:
                 search_results = ydl.extract_info(f"ytsearch{max_results}:{query}", download=False)
                 
                 if not search_results or 'entries' not in search_results:
@@ -93,7 +228,7 @@ class MusicMatcher:
                 return results
         except Exception as e:
             print(f"Error searching YouTube: {e}")
-            return []
+            raise
     
     def _score_result(self, result: Dict, track_name: str, artist_name: str, duration_ms: int) -> float:
         """
@@ -0,0 +1,96 @@
+import os
+import time
+from typing import Callable, Optional
+
+class PartialFileSource:
+    """
+    Leitor de um arquivo de áudio que ainda está sendo baixado
+
+    Quando a leitura alcança o fim dos dados já gravados, bloqueia até o
+    download avançar (em vez de devolver EOF e encerrar o playback).
+    Só devolve EOF quando o download terminou ou falhou.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        is_complete: Callable[[], bool],
+        wait_for_data: Callable[[float], None],
+        get_total_size: Optional[Callable[[], int]] = None,
+        stall_timeout: float = 30
+    ):
+        """
+        Args:
+            path: Caminho do arquivo parcial
+            is_complete: Retorna True quando o download terminou (ou falhou)
+            wait_for_data: Bloqueia até chegar mais dados (recebe timeout)
+            get_total_size: Retorna tamanho final em bytes (0 se desconhecido)
+            stall_timeout: Desiste se o download ficar parado por X segundos
+        """
+        self.path = path
+        self.is_complete = is_complete
+        self.wait_for_data = wait_for_data
+        self.get_total_size = get_total_size or (lambda: 0)
+        self.stall_timeout = stall_timeout
+
+        self._file = None
+        self._closed = False
+
+    def clone(self) -> "PartialFileSource":
+        """
+        Novo leitor independente do mesmo download (ex: tap de PCM)
+        """
+        return PartialFileSource(
+            self.path,
+            self.is_complete,
+            self.wait_for_data,
+            self.get_total_size,
+            self.stall_timeout
+        )
+
+    def open(self):
+        self._file = open(self.path, 'rb')
+        self._closed = False
+
+    def size(self) -> int:
+        """
+        Tamanho final do arquivo (0 se desconhecido)
+        """
+        if self.is_complete():
+            return os.path.getsize(self.path)
+        return self.get_total_size()
+
+    def read(self, size: int) -> bytes:
+        """
+        Lê até size bytes, esperando o download se necessário
+
+        Returns:
+            Dados lidos (b'' = fim do arquivo)
+        """
+        stalled_since = time.time()
+
+        while not self._closed:
+            data = self._file.read(size)
+            if data:
+                return data
+
+            if self.is_complete():
+                # Última tentativa: dados gravados entre o read e o check
+                return self._file.read(size)
+
+            if time.time() - stalled_since >= self.stall_timeout:
+                print(f"Partial stream stalled: {self.path}")
+                return b''
+
+            self.wait_for_data(0.25)
+
+        return b''
+
+    def seek(self, offset: int):
+        self._file.seek(offset)
+
+    def close(self):
+        self._closed = True
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,146 @@
+import ctypes
+import numpy as np
+import vlc
+
+class PCMRingBuffer:
+    """
+    Ring buffer de áudio mono float32 pré-alocado
+
+    Um produtor (thread de áudio do VLC) e um consumidor (visualizador),
+    sem lock: o produtor só avança write_pos depois de copiar os dados, e o
+    consumidor descarta a leitura se o produtor deu a volta durante a cópia.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Tamanho em samples (use alguns frames de análise)
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+
+        # Total de samples já escritos (só cresce)
+        self.write_pos = 0
+        self.read_pos = 0
+
+        # threading.Event opcional, setado a cada escrita (acorda o consumidor)
+        self.data_event = None
+
+    def write(self, samples: np.ndarray, channels: int = 1):
+        """
+        Escreve samples intercalados, convertendo para mono float32 [-1, 1]
+
+        Args:
+            samples: Array int16 ou float32 com channels canais intercalados
+            channels: Número de canais
+        """
+        frames = samples.reshape(-1, channels)
+        count = len(frames)
+        if count == 0:
+            return
+
+        # Só os últimos capacity samples cabem
+        if count > self.capacity:
+            frames = frames[-self.capacity:]
+            count = self.capacity
+
+        if np.issubdtype(frames.dtype, np.integer):
+            scale = 1.0 / (channels * (np.iinfo(frames.dtype).max + 1))
+        else:
+            scale = 1.0 / channels
+
+        start = self.write_pos % self.capacity
+        first = min(count, self.capacity - start)
+
+        # Downmix direto no buffer (sem arrays temporários)
+        for src, dst in (
+            (frames[:first], self.buffer[start:start + first]),
+            (frames[first:], self.buffer[:count - first])
+        ):
+            if len(src):
+                np.sum(src, axis=1, dtype=np.float32, out=dst)
+                dst *= scale
+
+        self.write_pos += count
+
+        event = self.data_event
+        if event is not None and not event.is_set():
+            event.set()
+
+    def read_latest(self, out: np.ndarray) -> int:
+        """
+        Copia os len(out) samples mais recentes para out
+
+        Chamadas sucessivas devolvem janelas sobrepostas; o retorno diz
+        quantos samples novos chegaram desde a leitura anterior.
+
+        Returns:
+            Samples novos desde a última leitura (0 = nada novo)
+        """
+        size = len(out)
+
+        for _ in range(3):
+            end = self.write_pos
+            new = end - self.read_pos
+            if new <= 0:
+                return 0
+
+            start = end - size
+            if start < 0:
+                out[:-start] = 0
+                offset = -start
+                start = 0
+            else:
+                offset = 0
+
+            begin = start % self.capacity
+            length = end - start
+            first = min(length, self.capacity - begin)
+            out[offset:offset + first] = self.buffer[begin:begin + first]
+            out[offset + first:] = self.buffer[:length - first]
+
+            # Produtor sobrescreveu a janela durante a cópia: tenta de novo
+            if self.write_pos - start <= self.capacity:
+                self.read_pos = end
+                return new
+
+        return 0
+
+class VlcPcmTap:
+    """
+    Captura o PCM decodificado de um media player do VLC
+
+    Usa as audio callbacks da libvlc. Elas substituem a saída de áudio,
+    então o tap precisa de um player próprio (sem som), mantido em
+    sincronia com o player audível pelo AudioPlayer.
+    """
+
+    def __init__(self, media_player, ring: PCMRingBuffer, rate: int = 44100, channels: int = 2):
+        """
+        Args:
+            media_player: vlc.MediaPlayer dedicado ao tap
+            ring: Ring buffer que recebe o áudio (mono float32)
+            rate: Taxa de amostragem pedida ao VLC
+            channels: Canais pedidos ao VLC
+        """
+        self.player = media_player
+        self.ring = ring
+        self.rate = rate
+        self.channels = channels
+
+        @vlc.CallbackDecorators.AudioPlayCb
+        def play_cb(opaque, samples, count, pts):
+            try:
+                view = np.ctypeslib.as_array(
+                    ctypes.cast(samples, ctypes.POINTER(ctypes.c_int16)),
+                    shape=(count * self.channels,)
+                )
+                self.ring.write(view, self.channels)
+            except Exception as e:
+                print(f"PCM tap error: {e}")
+
+        # Referência mantida enquanto o player existir
+        self._play_cb = play_cb
+
+        media_player.audio_set_callbacks(play_cb, None, None, None, None, None)
+        media_player.audio_set_format("S16N", rate, channels)
@@ -1,11 +1,14 @@
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Optional, Callable
-import sqlite3
+from concurrent.futures import CancelledError, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional, Callable, Tuple
 from datetime import datetime
 import json
 
+from sqlite_store import SQLiteStore
+from download_scheduler import DownloadScheduler, DownloadCancelled
+from retry_policy import RetryPolicy, NoMatchError
+
 class PlaylistManager:
     """
     Gerencia download em batch de playlists completas
@@ -13,43 +16,99 @@ class PlaylistManager:
     Features:
     - Download paralelo de múltiplas tracks
     - Progress tracking em tempo real
-    - Retry automático em falhas
+    - Retry automático em falhas (RetryPolicy: backoff com jitter por classe
+      de erro e disjuntor global de rate limit)
     - Cache de playlists baixadas
-    - Cancelamento de downloads
+    - Cancelamento e pause/resume de downloads
+    
+    Cancelar/pausar tira da fila do scheduler as tracks que ainda não
+    começaram e interrompe as que estão baixando (hook do yt-dlp). O que
+    não terminou fica pendente em playlist_tracks, que serve de checkpoint
+    para resume_download, inclusive depois de reiniciar o processo.
+    
+    Bookkeeping em lote: o status de cada track fica em memória e é gravado
+    periodicamente em uma única transação (SQLiteStore, WAL), com o contador
+    cached_tracks mantido de forma incremental.
     """
     
-    def __init__(self, music_matcher, audio_cache, max_workers=3):
+    # Intervalo máximo entre gravações do status das tracks (segundos)
+    FLUSH_INTERVAL = 1.0
+    # Grava antes do intervalo se acumular essa quantidade de mudanças
+    FLUSH_BATCH = 200
+    # Espera máxima pelos downloads interrompidos ao pausar/cancelar (segundos)
+    STOP_WAIT_SECONDS = 10.0
+    
+    def __init__(
+        self,
+        music_matcher,
+        audio_cache,
+        max_workers: Optional[int] = None,
+        scheduler: Optional[DownloadScheduler] = None,
+        retry_policy: Optional[RetryPolicy] = None
+    ):
         """
         Args:
             music_matcher: Instância de MusicMatcher
             audio_cache: Instância de AudioCache
-            max_workers: Número máximo de downloads paralelos
+            max_workers: Downloads paralelos da classe batch (None = limite
+                atual do scheduler)
+            scheduler: Fila de downloads (default: a do AudioCache)
+            retry_policy: Política de retry (default: uma própria ligada ao scheduler)
         """
         self.matcher = music_matcher
         self.cache = audio_cache
         self.max_workers = max_workers
         
-        # Estado de downloads ativos
+        # Estado de downloads ativos e o estado final dos que já terminaram
         self.active_downloads: Dict[str, Dict] = {}
-        self.cancel_flags: Dict[str, bool] = {}
+        self.finished_downloads: Dict[str, Dict] = {}
         
-        # Thread pool para downloads paralelos
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Pedido de parada (pause/cancel) por playlist, checado pelo worker
+        self._stop_events: Dict[str, threading.Event] = {}
         
-        # Database para tracking de playlists
+        # Ouvintes de progresso de todas as playlists (ex: canal WebSocket)
+        self._progress_listeners: List[Callable[[str, Dict], None]] = []
+        
+        # Downloads entram na fila compartilhada com prioridade batch, atrás
+        # de play e prefetch
+        self.scheduler = scheduler or audio_cache.scheduler
+        if max_workers is not None:
+            self.scheduler.set_limits(batch=max_workers)
+        
+        self.retry_policy = retry_policy or RetryPolicy(scheduler=self.scheduler)
+        
+        # Database para tracking de playlists (WAL, writer único)
         self.db_path = 'playlists_cache.db'
+        self.store = SQLiteStore(self.db_path)
         self._init_database()
         
-        print(f"PlaylistManager initialized with {max_workers} workers")
+        # Mudanças de status pendentes:
+        # (playlist_id, track_id) → (cached, file_path, error, error_class, attempts)
+        self._pending_tracks: Dict[Tuple[str, str], Tuple] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._closed = False
+        
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+        
+        print(f"PlaylistManager initialized ({self.scheduler.limits['batch']} batch downloads)")
     
     def _init_database(self):
         """
         Inicializa database de playlists cacheadas
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.store.transaction(self._create_schema, wait=True)
         
-        cursor.execute('''
+        # Downloads que estavam rodando quando o processo parou
+        self.store.write('''
+            UPDATE cached_playlists SET status = 'interrupted'
+            WHERE status = 'downloading'
+        ''', wait=True)
+        print("Playlists database initialized")
+    
+    def _create_schema(self, conn):
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS cached_playlists (
                 playlist_id TEXT PRIMARY KEY,
                 name TEXT NOT NULL,
@@ -62,7 +121,7 @@ class PlaylistManager:
             )
         ''')
         
-        cursor.execute('''
+        conn.execute('''
             CREATE TABLE IF NOT EXISTS playlist_tracks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 playlist_id TEXT NOT NULL,
@@ -77,9 +136,21 @@ class PlaylistManager:
             )
         ''')
         
-        conn.commit()
-        conn.close()
-        print("Playlists database initialized")
+        # Migração: duração para refazer o matching ao retomar do checkpoint
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(playlist_tracks)")}
+        if 'duration_ms' not in columns:
+            conn.execute("ALTER TABLE playlist_tracks ADD COLUMN duration_ms INTEGER")
+        # Migração: tentativas e classe do último erro (retry_failed filtra por ela)
+        if 'attempts' not in columns:
+            conn.execute("ALTER TABLE playlist_tracks ADD COLUMN attempts INTEGER DEFAULT 0")
+        if 'error_class' not in columns:
+            conn.execute("ALTER TABLE playlist_tracks ADD COLUMN error_class TEXT")
+        
+        # Pinning do AudioCache consulta as tracks cacheadas de todas as playlists
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_playlist_tracks_cached
+            ON playlist_tracks (cached, track_id)
+        ''')
     
     def download_playlist(
         self,
@@ -106,18 +177,117 @@ class PlaylistManager:
         # Registrar playlist no database
         self._register_playlist(playlist_id, playlist_name, tracks)
         
-        # Inicializar estado
+        self._start_worker(playlist_id, playlist_name, tracks, len(tracks), 0, 0, progress_callback)
+        
+        print(f"Started downloading playlist {playlist_name} ({len(tracks)} tracks)")
+        return "started"
+    
+    def resume_download(self, playlist_id: str, progress_callback: Optional[Callable] = None) -> str:
+        """
+        Retoma download pausado, cancelado ou interrompido
+        
+        Usa playlist_tracks como checkpoint: só as tracks que não estão
+        cacheadas nem falharam voltam para a fila.
+        
+        Returns:
+            Status string
+        """
+        if playlist_id in self.active_downloads:
+            return "already_downloading"
+        
+        self._flush_track_updates(wait=True)
+        
+        playlist = self.store.read_one(
+            "SELECT name, total_tracks FROM cached_playlists WHERE playlist_id = ?",
+            (playlist_id,)
+        )
+        if not playlist:
+            return "not_found"
+        
+        rows = self.store.read('''
+            SELECT track_id, track_name, artist, duration_ms, cached, failed
+            FROM playlist_tracks
+            WHERE playlist_id = ?
+            ORDER BY id
+        ''', (playlist_id,))
+        
+        completed = sum(1 for row in rows if row[4])
+        failed = sum(1 for row in rows if row[5] and not row[4])
+        tracks = [
+            {
+                'id': row[0],
+                'name': row[1],
+                'artists': [{'name': row[2]}],
+                # Linhas anteriores à coluna duration_ms não têm duração
+                'duration_ms': row[3] or 0
+            }
+            for row in rows if not row[4] and not row[5]
+        ]
+        
+        if not tracks:
+            return "nothing_to_resume"
+        
+        self._set_playlist_status(playlist_id, 'downloading')
+        self._start_worker(playlist_id, playlist[0], tracks, playlist[1], completed, failed, progress_callback)
+        
+        print(f"Resuming playlist {playlist[0]} ({len(tracks)} tracks left)")
+        return "resumed"
+    
+    def retry_failed(
+        self,
+        playlist_id: str,
+        include_permanent: bool = False,
+        progress_callback: Optional[Callable] = None
+    ) -> str:
+        """
+        Baixa de novo só as tracks que falharam (e o que ficou pendente)
+        
+        Args:
+            playlist_id: ID da playlist
+            include_permanent: Também tenta erros permanentes (vídeo removido...)
+        
+        Returns:
+            Status string (como resume_download)
+        """
+        if playlist_id in self.active_downloads:
+            return "already_downloading"
+        
+        self._flush_track_updates()
+        self.store.write('''
+            UPDATE playlist_tracks
+            SET failed = 0, error = NULL, error_class = NULL, attempts = 0
+            WHERE playlist_id = ? AND failed = 1 AND cached = 0
+              AND (? OR error_class IS NULL OR error_class != ?)
+        ''', (playlist_id, include_permanent, RetryPolicy.PERMANENT), wait=True)
+        
+        return self.resume_download(playlist_id, progress_callback)
+    
+    def _start_worker(
+        self,
+        playlist_id: str,
+        name: str,
+        tracks: List[Dict],
+        total: int,
+        completed: int,
+        failed: int,
+        progress_callback: Optional[Callable]
+    ):
+        """
+        Inicializa estado e inicia a thread do download
+        """
+        self.finished_downloads.pop(playlist_id, None)
         self.active_downloads[playlist_id] = {
-            'name': playlist_name,
-            'total': len(tracks),
-            'completed': 0,
-            'failed': 0,
-            'progress': 0,
+            'name': name,
+            'total': total,
+            'completed': completed,
+            'failed': failed,
+            'progress': (completed / total) * 100 if total else 0,
             'status': 'downloading',
             'started_at': time.time()
         }
         
-        self.cancel_flags[playlist_id] = False
+        self._stop_events[playlist_id] = threading.Event()
+        self._emit_progress(playlist_id)
         
         # Iniciar download em thread separada
         thread = threading.Thread(
@@ -126,9 +296,6 @@ class PlaylistManager:
             daemon=True
         )
         thread.start()
-        
-        print(f"Started downloading playlist {playlist_name} ({len(tracks)} tracks)")
-        return "started"
     
     def _download_playlist_worker(
         self,
@@ -139,232 +306,426 @@ class PlaylistManager:
         """
         Worker thread para download de playlist
         """
+        state = self.active_downloads[playlist_id]
+        stop = self._stop_events[playlist_id]
+        status = 'error'
+        
         try:
-            # Filtrar tracks já cacheadas
+            # Filtrar tracks já cacheadas (uma consulta para a playlist inteira)
+            cached_paths = self.cache.get_cached_audio_bulk(track['id'] for track in tracks)
             tracks_to_download = []
             for track in tracks:
-                if self.cancel_flags.get(playlist_id):
-                    break
-                    
-                cached = self.cache.get_cached_audio(track['id'])
+                cached = cached_paths.get(track['id'])
                 if cached:
                     self._mark_track_cached(playlist_id, track['id'], cached)
-                    self.active_downloads[playlist_id]['completed'] += 1
+                    state['completed'] += 1
                 else:
                     tracks_to_download.append(track)
             
             print(f"Need to download {len(tracks_to_download)} tracks (rest already cached)")
             
-            # Download paralelo
-            futures = []
+            # Download paralelo (mesma track em outra playlist ou tocando
+            # agora reaproveita o download em andamento)
+            futures = {}
+            attempts: Dict[str, int] = {}
             for track in tracks_to_download:
-                if self.cancel_flags.get(playlist_id):
+                if stop.is_set():
                     break
-                
-                future = self.executor.submit(
-                    self._download_single_track,
-                    playlist_id,
-                    track
-                )
-                futures.append(future)
+                futures[self._submit_track(playlist_id, track)] = track
             
-            # Esperar conclusão
-            for future in as_completed(futures):
-                if self.cancel_flags.get(playlist_id):
-                    break
+            # Esperar conclusão (acordando para checar pause/cancel)
+            pending = set(futures)
+            while pending and not stop.is_set():
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if not done:
+                    continue
                 
-                try:
-                    success = future.result()
-                    if success:
-                        self.active_downloads[playlist_id]['completed'] += 1
-                    else:
-                        self.active_downloads[playlist_id]['failed'] += 1
-                except Exception as e:
-                    print(f"Download error: {e}")
-                    self.active_downloads[playlist_id]['failed'] += 1
+                for future in done:
+                    track = futures.pop(future)
+                    retry = self._record_result(playlist_id, track, future, attempts)
+                    if retry is not None:
+                        futures[retry] = track
+                        pending.add(retry)
                 
                 # Atualizar progresso
-                total = self.active_downloads[playlist_id]['total']
-                completed = self.active_downloads[playlist_id]['completed']
+                total = state['total']
+                completed = state['completed']
                 progress = (completed / total) * 100
                 
-                self.active_downloads[playlist_id]['progress'] = progress
+                state['progress'] = progress
                 
                 if progress_callback:
                     progress_callback(playlist_id, progress, completed, total)
+                self._emit_progress(playlist_id)
             
             # Finalizar
-            if self.cancel_flags.get(playlist_id):
-                self.active_downloads[playlist_id]['status'] = 'cancelled'
+            if stop.is_set():
+                # Tira da fila o que não começou e interrompe o que está
+                # baixando; essas tracks seguem pendentes no checkpoint
+                stopped = [
+                    future for future in pending
+                    if self.scheduler.cancel(
+                        futures[future]['id'],
+                        only_priority=DownloadScheduler.BATCH,
+                        owner=playlist_id
+                    )
+                ]
+                
+                # Só termina (e libera o resume) quando os downloads
+                # interrompidos pararam de escrever nos arquivos
+                _, still_running = wait(stopped, timeout=self.STOP_WAIT_SECONDS)
+                if still_running:
+                    print(f"Playlist {playlist_id}: {len(still_running)} downloads still stopping")
+                status = 'paused' if state['status'] == 'pausing' else 'cancelled'
             else:
-                self.active_downloads[playlist_id]['status'] = 'completed'
-                self._mark_playlist_completed(playlist_id)
+                status = 'completed'
             
-            print(f"Playlist {playlist_id} download finished")
+            print(f"Playlist {playlist_id} download {status}")
             
         except Exception as e:
             print(f"Playlist download error: {e}")
-            self.active_downloads[playlist_id]['status'] = 'error'
+        
+        self._finish_download(playlist_id, status)
+    
+    def _submit_track(self, playlist_id: str, track: Dict, not_before: float = 0):
+        return self.scheduler.submit(
+            track['id'],
+            lambda cancel_event: self._download_single_track(track, cancel_event),
+            DownloadScheduler.BATCH,
+            owner=playlist_id,
+            not_before=not_before
+        )
     
-    def _download_single_track(self, playlist_id: str, track: Dict) -> bool:
+    def _record_result(self, playlist_id: str, track: Dict, future, attempts: Dict[str, int]):
         """
-        Baixa uma única track
+        Registra o resultado do download de uma track
         
         Returns:
-            True se sucesso, False se falhou
+            Future da nova tentativa, se a RetryPolicy mandou repetir
         """
+        state = self.active_downloads[playlist_id]
+        track_id = track['id']
+        
         try:
-            track_id = track['id']
-            
-            # Verificar se já está em cache
-            cached = self.cache.get_cached_audio(track_id)
-            if cached:
-                self._mark_track_cached(playlist_id, track_id, cached)
-                return True
-            
-            # Matching YouTube
-            yt_url = self.matcher.spotify_to_youtube(
-                track['name'],
-                track['artists'][0]['name'],
-                track['duration_ms']
-            )
-            
-            if not yt_url:
-                self._mark_track_failed(playlist_id, track_id, "YouTube match not found")
-                return False
+            file_path = future.result()
+        except (CancelledError, DownloadCancelled):
+            # Continua pendente (retomada por resume_download)
+            return None
+        except Exception as e:
+            attempt = attempts.get(track_id, 0) + 1
+            attempts[track_id] = attempt
+            error_class, delay = self.retry_policy.on_failure(e, attempt)
             
-            # Download
-            file_path = self.cache.download_and_cache(yt_url, track_id)
+            if delay is not None:
+                print(f"Track download error ({error_class}, attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                return self._submit_track(playlist_id, track, not_before=time.time() + delay)
             
-            if file_path:
-                self._mark_track_cached(playlist_id, track_id, file_path)
-                return True
-            else:
-                self._mark_track_failed(playlist_id, track_id, "Download failed")
-                return False
-                
-        except Exception as e:
-            print(f"Track download error: {e}")
-            self._mark_track_failed(playlist_id, track.get('id', 'unknown'), str(e))
-            return False
+            print(f"Track download error ({error_class}): {e}")
+            self._mark_track_failed(playlist_id, track_id, str(e), error_class, attempt)
+            state['failed'] += 1
+            return None
+        
+        self.retry_policy.on_success()
+        self._mark_track_cached(playlist_id, track_id, file_path, attempts.get(track_id, 0) + 1)
+        state['completed'] += 1
+        return None
+    
+    def _finish_download(self, playlist_id: str, status: str):
+        """
+        Grava o status final e move a playlist para finished_downloads
+        """
+        if status == 'completed':
+            self._mark_playlist_completed(playlist_id)
+        else:
+            self._set_playlist_status(playlist_id, status)
+        
+        state = self.active_downloads[playlist_id]
+        state['status'] = status
+        state['finished_at'] = time.time()
+        
+        self.finished_downloads[playlist_id] = state
+        self.active_downloads.pop(playlist_id, None)
+        self._stop_events.pop(playlist_id, None)
+        
+        self._emit_progress(playlist_id)
+    
+    def add_progress_listener(self, listener: Callable[[str, Dict], None]):
+        """
+        Registra função chamada com (playlist_id, estado) a cada música
+        concluída e no fim do download de qualquer playlist
+        """
+        self._progress_listeners.append(listener)
+    
+    def _emit_progress(self, playlist_id: str):
+        state = self.active_downloads.get(playlist_id) or self.finished_downloads.get(playlist_id)
+        if state is None:
+            return
+        
+        snapshot = dict(state)
+        for listener in self._progress_listeners:
+            try:
+                listener(playlist_id, snapshot)
+            except Exception as e:
+                print(f"Progress listener error: {e}")
+    
+    def _download_single_track(self, track: Dict, cancel_event: threading.Event) -> str:
+        """
+        Baixa uma única track (roda em um worker do DownloadScheduler)
+        
+        Returns:
+            Caminho do arquivo
+        
+        Raises:
+            DownloadCancelled: Playlist pausada/cancelada durante o download
+            NoMatchError: Busca no YouTube não achou match
+            MatchSearchError: Busca no YouTube falhou (classificada pela RetryPolicy)
+            RuntimeError: Download falhou
+        """
+        track_id = track['id']
+        
+        # Verificar se já está em cache
+        cached = self.cache.get_cached_audio(track_id)
+        if cached:
+            return cached
+        
+        # Matching YouTube
+        yt_url = self.matcher.spotify_to_youtube(
+            track['name'],
+            track['artists'][0]['name'],
+            track['duration_ms'],
+            spotify_id=track_id,
+            raise_on_error=True
+        )
+        
+        if not yt_url:
+            raise NoMatchError("YouTube match not found")
+        
+        if cancel_event.is_set():
+            raise DownloadCancelled("Download cancelled")
+        
+        # Download
+        file_path = self.cache.download_and_cache(yt_url, track_id, cancel_event)
+        
+        if not file_path:
+            raise RuntimeError("Download failed")
+        
+        return file_path
     
     def _register_playlist(self, playlist_id: str, name: str, tracks: List[Dict]):
         """
-        Registra playlist no database
-        """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Playlist
-        cursor.execute('''
-            INSERT OR REPLACE INTO cached_playlists 
-            (playlist_id, name, total_tracks, cached_tracks, started_at, status, metadata)
-            VALUES (?, ?, ?, 0, ?, 'downloading', ?)
-        ''', (
-            playlist_id,
-            name,
-            len(tracks),
-            datetime.now().isoformat(),
-            json.dumps({'tracks': len(tracks)})
-        ))
-        
-        # Tracks
-        for track in tracks:
-            cursor.execute('''
-                INSERT OR IGNORE INTO playlist_tracks
-                (playlist_id, track_id, track_name, artist)
-                VALUES (?, ?, ?, ?)
-            ''', (
+        Registra playlist no database (uma transação)
+        """
+        rows = [
+            (
                 playlist_id,
                 track['id'],
                 track['name'],
-                track['artists'][0]['name'] if track.get('artists') else 'Unknown'
+                track['artists'][0]['name'] if track.get('artists') else 'Unknown',
+                track.get('duration_ms')
+            )
+            for track in tracks
+        ]
+        
+        def register(conn):
+            conn.execute('''
+                INSERT OR REPLACE INTO cached_playlists 
+                (playlist_id, name, total_tracks, cached_tracks, started_at, status, metadata)
+                VALUES (?, ?, ?, 0, ?, 'downloading', ?)
+            ''', (
+                playlist_id,
+                name,
+                len(tracks),
+                datetime.now().isoformat(),
+                json.dumps({'tracks': len(tracks)})
             ))
+            
+            # Novo download: falhas da execução anterior voltam a ser pendentes
+            conn.executemany('''
+                INSERT INTO playlist_tracks
+                (playlist_id, track_id, track_name, artist, duration_ms)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(playlist_id, track_id) DO UPDATE SET
+                    duration_ms = excluded.duration_ms,
+                    failed = 0,
+                    error = NULL,
+                    error_class = NULL,
+                    attempts = 0
+            ''', rows)
+            
+            # Re-sync: tracks já cacheadas de um download anterior. Contagem
+            # feita uma vez aqui; depois o contador só é incrementado.
+            conn.execute('''
+                UPDATE cached_playlists
+                SET cached_tracks = (
+                    SELECT COUNT(*) FROM playlist_tracks
+                    WHERE playlist_id = ? AND cached = 1
+                )
+                WHERE playlist_id = ?
+            ''', (playlist_id, playlist_id))
         
-        conn.commit()
-        conn.close()
+        self.store.transaction(register, wait=True)
+    
+    # ========== STATUS DAS TRACKS (EM LOTE) ==========
     
-    def _mark_track_cached(self, playlist_id: str, track_id: str, file_path: str):
+    def _mark_track_cached(self, playlist_id: str, track_id: str, file_path: str, attempts: int = 0):
         """
-        Marca track como cacheada
+        Marca track como cacheada (gravado no próximo flush)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE playlist_tracks
-            SET cached = 1, file_path = ?
-            WHERE playlist_id = ? AND track_id = ?
-        ''', (file_path, playlist_id, track_id))
-        
-        # Atualizar contagem na playlist
-        cursor.execute('''
-            UPDATE cached_playlists
-            SET cached_tracks = (
-                SELECT COUNT(*) FROM playlist_tracks
-                WHERE playlist_id = ? AND cached = 1
-            )
-            WHERE playlist_id = ?
-        ''', (playlist_id, playlist_id))
+        self._queue_track_update(playlist_id, track_id, (True, file_path, None, None, attempts))
+    
+    def _mark_track_failed(
+        self,
+        playlist_id: str,
+        track_id: str,
+        error: str,
+        error_class: Optional[str] = None,
+        attempts: int = 1
+    ):
+        """
+        Marca track como falhou (gravado no próximo flush)
+        """
+        self._queue_track_update(playlist_id, track_id, (False, None, error, error_class, attempts))
+    
+    def _queue_track_update(self, playlist_id: str, track_id: str, update: Tuple):
+        with self._pending_lock:
+            self._pending_tracks[(playlist_id, track_id)] = update
+            full = len(self._pending_tracks) >= self.FLUSH_BATCH
         
-        conn.commit()
-        conn.close()
+        if full:
+            self._flush_requested.set()
     
-    def _mark_track_failed(self, playlist_id: str, track_id: str, error: str):
+    def _flush_loop(self):
+        while not self._closed:
+            self._flush_requested.wait(self.FLUSH_INTERVAL)
+            self._flush_requested.clear()
+            
+            try:
+                self._flush_track_updates()
+            except Exception as e:
+                print(f"Playlist bookkeeping error: {e}")
+    
+    def _flush_track_updates(self, wait: bool = False):
         """
-        Marca track como falhou
+        Grava mudanças de status pendentes em uma transação
+        
+        cached_tracks é incrementado só pelas tracks que passaram de não
+        cacheada para cacheada, sem recontar playlist_tracks.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._pending_lock:
+            pending = self._pending_tracks
+            self._pending_tracks = {}
         
-        cursor.execute('''
-            UPDATE playlist_tracks
-            SET failed = 1, error = ?
-            WHERE playlist_id = ? AND track_id = ?
-        ''', (error, playlist_id, track_id))
+        if not pending:
+            if wait:
+                self.store.flush()
+            return
+        
+        def apply(conn):
+            newly_cached: Dict[str, int] = {}
+            
+            for (playlist_id, track_id), (cached, file_path, error, error_class, attempts) in pending.items():
+                if cached:
+                    changed = conn.execute('''
+                        UPDATE playlist_tracks
+                        SET cached = 1, file_path = ?, failed = 0, error = NULL,
+                            error_class = NULL, attempts = ?
+                        WHERE playlist_id = ? AND track_id = ? AND cached = 0
+                    ''', (file_path, attempts, playlist_id, track_id)).rowcount
+                    
+                    if changed:
+                        newly_cached[playlist_id] = newly_cached.get(playlist_id, 0) + changed
+                    else:
+                        conn.execute('''
+                            UPDATE playlist_tracks SET file_path = ?
+                            WHERE playlist_id = ? AND track_id = ?
+                        ''', (file_path, playlist_id, track_id))
+                else:
+                    conn.execute('''
+                        UPDATE playlist_tracks
+                        SET failed = 1, error = ?, error_class = ?, attempts = ?
+                        WHERE playlist_id = ? AND track_id = ?
+                    ''', (error, error_class, attempts, playlist_id, track_id))
+            
+            conn.executemany('''
+                UPDATE cached_playlists
+                SET cached_tracks = cached_tracks + ?
+                WHERE playlist_id = ?
+            ''', [(count, playlist_id) for playlist_id, count in newly_cached.items()])
         
-        conn.commit()
-        conn.close()
+        self.store.transaction(apply, wait=wait)
     
     def _mark_playlist_completed(self, playlist_id: str):
         """
         Marca playlist como completa
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        # Status pendentes entram antes (writer é FIFO)
+        self._flush_track_updates()
+        self.store.write('''
             UPDATE cached_playlists
             SET completed_at = ?, status = 'completed'
             WHERE playlist_id = ?
         ''', (datetime.now().isoformat(), playlist_id))
-        
-        conn.commit()
-        conn.close()
+    
+    def _set_playlist_status(self, playlist_id: str, status: str):
+        """
+        Atualiza status da playlist (paused, cancelled, downloading, ...)
+        """
+        self._flush_track_updates()
+        self.store.write('''
+            UPDATE cached_playlists
+            SET status = ?, completed_at = NULL
+            WHERE playlist_id = ?
+        ''', (status, playlist_id))
     
     def get_progress(self, playlist_id: str) -> Optional[Dict]:
         """
-        Retorna progresso de download de playlist
+        Retorna progresso de download de playlist (ativo ou o último que terminou)
         
         Returns:
             Dict com status, progress, completed, total, failed
         """
-        return self.active_downloads.get(playlist_id)
+        return self.active_downloads.get(playlist_id) or self.finished_downloads.get(playlist_id)
     
     def cancel_download(self, playlist_id: str) -> bool:
         """
         Cancela download de playlist
         
+        Tracks na fila saem do scheduler e downloads em andamento são
+        interrompidos; o que faltou pode ser retomado com resume_download.
+        
         Returns:
             True se cancelado, False se não estava baixando
         """
-        if playlist_id not in self.active_downloads:
+        if not self._request_stop(playlist_id, 'cancelling'):
             return False
         
-        self.cancel_flags[playlist_id] = True
         print(f"Cancelling download of playlist {playlist_id}")
         return True
     
+    def pause_download(self, playlist_id: str) -> bool:
+        """
+        Pausa download de playlist (retomar com resume_download)
+        
+        Returns:
+            True se pausado, False se não estava baixando
+        """
+        if not self._request_stop(playlist_id, 'pausing'):
+            return False
+        
+        print(f"Pausing download of playlist {playlist_id}")
+        return True
+    
+    def _request_stop(self, playlist_id: str, status: str) -> bool:
+        state = self.active_downloads.get(playlist_id)
+        stop = self._stop_events.get(playlist_id)
+        if state is None or stop is None or state['status'] != 'downloading':
+            return False
+        
+        state['status'] = status
+        stop.set()
+        self._emit_progress(playlist_id)
+        return True
+    
     def get_cached_playlists(self) -> List[Dict]:
         """
         Retorna lista de playlists cacheadas
@@ -372,19 +733,15 @@ class PlaylistManager:
         Returns:
             Lista de dicts com info das playlists
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._flush_track_updates(wait=True)
         
-        cursor.execute('''
+        rows = self.store.read('''
             SELECT playlist_id, name, total_tracks, cached_tracks, 
                    started_at, completed_at, status
             FROM cached_playlists
             ORDER BY started_at DESC
         ''')
         
-        rows = cursor.fetchall()
-        conn.close()
-        
         playlists = []
         for row in rows:
             playlists.append({
@@ -407,18 +764,15 @@ class PlaylistManager:
         Returns:
             Lista de tracks com status de cache
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._flush_track_updates(wait=True)
         
-        cursor.execute('''
-            SELECT track_id, track_name, artist, cached, file_path, failed, error
+        rows = self.store.read('''
+            SELECT track_id, track_name, artist, cached, file_path, failed, error,
+                   error_class, attempts
             FROM playlist_tracks
             WHERE playlist_id = ?
         ''', (playlist_id,))
         
-        rows = cursor.fetchall()
-        conn.close()
-        
         tracks = []
         for row in rows:
             tracks.append({
@@ -428,15 +782,43 @@ class PlaylistManager:
                 'cached': bool(row[3]),
                 'file_path': row[4],
                 'failed': bool(row[5]),
-                'error': row[6]
+                'error': row[6],
+                'error_class': row[7],
+                'attempts': row[8] or 0
             })
         
         return tracks
     
+    def get_cached_track_ids(self) -> List[str]:
+        """
+        Retorna IDs das tracks cacheadas de todas as playlists
+        
+        Usado como fonte de pinning do AudioCache
+        """
+        self._flush_track_updates(wait=True)
+        
+        rows = self.store.read('''
+            SELECT DISTINCT track_id FROM playlist_tracks WHERE cached = 1
+        ''')
+        
+        return [row[0] for row in rows]
+    
+    def close(self):
+        """
+        Grava status pendentes e fecha o banco
+        """
+        if self._closed:
+            return
+        
+        self._closed = True
+        self._flush_requested.set()
+        self._flush_track_updates()
+        self.store.close()
+    
     def __del__(self):
         """
         Cleanup ao destruir objeto
         """
-        if hasattr(self, 'executor'):
-            self.executor.shutdown(wait=False)
-            print("PlaylistManager shutdown")
\ No newline at end of file
+        if hasattr(self, '_flush_thread'):
+            self.close()
+            print("PlaylistManager shutdown")
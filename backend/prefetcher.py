@@ -0,0 +1,211 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, Optional
+
+from download_scheduler import DownloadScheduler
+
+class QueuePrefetcher:
+    """
+    Pré-carrega as próximas músicas da fila em background
+
+    Observa a fila do AudioPlayer (queue, queue_index, shuffle, repeat) e
+    aquece as próximas N músicas: metadata do Spotify, match no YouTube e
+    download para o AudioCache. Assim a troca de faixa encontra o cache
+    quente.
+
+    - Quando a fila muda, o trabalho pendente da versão antiga é descartado
+    - Cede banda: downloads entram no DownloadScheduler com prioridade
+      prefetch (atrás de play, à frente de batches de playlist)
+    """
+
+    def __init__(
+        self,
+        player,
+        music_matcher,
+        audio_cache,
+        track_loader: Callable[[str], Dict],
+        depth: int = 2,
+        max_tracks_cached: int = 500,
+        scheduler: Optional[DownloadScheduler] = None
+    ):
+        """
+        Args:
+            player: Instância de AudioPlayer
+            music_matcher: Instância de MusicMatcher
+            audio_cache: Instância de AudioCache
+            track_loader: Função que busca metadata no Spotify (ex: sp.track)
+            depth: Quantas músicas à frente pré-carregar
+            max_tracks_cached: Tamanho do cache de metadata em memória
+            scheduler: Fila de downloads (default: a do AudioCache)
+        """
+        self.player = player
+        self.matcher = music_matcher
+        self.cache = audio_cache
+        self.track_loader = track_loader
+        self.depth = depth
+        self.max_tracks_cached = max_tracks_cached
+        self.scheduler = scheduler or audio_cache.scheduler
+
+        # Metadata do Spotify (LRU em memória)
+        self._tracks: "OrderedDict[str, Dict]" = OrderedDict()
+        self._tracks_lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running = False
+
+        # Estatísticas
+        self.prefetched = 0
+        self.cancelled = 0
+        self.current: Optional[str] = None
+
+        player.add_queue_listener(self.notify_queue_changed)
+
+    def start(self):
+        """
+        Inicia thread de prefetch
+        """
+        if self.running:
+            return
+
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+        # Fila pode já ter itens
+        self._wake.set()
+
+    def stop(self):
+        """
+        Para thread de prefetch
+        """
+        self.running = False
+        self._wake.set()
+
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def notify_queue_changed(self):
+        """
+        Chamado pelo AudioPlayer quando a fila muda
+        """
+        self._wake.set()
+
+    def get_track(self, track_id: str) -> Dict:
+        """
+        Retorna metadata do Spotify, usando o cache em memória
+        """
+        with self._tracks_lock:
+            track = self._tracks.get(track_id)
+            if track is not None:
+                self._tracks.move_to_end(track_id)
+                return track
+
+        track = self.track_loader(track_id)
+
+        with self._tracks_lock:
+            self._tracks[track_id] = track
+            while len(self._tracks) > self.max_tracks_cached:
+                self._tracks.popitem(last=False)
+
+        return track
+
+    def _loop(self):
+        while self.running:
+            self._wake.wait()
+            self._wake.clear()
+
+            if not self.running:
+                break
+
+            version = self.player.queue_version
+            upcoming = self.player.peek_upcoming(self.depth)
+
+            for track_id in upcoming:
+                if self._is_stale(version):
+                    break
+
+                try:
+                    self._prefetch(track_id, version)
+                except Exception as e:
+                    print(f"Prefetch error ({track_id}): {e}")
+
+            self.current = None
+
+    def _is_stale(self, version: int) -> bool:
+        """
+        True se a fila mudou desde que o trabalho foi planejado
+        """
+        return not self.running or self.player.queue_version != version
+
+    def _wait_for_download(self, track_id: str, future: Future, version: int) -> bool:
+        """
+        Espera o download agendado terminar
+
+        Se a fila muda antes do job começar, ele sai da fila do scheduler
+        (a não ser que um play o tenha promovido).
+
+        Returns:
+            False se a fila mudou enquanto esperava
+        """
+        while not wait([future], timeout=0.5).done:
+            if self._is_stale(version):
+                # Job já rodando (ou promovido por um play) continua: só conta
+                # o que de fato saiu da fila
+                if self.scheduler.cancel(track_id, only_priority=DownloadScheduler.PREFETCH, interrupt=False):
+                    self.cancelled += 1
+                return False
+
+        # Propaga erro do download
+        future.result()
+        return True
+
+    def _prefetch(self, track_id: str, version: int):
+        if self.cache.get_cached_audio(track_id):
+            return
+
+        self.current = track_id
+        track = self.get_track(track_id)
+
+        if self._is_stale(version):
+            self.cancelled += 1
+            return
+
+        youtube_url = self.matcher.spotify_to_youtube(
+            track['name'],
+            track['artists'][0]['name'],
+            track['duration_ms'],
+            spotify_id=track_id
+        )
+
+        if not youtube_url:
+            return
+
+        if self._is_stale(version):
+            self.cancelled += 1
+            return
+
+        future = self.scheduler.submit(
+            track_id,
+            lambda cancel_event: self.cache.download_and_cache(youtube_url, track_id, cancel_event),
+            DownloadScheduler.PREFETCH
+        )
+        if not self._wait_for_download(track_id, future, version):
+            return
+
+        self.prefetched += 1
+        print(f"⏩ Prefetched: {track['name']}")
+
+    def get_status(self) -> Dict:
+        """
+        Retorna estado do prefetcher
+        """
+        return {
+            'running': self.running,
+            'depth': self.depth,
+            'current': self.current,
+            'upcoming': self.player.peek_upcoming(self.depth),
+            'prefetched': self.prefetched,
+            'cancelled': self.cancelled
+        }
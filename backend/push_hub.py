@@ -0,0 +1,215 @@
+import asyncio
+from typing import Any, Callable, Dict, Optional, Set
+
+class Subscriber:
+    """
+    Cliente conectado ao canal de push
+    """
+
+    def __init__(self, topics: Set[str], position_hz: float, max_queue: int = 256):
+        self.topics = topics
+        self.position_hz = position_hz
+        self.queue: "asyncio.Queue[Dict]" = asyncio.Queue(maxsize=max_queue)
+
+    def offer(self, message: Dict):
+        """
+        Enfileira mensagem; se o cliente está lento descarta a mais antiga
+        """
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(message)
+
+class PushHub:
+    """
+    Canal de push (WebSocket) para status do player, posição e progresso de downloads
+
+    - status: diffs do estado do player, amostrado uma vez por tick para
+      todos os clientes (em vez de cada cliente fazer polling em /status)
+    - position: posição/duração no ritmo pedido por cada cliente
+    - downloads / playlists: eventos de progresso publicados por
+      AudioCache e PlaylistManager (de qualquer thread)
+    """
+
+    TOPICS = ('status', 'position', 'downloads', 'playlists')
+
+    def __init__(
+        self,
+        status_provider: Callable[[], Dict],
+        position_provider: Callable[[], Dict],
+        status_interval: float = 0.25,
+        max_position_hz: float = 20
+    ):
+        """
+        Args:
+            status_provider: Retorna estado do player (sem posição)
+            position_provider: Retorna {'position', 'duration'}
+            status_interval: Intervalo de amostragem do status (segundos)
+            max_position_hz: Taxa máxima de ticks de posição por cliente
+        """
+        self.status_provider = status_provider
+        self.position_provider = position_provider
+        self.status_interval = status_interval
+        self.max_position_hz = max_position_hz
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: Set[Subscriber] = set()
+
+        self._last_status: Dict = {}
+        self._latest_position: Dict = {}
+        self._status_poke: Optional[asyncio.Event] = None
+        self._tasks = []
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Inicia tarefas de amostragem no event loop do servidor
+        """
+        self.loop = loop
+        self._status_poke = asyncio.Event()
+        self._tasks = [
+            loop.create_task(self._status_loop()),
+            loop.create_task(self._position_loop())
+        ]
+
+    # ========== PUBLICAÇÃO ==========
+
+    def publish(self, topic: str, data: Any):
+        """
+        Publica evento para os inscritos no tópico (thread-safe)
+        """
+        if not self.loop or not self.subscribers:
+            return
+
+        message = {'type': topic, 'data': data}
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            self._broadcast(topic, message)
+        else:
+            self.loop.call_soon_threadsafe(self._broadcast, topic, message)
+
+    def poke_status(self):
+        """
+        Pede amostragem imediata do status (ex: troca de faixa) - thread-safe
+        """
+        if self.loop and self._status_poke:
+            self.loop.call_soon_threadsafe(self._status_poke.set)
+
+    def _broadcast(self, topic: str, message: Dict):
+        for subscriber in list(self.subscribers):
+            if topic in subscriber.topics:
+                subscriber.offer(message)
+
+    # ========== AMOSTRAGEM ==========
+
+    async def _status_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._status_poke.wait(), self.status_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._status_poke.clear()
+
+            if not any('status' in s.topics for s in self.subscribers):
+                continue
+
+            try:
+                status = self.status_provider()
+            except Exception as e:
+                print(f"Push status error: {e}")
+                continue
+
+            diff = {k: v for k, v in status.items() if self._last_status.get(k) != v}
+            if diff:
+                self._last_status = status
+                self._broadcast('status', {'type': 'status', 'data': diff})
+
+    async def _position_loop(self):
+        """
+        Lê a posição do player uma vez por tick, na maior taxa pedida
+        """
+        while True:
+            watchers = [s for s in self.subscribers if 'position' in s.topics]
+            if not watchers:
+                await asyncio.sleep(0.5)
+                continue
+
+            hz = min(self.max_position_hz, max(s.position_hz for s in watchers))
+            try:
+                self._latest_position = self.position_provider()
+            except Exception as e:
+                print(f"Push position error: {e}")
+            await asyncio.sleep(1 / hz)
+
+    # ========== CONEXÕES ==========
+
+    def subscribe(self, topics=None, position_hz: float = 1) -> Subscriber:
+        subscriber = Subscriber(set(topics or self.TOPICS), self._clamp_hz(position_hz))
+        self.subscribers.add(subscriber)
+
+        # Snapshot completo para o cliente novo
+        if 'status' in subscriber.topics and self._last_status:
+            subscriber.offer({'type': 'status', 'data': self._last_status, 'full': True})
+
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def _clamp_hz(self, hz) -> float:
+        try:
+            return max(0.1, min(self.max_position_hz, float(hz)))
+        except (TypeError, ValueError):
+            return 1
+
+    async def serve(self, websocket):
+        """
+        Atende um WebSocket já aceito até desconectar
+
+        Mensagens do cliente (JSON):
+            {"subscribe": ["status", "position"], "position_hz": 4}
+        """
+        subscriber = self.subscribe()
+
+        async def receive():
+            while True:
+                message = await websocket.receive_json()
+                if 'subscribe' in message:
+                    topics = set(message['subscribe']) & set(self.TOPICS)
+                    subscriber.topics = topics
+                    if 'status' in topics and self._last_status:
+                        subscriber.offer({'type': 'status', 'data': self._last_status, 'full': True})
+                if 'position_hz' in message:
+                    subscriber.position_hz = self._clamp_hz(message['position_hz'])
+
+        async def send():
+            while True:
+                message = await subscriber.queue.get()
+                await websocket.send_json(message)
+
+        async def send_position():
+            while True:
+                await asyncio.sleep(1 / subscriber.position_hz)
+                if 'position' in subscriber.topics and self._latest_position:
+                    await websocket.send_json({'type': 'position', 'data': self._latest_position})
+
+        tasks = [asyncio.ensure_future(t()) for t in (receive, send, send_position)]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.unsubscribe(subscriber)
+            for task in tasks:
+                task.cancel()
+
+            # Espera as tasks terminarem e registra por que o cliente caiu
+            # (desconexão, erro de envio...) em vez de perder a exceção
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, BaseException) and not isinstance(result, asyncio.CancelledError):
+                    print(f"Push client closed: {type(result).__name__}: {result}")
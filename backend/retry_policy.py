@@ -0,0 +1,227 @@
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+class NoMatchError(RuntimeError):
+    """
+    Nenhum vídeo do YouTube corresponde à música
+    """
+
+class CircuitBreaker:
+    """
+    Disjuntor global para rate limiting do YouTube
+
+    threshold erros de rate limit dentro de window segundos abrem o
+    disjuntor por cooldown segundos. Cada nova abertura seguida dobra o
+    cooldown (até max_cooldown); sucesso sem erros recentes volta ao
+    cooldown base.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 3,
+        window: float = 60,
+        cooldown: float = 60,
+        max_cooldown: float = 900
+    ):
+        """
+        Args:
+            threshold: Erros de rate limit que abrem o disjuntor
+            window: Janela de contagem dos erros (segundos)
+            cooldown: Tempo aberto na primeira abertura (segundos)
+            max_cooldown: Tempo aberto máximo (segundos)
+        """
+        self.threshold = threshold
+        self.window = window
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+        self._cooldown = cooldown
+        self._failures: List[float] = []
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[float], None]] = []
+
+        # Estatísticas
+        self.trips = 0
+
+    def add_listener(self, listener: Callable[[float], None]):
+        """
+        Registra função chamada com o timestamp de reabertura quando o disjuntor abre
+        """
+        self._listeners.append(listener)
+
+    def record_failure(self):
+        now = time.time()
+
+        with self._lock:
+            self._failures = [t for t in self._failures if now - t < self.window]
+            self._failures.append(now)
+
+            if len(self._failures) < self.threshold or now < self._open_until:
+                return
+
+            self._open_until = now + self._cooldown
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+            self._failures = []
+            self.trips += 1
+            until = self._open_until
+
+        print(f"⛔ Rate limited: holding background downloads for {until - now:.0f}s")
+        for listener in self._listeners:
+            try:
+                listener(until)
+            except Exception as e:
+                print(f"Circuit breaker listener error: {e}")
+
+    def record_success(self):
+        """
+        Sucesso com o disjuntor fechado e sem erros recentes zera a escalada
+        do cooldown (sucessos esparsos não escondem um throttling em curso)
+        """
+        now = time.time()
+        with self._lock:
+            if now < self._open_until:
+                return
+            self._failures = [t for t in self._failures if now - t < self.window]
+            if not self._failures:
+                self._cooldown = self.base_cooldown
+
+    def remaining(self) -> float:
+        """
+        Segundos até o disjuntor fechar (0 se fechado)
+        """
+        return max(0.0, self._open_until - time.time())
+
+    def get_state(self) -> Dict:
+        with self._lock:
+            return {
+                'open': time.time() < self._open_until,
+                'remaining': max(0.0, self._open_until - time.time()),
+                'recent_failures': len(self._failures),
+                'next_cooldown': self._cooldown,
+                'trips': self.trips
+            }
+
+class RetryPolicy:
+    """
+    Decide se e quando repetir um download que falhou
+
+    Classes de erro:
+    - no_match: matching não achou vídeo (não repete no mesmo batch)
+    - permanent: vídeo indisponível, privado, removido... (não repete)
+    - rate_limited: YouTube limitando (429, "confirm you're not a bot");
+      alimenta o CircuitBreaker e espera no mínimo até ele fechar
+    - transient: rede, timeouts, 5xx e erros desconhecidos
+
+    Espera entre tentativas: backoff exponencial com jitter
+    (metade fixa + metade aleatória de base * 2^(tentativa-1), até max).
+    """
+
+    NO_MATCH = 'no_match'
+    PERMANENT = 'permanent'
+    RATE_LIMITED = 'rate_limited'
+    TRANSIENT = 'transient'
+
+    # classe → (máximo de tentativas, espera base, espera máxima) em segundos
+    DEFAULT_RULES = {
+        NO_MATCH: (1, 0, 0),
+        PERMANENT: (1, 0, 0),
+        RATE_LIMITED: (5, 30, 900),
+        TRANSIENT: (4, 2, 60),
+    }
+
+    RATE_LIMIT_PATTERNS = re.compile(
+        r"\b429\b|too many requests|rate.?limit|not a bot|confirm you.re not|try again later",
+        re.IGNORECASE
+    )
+    PERMANENT_PATTERNS = re.compile(
+        r"video unavailable|private video|has been removed|copyright|"
+        r"not available in your country|members.only|account .* terminated|"
+        r"unsupported url|is not a valid url|http error 404|confirm your age",
+        re.IGNORECASE
+    )
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, Tuple[int, float, float]]] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        scheduler=None
+    ):
+        """
+        Args:
+            rules: Sobrescreve DEFAULT_RULES por classe
+            breaker: Disjuntor compartilhado (cria um próprio se None)
+            scheduler: DownloadScheduler; com o disjuntor aberto, prefetch e
+                batch ficam retidos (play do usuário continua)
+        """
+        self.rules = dict(self.DEFAULT_RULES)
+        self.rules.update(rules or {})
+        self.breaker = breaker or CircuitBreaker()
+
+        if scheduler is not None:
+            self.breaker.add_listener(
+                lambda until: scheduler.hold(until, (scheduler.PREFETCH, scheduler.BATCH))
+            )
+
+    def classify(self, error: BaseException) -> str:
+        """
+        Classifica uma exceção de matching/download
+        """
+        if isinstance(error, NoMatchError):
+            return self.NO_MATCH
+
+        message = f"{type(error).__name__}: {error}"
+        if self.RATE_LIMIT_PATTERNS.search(message):
+            return self.RATE_LIMITED
+        if self.PERMANENT_PATTERNS.search(message):
+            return self.PERMANENT
+        return self.TRANSIENT
+
+    def backoff(self, error_class: str, attempt: int) -> float:
+        """
+        Espera antes da próxima tentativa (attempt = tentativas já feitas)
+        """
+        _, base, maximum = self.rules[error_class]
+        delay = min(maximum, base * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def on_failure(self, error: BaseException, attempt: int) -> Tuple[str, Optional[float]]:
+        """
+        Registra a falha e decide a próxima tentativa
+
+        Args:
+            error: Exceção da tentativa
+            attempt: Tentativas já feitas (incluindo esta)
+
+        Returns:
+            (classe do erro, espera em segundos ou None para desistir)
+        """
+        error_class = self.classify(error)
+
+        if error_class == self.RATE_LIMITED:
+            self.breaker.record_failure()
+
+        max_attempts = self.rules[error_class][0]
+        if attempt >= max_attempts:
+            return error_class, None
+
+        delay = self.backoff(error_class, attempt)
+        if error_class == self.RATE_LIMITED:
+            delay = max(delay, self.breaker.remaining())
+
+        return error_class, delay
+
+    def on_success(self):
+        self.breaker.record_success()
+
+    def get_state(self) -> Dict:
+        return {
+            'rules': {
+                name: {'max_attempts': rule[0], 'base_delay': rule[1], 'max_delay': rule[2]}
+                for name, rule in self.rules.items()
+            },
+            'circuit_breaker': self.breaker.get_state()
+        }
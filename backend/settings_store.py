@@ -0,0 +1,180 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class SettingsStore:
+    """
+    Arquivo JSON de configurações com perfis, escrito em background
+
+    - O estado em memória é a fonte da verdade; set() só marca como sujo
+    - Várias mudanças dentro de debounce segundos viram uma única escrita
+    - Escrita atômica: arquivo temporário + fsync + os.replace
+    - Vários perfis (usuário/dispositivo) no mesmo arquivo:
+      {"version": 2, "profiles": {"default": {...}, "phone": {...}}}
+
+    Arquivos antigos (um dict plano) são lidos como o perfil default.
+    """
+
+    FORMAT_VERSION = 2
+
+    # Espera máxima entre novas tentativas de uma escrita que falhou (segundos)
+    MAX_RETRY_DELAY = 30.0
+
+    def __init__(self, path: str, debounce: float = 0.5, default_profile: str = 'default'):
+        """
+        Args:
+            path: Caminho do arquivo JSON
+            debounce: Espera antes de gravar, agrupando mudanças (segundos)
+            default_profile: Perfil usado por arquivos no formato antigo
+        """
+        self.path = path
+        self.debounce = debounce
+        self.default_profile = default_profile
+
+        self._profiles: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._pending = False
+        self._dirty = threading.Event()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._failures = 0  # Escritas seguidas que falharam (backoff)
+
+        self._load()
+
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+        # Garante a última escrita ao encerrar o processo
+        atexit.register(self.flush)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading settings from {self.path}: {e}")
+            return
+
+        if isinstance(data, dict) and isinstance(data.get('profiles'), dict):
+            self._profiles = data['profiles']
+        elif isinstance(data, dict):
+            # Formato antigo: configurações direto na raiz
+            self._profiles = {self.default_profile: data}
+
+    # ========== LEITURA/ESCRITA EM MEMÓRIA ==========
+
+    def get(self, profile: Optional[str] = None) -> Optional[Dict]:
+        """
+        Retorna cópia das configurações do perfil (None se não existe)
+        """
+        with self._lock:
+            settings = self._profiles.get(profile or self.default_profile)
+            return copy.deepcopy(settings) if settings is not None else None
+
+    def set(self, settings: Dict, profile: Optional[str] = None):
+        """
+        Atualiza configurações do perfil e agenda a escrita (não bloqueia)
+        """
+        with self._lock:
+            self._profiles[profile or self.default_profile] = copy.deepcopy(settings)
+            self._pending = True
+        self._dirty.set()
+
+    def delete(self, profile: str) -> bool:
+        """
+        Remove um perfil
+
+        Returns:
+            True se o perfil existia
+        """
+        with self._lock:
+            existed = self._profiles.pop(profile, None) is not None
+            self._pending = self._pending or existed
+        if existed:
+            self._dirty.set()
+        return existed
+
+    def list_profiles(self) -> List[str]:
+        with self._lock:
+            return sorted(self._profiles)
+
+    # ========== PERSISTÊNCIA ==========
+
+    def _writer_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            self._dirty.clear()
+            if self._closed:
+                break
+
+            # Agrupa mudanças que chegarem durante a janela; depois de uma
+            # falha, espera o dobro a cada tentativa (até MAX_RETRY_DELAY)
+            delay = self.debounce
+            if self._failures:
+                delay = min(self.MAX_RETRY_DELAY, max(self.debounce, 0.5) * 2 ** self._failures)
+            time.sleep(delay)
+            self.flush()
+
+    def flush(self):
+        """
+        Grava agora, se houver mudanças pendentes
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._pending = False
+                data = json.dumps(
+                    {'version': self.FORMAT_VERSION, 'profiles': self._profiles},
+                    indent=2
+                )
+
+            try:
+                self._write_atomic(data)
+                self._failures = 0
+                logger.debug(f"Settings saved to {self.path}")
+            except Exception as e:
+                logger.error(f"Error saving settings to {self.path}: {e}")
+                self._failures += 1
+                with self._lock:
+                    self._pending = True
+                # Writer tenta de novo (com backoff) sem esperar outro set()
+                self._dirty.set()
+
+    def _write_atomic(self, data: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory,
+            prefix=f".{os.path.basename(self.path)}.",
+            suffix='.tmp'
+        )
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def close(self):
+        """
+        Grava pendências e encerra o writer
+        """
+        self._closed = True
+        self._dirty.set()
+        self.flush()
@@ -0,0 +1,221 @@
+import sqlite3
+import threading
+import queue
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Sequence
+
+class SQLiteStore:
+    """
+    Camada de acesso SQLite thread-safe
+
+    - Journal em modo WAL (leitores não bloqueiam o writer)
+    - Uma conexão de leitura por thread
+    - Um único writer em thread dedicada, que agrupa as escritas
+      enfileiradas em uma transação (um commit/fsync por lote)
+
+    Cada escrita roda em um SAVEPOINT próprio, então uma escrita com erro
+    não desfaz as outras do mesmo lote.
+    """
+
+    def __init__(
+        self,
+        db_path,
+        batch_size: int = 200,
+        batch_window: float = 0.05,
+        row_factory: Optional[Callable] = None,
+        busy_timeout_ms: int = 5000
+    ):
+        """
+        Args:
+            db_path: Caminho do banco SQLite
+            batch_size: Número máximo de escritas por transação
+            batch_window: Tempo que o writer espera por mais escritas antes do commit (segundos)
+            row_factory: row_factory das conexões de leitura (ex: sqlite3.Row)
+            busy_timeout_ms: Timeout de lock do SQLite
+        """
+        self.db_path = str(db_path)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.row_factory = row_factory
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._closed = False
+
+        # Ativa WAL (persistente no arquivo do banco)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000)
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            if self.row_factory:
+                conn.row_factory = self.row_factory
+            self._local.conn = conn
+        return conn
+
+    # ========== LEITURA ==========
+
+    def read(self, sql: str, params: Sequence = ()) -> List:
+        """
+        Executa consulta na conexão de leitura da thread atual
+
+        Returns:
+            Lista de linhas
+        """
+        return self._reader().execute(sql, params).fetchall()
+
+    def read_one(self, sql: str, params: Sequence = ()):
+        """
+        Executa consulta e retorna a primeira linha (ou None)
+        """
+        return self._reader().execute(sql, params).fetchone()
+
+    def read_cursor(self, sql: str, params: Sequence = ()) -> sqlite3.Cursor:
+        """
+        Executa consulta e retorna o cursor, para ler aos poucos (fetchmany)
+        
+        O cursor só deve ser usado na thread atual.
+        """
+        return self._reader().execute(sql, params)
+    
+    # ========== ESCRITA ==========
+
+    def transaction(self, fn: Callable[[sqlite3.Connection], Any], wait: bool = False) -> Future:
+        """
+        Enfileira uma função que recebe a conexão de escrita
+
+        Útil para várias instruções que precisam rodar juntas.
+
+        Args:
+            fn: Função (conn) → resultado, executada na thread do writer
+            wait: Bloqueia até o commit do lote
+
+        Returns:
+            Future com o resultado de fn (resolvida após o commit)
+        """
+        if self._closed:
+            raise RuntimeError("SQLiteStore is closed")
+
+        future: Future = Future()
+        self._queue.put((fn, future))
+
+        if wait:
+            future.result()
+
+        return future
+
+    def write(self, sql: str, params: Sequence = (), wait: bool = False) -> Future:
+        """
+        Enfileira uma instrução de escrita
+
+        Returns:
+            Future com o rowcount (resolvida após o commit)
+        """
+        return self.transaction(lambda conn: conn.execute(sql, params).rowcount, wait)
+
+    def write_many(self, sql: str, seq_of_params: Sequence[Sequence], wait: bool = False) -> Future:
+        """
+        Enfileira executemany como uma única escrita
+        """
+        seq_of_params = list(seq_of_params)
+        return self.transaction(lambda conn: conn.executemany(sql, seq_of_params).rowcount, wait)
+
+    def flush(self):
+        """
+        Bloqueia até todas as escritas enfileiradas serem commitadas
+        """
+        self.transaction(lambda conn: None, wait=True)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        conn.isolation_level = None  # transações explícitas
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            batch = [job]
+            stop = False
+
+            # Agrupa escritas que chegarem dentro da janela
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get(timeout=self.batch_window)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+
+            self._run_batch(conn, batch)
+
+            if stop:
+                break
+
+        conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: List[tuple]):
+        results = []
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            for fn, future in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((future, fn(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((future, None, e))
+
+            conn.execute("COMMIT")
+
+        except Exception as e:
+            print(f"SQLite batch error ({self.db_path}): {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for fn, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Resolve futures só depois do commit
+        for future, result, error in results:
+            if error is not None:
+                print(f"SQLite write error ({self.db_path}): {error}")
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        """
+        Commita escritas pendentes e encerra o writer
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -1,29 +1,59 @@
 import sqlite3
 import json
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import logging
 
+from sqlite_store import SQLiteStore
+
 logger = logging.getLogger(__name__)
 
+def _utc_timestamp(dt: Optional[datetime] = None) -> str:
+    """
+    Timestamp no mesmo formato de CURRENT_TIMESTAMP do SQLite (UTC)
+    """
+    return (dt or datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S')
+
 class UserData:
     """
     Gerencia histórico de reprodução e favoritos do usuário
+    
+    Banco em WAL via SQLiteStore. Eventos de histórico são write-behind:
+    enfileirados e gravados em lote pelo writer, fora do /play.
+    
+    Estatísticas vêm de agregados mantidos na mesma transação de cada
+    play (stats_totals, track_meta, play_rollups), sem varrer o histórico.
     """
     
+    # Versão do schema (PRAGMA user_version)
+    SCHEMA_VERSION = 3
+    
+    # Bucket de cada período de rollup (expressão SQLite sobre played_at)
+    ROLLUP_BUCKETS = {
+        'day': "date(?)",
+        'week': "date(?, 'weekday 0', '-6 days')"  # segunda-feira da semana
+    }
+    
+    # Janela máxima das consultas de analytics (dias) e máximo de resultados
+    MAX_STATS_DAYS = 3650
+    MAX_STATS_LIMIT = 500
+    
     def __init__(self, db_file: str = 'user_data.db'):
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self.store = SQLiteStore(db_file, row_factory=sqlite3.Row)
         
-        self._create_tables()
+        # Última escrita de histórico pendente (leituras esperam por ela)
+        self._last_history_write: Optional[Future] = None
+        
+        self.store.transaction(self._create_tables, wait=True)
         logger.info(f"UserData initialized with database: {db_file}")
     
-    def _create_tables(self):
+    def _create_tables(self, conn: sqlite3.Connection):
         """
-        Cria tabelas do banco de dados
+        Cria tabelas do banco de dados e aplica migrações
         """
-        cursor = self.conn.cursor()
+        cursor = conn.cursor()
         
         # History table
         cursor.execute('''
@@ -62,9 +92,200 @@ class UserData:
             )
         ''')
         
-        self.conn.commit()
+        self._migrate(conn)
         logger.debug("Database tables created/verified")
     
+    def _migrate(self, conn: sqlite3.Connection):
+        """
+        Migrações incrementais controladas por PRAGMA user_version
+        """
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        
+        if version < 1:
+            # Histórico ordenado por data e busca por música sem varrer a tabela
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_history_played_at ON history (played_at DESC)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_history_track ON history (track_id, played_at)')
+        
+        if version < 2:
+            self._create_aggregates(conn)
+        
+        if version < 3:
+            self._create_daily_rollups(conn)
+        
+        if version < self.SCHEMA_VERSION:
+            conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            logger.info(f"UserData schema migrated {version} → {self.SCHEMA_VERSION}")
+    
+    def _create_aggregates(self, conn: sqlite3.Connection):
+        """
+        Cria tabelas de agregados e preenche a partir do histórico existente
+        """
+        # Contadores globais (linha única)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_totals (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_plays INTEGER NOT NULL DEFAULT 0,
+                unique_tracks INTEGER NOT NULL DEFAULT 0,
+                listening_ms INTEGER NOT NULL DEFAULT 0,
+                favorites_count INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        
+        # Última metadata conhecida de cada música
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS track_meta (
+                track_id TEXT PRIMARY KEY,
+                track_name TEXT,
+                artist TEXT,
+                album TEXT,
+                updated_at TIMESTAMP
+            )
+        ''')
+        
+        # Plays e tempo ouvido por dia / semana (bucket = data inicial, UTC)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS play_rollups (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                plays INTEGER NOT NULL DEFAULT 0,
+                listening_ms INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (period, bucket)
+            )
+        ''')
+        
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_play_stats_count ON play_stats (play_count DESC)')
+        
+        # Backfill
+        conn.execute('''
+            INSERT OR REPLACE INTO stats_totals (id, total_plays, unique_tracks, listening_ms, favorites_count)
+            SELECT 1,
+                   (SELECT COUNT(*) FROM history),
+                   (SELECT COUNT(DISTINCT track_id) FROM history),
+                   (SELECT COALESCE(SUM(duration), 0) FROM history WHERE completed = 1),
+                   (SELECT COUNT(*) FROM favorites)
+        ''')
+        conn.execute('''
+            INSERT OR REPLACE INTO track_meta (track_id, track_name, artist, album, updated_at)
+            SELECT track_id, track_name, artist, album, MAX(played_at)
+            FROM history
+            GROUP BY track_id
+        ''')
+        for period, bucket_sql in self.ROLLUP_BUCKETS.items():
+            conn.execute(f'''
+                INSERT OR REPLACE INTO play_rollups (period, bucket, plays, listening_ms)
+                SELECT '{period}', {bucket_sql.replace('?', 'played_at')}, COUNT(*),
+                       COALESCE(SUM(CASE WHEN completed = 1 THEN duration ELSE 0 END), 0)
+                FROM history
+                GROUP BY 2
+            ''')
+    
+    def _create_daily_rollups(self, conn: sqlite3.Connection):
+        """
+        Cria rollups diários por artista e por música (com backfill)
+        """
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS artist_daily (
+                day TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                plays INTEGER NOT NULL DEFAULT 0,
+                listening_ms INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, artist)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS track_daily (
+                day TEXT NOT NULL,
+                track_id TEXT NOT NULL,
+                plays INTEGER NOT NULL DEFAULT 0,
+                listening_ms INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, track_id)
+            )
+        ''')
+        
+        conn.execute('''
+            INSERT OR REPLACE INTO artist_daily (day, artist, plays, listening_ms)
+            SELECT date(played_at), artist, COUNT(*),
+                   COALESCE(SUM(CASE WHEN completed = 1 THEN duration ELSE 0 END), 0)
+            FROM history
+            WHERE artist IS NOT NULL
+            GROUP BY 1, 2
+        ''')
+        conn.execute('''
+            INSERT OR REPLACE INTO track_daily (day, track_id, plays, listening_ms)
+            SELECT date(played_at), track_id, COUNT(*),
+                   COALESCE(SUM(CASE WHEN completed = 1 THEN duration ELSE 0 END), 0)
+            FROM history
+            GROUP BY 1, 2
+        ''')
+    
+    def _record_play(
+        self,
+        conn: sqlite3.Connection,
+        track_info: Dict,
+        duration: int,
+        played_at: str,
+        completed: bool
+    ):
+        """
+        Atualiza agregados de um play (roda na transação do insert no histórico)
+        """
+        track_id = track_info.get('id')
+        listened = duration if completed else 0
+        
+        is_new = conn.execute(
+            'SELECT 1 FROM play_stats WHERE track_id = ?', (track_id,)
+        ).fetchone() is None
+        
+        conn.execute('''
+            UPDATE stats_totals SET
+                total_plays = total_plays + 1,
+                unique_tracks = unique_tracks + ?,
+                listening_ms = listening_ms + ?
+            WHERE id = 1
+        ''', (1 if is_new else 0, listened))
+        
+        conn.execute('''
+            INSERT INTO track_meta (track_id, track_name, artist, album, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(track_id) DO UPDATE SET
+                track_name = excluded.track_name,
+                artist = excluded.artist,
+                album = excluded.album,
+                updated_at = excluded.updated_at
+        ''', (track_id, track_info.get('name'), track_info.get('artist'), track_info.get('album'), played_at))
+        
+        for period, bucket_sql in self.ROLLUP_BUCKETS.items():
+            conn.execute(f'''
+                INSERT INTO play_rollups (period, bucket, plays, listening_ms)
+                VALUES (?, {bucket_sql}, 1, ?)
+                ON CONFLICT(period, bucket) DO UPDATE SET
+                    plays = plays + 1,
+                    listening_ms = listening_ms + excluded.listening_ms
+            ''', (period, played_at, listened))
+        
+        for table, key in (('artist_daily', track_info.get('artist')), ('track_daily', track_id)):
+            if key is None:
+                continue
+            key_column = 'artist' if table == 'artist_daily' else 'track_id'
+            conn.execute(f'''
+                INSERT INTO {table} (day, {key_column}, plays, listening_ms)
+                VALUES (date(?), ?, 1, ?)
+                ON CONFLICT(day, {key_column}) DO UPDATE SET
+                    plays = plays + 1,
+                    listening_ms = listening_ms + excluded.listening_ms
+            ''', (played_at, key, listened))
+    
+    def _wait_history_writes(self):
+        """
+        Garante que eventos de histórico enfileirados já foram gravados
+        """
+        future = self._last_history_write
+        if future is not None and not future.done():
+            try:
+                future.result()
+            except Exception:
+                pass
+    
     # ========== HISTORY ==========
     
     def add_to_history(self, track_info: Dict, completed: bool = True):
@@ -75,38 +296,41 @@ class UserData:
             track_info: Dict com info da música (id, name, artist, album, duration)
             completed: Se a música foi ouvida até o fim
         """
-        try:
-            cursor = self.conn.cursor()
+        played_at = _utc_timestamp()
+        track_id = track_info.get('id')
+        duration = track_info.get('duration', 0)
+        
+        def write(conn: sqlite3.Connection):
+            self._record_play(conn, track_info, duration, played_at, completed)
             
             # Add to history
-            cursor.execute('''
-                INSERT INTO history (track_id, track_name, artist, album, duration, completed)
-                VALUES (?, ?, ?, ?, ?, ?)
+            conn.execute('''
+                INSERT INTO history (track_id, track_name, artist, album, duration, played_at, completed)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
-                track_info.get('id'),
+                track_id,
                 track_info.get('name'),
                 track_info.get('artist'),
                 track_info.get('album'),
-                track_info.get('duration', 0),
+                duration,
+                played_at,
                 completed
             ))
             
             # Update play stats
-            cursor.execute('''
+            conn.execute('''
                 INSERT INTO play_stats (track_id, play_count, last_played, total_time_played)
-                VALUES (?, 1, CURRENT_TIMESTAMP, ?)
+                VALUES (?, 1, ?, ?)
                 ON CONFLICT(track_id) DO UPDATE SET
                     play_count = play_count + 1,
-                    last_played = CURRENT_TIMESTAMP,
-                    total_time_played = total_time_played + ?
-            ''', (
-                track_info.get('id'),
-                track_info.get('duration', 0),
-                track_info.get('duration', 0)
-            ))
-            
-            self.conn.commit()
-            logger.debug(f"Added to history: {track_info.get('name')}")
+                    last_played = excluded.last_played,
+                    total_time_played = total_time_played + excluded.total_time_played
+            ''', (track_id, played_at, duration))
+        
+        try:
+            # Write-behind: o writer agrupa eventos em uma transação
+            self._last_history_write = self.store.transaction(write)
+            logger.debug(f"Queued history event: {track_info.get('name')}")
         
         except Exception as e:
             logger.error(f"Error adding to history: {e}")
@@ -123,14 +347,13 @@ class UserData:
             Lista de músicas do histórico
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+            self._wait_history_writes()
+            rows = self.store.read('''
                 SELECT * FROM history
                 ORDER BY played_at DESC
                 LIMIT ? OFFSET ?
             ''', (limit, offset))
             
-            rows = cursor.fetchall()
             return [dict(row) for row in rows]
         
         except Exception as e:
@@ -140,20 +363,31 @@ class UserData:
     def get_recent_tracks(self, limit: int = 20) -> List[Dict]:
         """
         Retorna músicas tocadas recentemente (sem duplicatas)
+        
+        Percorre o índice de played_at do mais recente para trás e para
+        assim que junta limit músicas distintas (sem GROUP BY na tabela toda).
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT DISTINCT track_id, track_name, artist, album, 
-                       MAX(played_at) as last_played
+            self._wait_history_writes()
+            cursor = self.store.read_cursor('''
+                SELECT track_id, track_name, artist, album, played_at AS last_played
                 FROM history
-                GROUP BY track_id
-                ORDER BY last_played DESC
-                LIMIT ?
-            ''', (limit,))
+                ORDER BY played_at DESC
+            ''')
             
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
+            recent = {}
+            while len(recent) < limit:
+                rows = cursor.fetchmany(max(limit, 100))
+                if not rows:
+                    break
+                for row in rows:
+                    if row['track_id'] not in recent:
+                        recent[row['track_id']] = dict(row)
+                        if len(recent) >= limit:
+                            break
+            
+            cursor.close()
+            return list(recent.values())
         
         except Exception as e:
             logger.error(f"Error getting recent tracks: {e}")
@@ -164,17 +398,15 @@ class UserData:
         Retorna músicas mais tocadas
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT ps.*, h.track_name, h.artist, h.album
+            self._wait_history_writes()
+            rows = self.store.read('''
+                SELECT ps.*, tm.track_name, tm.artist, tm.album
                 FROM play_stats ps
-                JOIN history h ON ps.track_id = h.track_id
-                GROUP BY ps.track_id
+                LEFT JOIN track_meta tm ON tm.track_id = ps.track_id
                 ORDER BY ps.play_count DESC
                 LIMIT ?
             ''', (limit,))
             
-            rows = cursor.fetchall()
             return [dict(row) for row in rows]
         
         except Exception as e:
@@ -185,25 +417,35 @@ class UserData:
         """
         Limpa histórico
         
+        Com older_than_days só as linhas brutas antigas são removidas;
+        contadores e rollups (estatísticas e analytics) são mantidos.
+        
         Args:
             older_than_days: Se especificado, remove apenas itens mais antigos que X dias
         """
         try:
-            cursor = self.conn.cursor()
-            
             if older_than_days:
-                cutoff_date = datetime.now() - timedelta(days=older_than_days)
-                cursor.execute('''
+                cutoff_date = _utc_timestamp(datetime.utcnow() - timedelta(days=older_than_days))
+                self.store.write('''
                     DELETE FROM history
                     WHERE played_at < ?
-                ''', (cutoff_date,))
+                ''', (cutoff_date,), wait=True)
                 logger.info(f"Cleared history older than {older_than_days} days")
             else:
-                cursor.execute('DELETE FROM history')
-                cursor.execute('DELETE FROM play_stats')
+                def clear_all(conn: sqlite3.Connection):
+                    conn.execute('DELETE FROM history')
+                    conn.execute('DELETE FROM play_stats')
+                    conn.execute('DELETE FROM play_rollups')
+                    conn.execute('DELETE FROM artist_daily')
+                    conn.execute('DELETE FROM track_daily')
+                    conn.execute('''
+                        UPDATE stats_totals
+                        SET total_plays = 0, unique_tracks = 0, listening_ms = 0
+                        WHERE id = 1
+                    ''')
+                
+                self.store.transaction(clear_all, wait=True)
                 logger.info("Cleared all history")
-            
-            self.conn.commit()
         
         except Exception as e:
             logger.error(f"Error clearing history: {e}")
@@ -220,9 +462,8 @@ class UserData:
         Returns:
             True se adicionado com sucesso
         """
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+        def write(conn: sqlite3.Connection):
+            conn.execute('''
                 INSERT INTO favorites (track_id, track_name, artist, album, album_art, duration)
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (
@@ -233,8 +474,11 @@ class UserData:
                 track_info.get('album_art'),
                 track_info.get('duration', 0)
             ))
+            conn.execute('UPDATE stats_totals SET favorites_count = favorites_count + 1 WHERE id = 1')
+        
+        try:
+            self.store.transaction(write).result()
             
-            self.conn.commit()
             logger.info(f"Added to favorites: {track_info.get('name')}")
             return True
         
@@ -252,12 +496,18 @@ class UserData:
         Returns:
             True se removido com sucesso
         """
+        def write(conn: sqlite3.Connection) -> int:
+            deleted = conn.execute('DELETE FROM favorites WHERE track_id = ?', (track_id,)).rowcount
+            conn.execute(
+                'UPDATE stats_totals SET favorites_count = favorites_count - ? WHERE id = 1',
+                (deleted,)
+            )
+            return deleted
+        
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM favorites WHERE track_id = ?', (track_id,))
-            self.conn.commit()
+            deleted = self.store.transaction(write).result()
             
-            if cursor.rowcount > 0:
+            if deleted > 0:
                 logger.info(f"Removed from favorites: {track_id}")
                 return True
             else:
@@ -273,9 +523,7 @@ class UserData:
         Verifica se música está nos favoritos
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT 1 FROM favorites WHERE track_id = ?', (track_id,))
-            return cursor.fetchone() is not None
+            return self.store.read_one('SELECT 1 FROM favorites WHERE track_id = ?', (track_id,)) is not None
         except Exception as e:
             logger.error(f"Error checking favorite: {e}")
             return False
@@ -285,14 +533,12 @@ class UserData:
         Retorna lista de favoritos
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+            rows = self.store.read('''
                 SELECT * FROM favorites
                 ORDER BY added_at DESC
                 LIMIT ? OFFSET ?
             ''', (limit, offset))
             
-            rows = cursor.fetchall()
             return [dict(row) for row in rows]
         
         except Exception as e:
@@ -304,53 +550,174 @@ class UserData:
         Retorna número de favoritos
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM favorites')
-            return cursor.fetchone()[0]
+            return self.store.read_one('SELECT favorites_count FROM stats_totals WHERE id = 1')[0]
         except Exception as e:
             logger.error(f"Error counting favorites: {e}")
             return 0
     
+    def get_favorite_ids(self) -> List[str]:
+        """
+        Retorna IDs de todas as músicas favoritas
+        """
+        try:
+            return [row[0] for row in self.store.read('SELECT track_id FROM favorites')]
+        except Exception as e:
+            logger.error(f"Error getting favorite ids: {e}")
+            return []
+    
     # ========== STATISTICS ==========
     
     def get_statistics(self) -> Dict:
         """
-        Retorna estatísticas gerais
+        Retorna estatísticas gerais (lidas dos agregados)
         """
         try:
-            cursor = self.conn.cursor()
-            
-            # Total plays
-            cursor.execute('SELECT COUNT(*) FROM history')
-            total_plays = cursor.fetchone()[0]
+            self._wait_history_writes()
             
-            # Unique tracks
-            cursor.execute('SELECT COUNT(DISTINCT track_id) FROM history')
-            unique_tracks = cursor.fetchone()[0]
+            totals = self.store.read_one('SELECT * FROM stats_totals WHERE id = 1')
             
-            # Total listening time (seconds)
-            cursor.execute('SELECT SUM(duration) FROM history WHERE completed = 1')
-            total_time = cursor.fetchone()[0] or 0
+            # Tempo ouvido (duração em ms no histórico)
+            total_time = totals['listening_ms'] // 1000
             
-            # Favorites count
-            favorites_count = self.get_favorites_count()
+            today = self._get_rollup('day', "date('now')")
+            week = self._get_rollup('week', "date('now', 'weekday 0', '-6 days')")
             
             return {
-                'total_plays': total_plays,
-                'unique_tracks': unique_tracks,
+                'total_plays': totals['total_plays'],
+                'unique_tracks': totals['unique_tracks'],
                 'total_listening_time': total_time,
                 'total_listening_hours': round(total_time / 3600, 1),
-                'favorites_count': favorites_count
+                'favorites_count': totals['favorites_count'],
+                'plays_today': today['plays'],
+                'plays_this_week': week['plays'],
+                'listening_minutes_today': today['listening_ms'] // 60000,
+                'listening_minutes_this_week': week['listening_ms'] // 60000
             }
         
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
             return {}
     
+    # ========== ANALYTICS (rollups diários) ==========
+    
+    @classmethod
+    def _clamp_days(cls, days: int) -> int:
+        return max(1, min(cls.MAX_STATS_DAYS, days))
+    
+    @classmethod
+    def _clamp_limit(cls, limit: int) -> int:
+        return max(1, min(cls.MAX_STATS_LIMIT, limit))
+    
+    @classmethod
+    def _since(cls, days: int) -> str:
+        """
+        Primeiro dia (UTC) de uma janela de N dias terminando hoje
+        (limitada a MAX_STATS_DAYS)
+        """
+        return _utc_timestamp(datetime.utcnow() - timedelta(days=cls._clamp_days(days) - 1))[:10]
+    
+    def get_top_artists(self, days: int = 7, limit: int = 10) -> List[Dict]:
+        """
+        Artistas mais ouvidos nos últimos N dias
+        
+        Returns:
+            Lista de {artist, plays, listening_ms}
+        """
+        try:
+            self._wait_history_writes()
+            rows = self.store.read('''
+                SELECT artist, SUM(plays) AS plays, SUM(listening_ms) AS listening_ms
+                FROM artist_daily
+                WHERE day >= ?
+                GROUP BY artist
+                ORDER BY plays DESC, listening_ms DESC
+                LIMIT ?
+            ''', (self._since(days), self._clamp_limit(limit)))
+            return [dict(row) for row in rows]
+        
+        except Exception as e:
+            logger.error(f"Error getting top artists: {e}")
+            return []
+    
+    def get_top_tracks(self, days: int = 30, limit: int = 20) -> List[Dict]:
+        """
+        Músicas mais tocadas nos últimos N dias
+        
+        Returns:
+            Lista de {track_id, track_name, artist, album, plays, listening_ms}
+        """
+        try:
+            self._wait_history_writes()
+            rows = self.store.read('''
+                SELECT td.track_id, tm.track_name, tm.artist, tm.album,
+                       td.plays, td.listening_ms
+                FROM (
+                    SELECT track_id, SUM(plays) AS plays, SUM(listening_ms) AS listening_ms
+                    FROM track_daily
+                    WHERE day >= ?
+                    GROUP BY track_id
+                    ORDER BY plays DESC, listening_ms DESC
+                    LIMIT ?
+                ) td
+                LEFT JOIN track_meta tm ON tm.track_id = td.track_id
+                ORDER BY td.plays DESC, td.listening_ms DESC
+            ''', (self._since(days), self._clamp_limit(limit)))
+            return [dict(row) for row in rows]
+        
+        except Exception as e:
+            logger.error(f"Error getting top tracks: {e}")
+            return []
+    
+    def get_listening_per_day(self, days: int = 30) -> List[Dict]:
+        """
+        Minutos ouvidos e plays por dia nos últimos N dias (dias sem plays = 0)
+        
+        Returns:
+            Lista de {day, plays, minutes}, do mais antigo para hoje
+        """
+        try:
+            self._wait_history_writes()
+            since = self._since(days)
+            rows = self.store.read('''
+                SELECT bucket, plays, listening_ms
+                FROM play_rollups
+                WHERE period = 'day' AND bucket >= ?
+            ''', (since,))
+            by_day = {row['bucket']: row for row in rows}
+            
+            start = datetime.strptime(since, '%Y-%m-%d')
+            result = []
+            for offset in range(self._clamp_days(days)):
+                day = (start + timedelta(days=offset)).strftime('%Y-%m-%d')
+                row = by_day.get(day)
+                result.append({
+                    'day': day,
+                    'plays': row['plays'] if row else 0,
+                    'minutes': round(row['listening_ms'] / 60000, 1) if row else 0
+                })
+            return result
+        
+        except Exception as e:
+            logger.error(f"Error getting listening per day: {e}")
+            return []
+    
+    def _get_rollup(self, period: str, bucket_sql: str) -> Dict:
+        row = self.store.read_one(
+            f'SELECT plays, listening_ms FROM play_rollups WHERE period = ? AND bucket = {bucket_sql}',
+            (period,)
+        )
+        return dict(row) if row else {'plays': 0, 'listening_ms': 0}
+    
+    def close(self):
+        """
+        Grava eventos pendentes e fecha o banco
+        """
+        self.store.close()
+        logger.debug("Database connection closed")
+    
     def __del__(self):
         """
         Fecha conexão ao destruir objeto
         """
-        if hasattr(self, 'conn'):
-            self.conn.close()
-            logger.debug("Database connection closed")
\ No newline at end of file
+        if hasattr(self, 'store'):
+            self.close()
\ No newline at end of file
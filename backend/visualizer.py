@@ -1,8 +1,11 @@
+import asyncio
 import numpy as np
+import struct
 import threading
 import time
-from typing import List, Dict, Optional
-import queue
+from typing import Callable, List, Dict, Optional, Tuple
+
+from pcm_tap import PCMRingBuffer
 
 class AudioVisualizer:
     """
@@ -10,34 +13,135 @@ class AudioVisualizer:
     
     Usa FFT (Fast Fourier Transform) para extrair frequências
     do áudio tocando e gerar dados para visualização
+    
+    Bandas espaçadas logaritmicamente (como o ouvido percebe). Bordas das
+    bandas e janela de Hann são calculadas uma vez; cada frame é reduzido
+    com np.add.reduceat, sem loop Python por banda.
+    
+    A análise é sob demanda: a thread dorme sem clientes inscritos, ou sem
+    áudio tocando, e o FPS acompanha a maior taxa pedida pelos clientes.
     """
     
-    def __init__(self, num_bands: int = 64, sample_rate: int = 44100):
+    # Máximo de bandas: acima disso as bandas graves seriam quase todas
+    # empurradas para um bin cada (a FFT não cresce para resolvê-las)
+    MAX_BANDS = 256
+    
+    # Faixa dinâmica exibida (dBFS → 0-1)
+    DB_FLOOR = -80.0
+    
+    # Polling HTTP conta como inscrição temporária (segundos)
+    POLL_LEASE_SECONDS = 2.0
+    
+    def __init__(
+        self,
+        num_bands: int = 64,
+        sample_rate: int = 44100,
+        frame_size: int = 2048,
+        fps: int = 60,
+        min_freq: float = 20.0,
+        max_freq: Optional[float] = None,
+        playback_active: Optional[Callable[[], bool]] = None
+    ):
         """
         Args:
-            num_bands: Número de bandas de frequência (default 64)
+            num_bands: Número de bandas de frequência (default 64, máximo MAX_BANDS)
             sample_rate: Taxa de amostragem em Hz (default 44100)
+            frame_size: Tamanho da FFT em samples (aumentado se tiver menos de
+                2 bins por banda)
+            fps: Máximo de frames de análise por segundo
+            min_freq: Frequência inicial da primeira banda (Hz)
+            max_freq: Frequência final da última banda (default Nyquist)
+            playback_active: Retorna True enquanto o player toca (ex: lambda: player.is_playing)
         """
+        if num_bands > self.MAX_BANDS:
+            print(f"Visualizer: {num_bands} bands requested, using {self.MAX_BANDS}")
+            num_bands = self.MAX_BANDS
+        
         self.num_bands = num_bands
         self.sample_rate = sample_rate
+        self.fps = fps
+        self.min_freq = min_freq
+        self.max_freq = min(max_freq or sample_rate / 2, sample_rate / 2)
+        
+        # Pré-calculados uma vez
+        self.frame_size = frame_size
+        self._build_bands()
+        self.window = np.hanning(self.frame_size).astype(np.float32)
+        self._window_gain = float(self.window.sum()) / 2
         
         # Estado
         self.enabled = False
-        self.spectrum_data = [0.0] * num_bands
-        self.peak_levels = [0.0] * num_bands
+        self.spectrum_data = np.zeros(num_bands, dtype=np.float32)
+        self.peak_levels = np.zeros(num_bands, dtype=np.float32)
         
         # Smoothing para transições suaves
         self.smoothing_factor = 0.7  # 0-1 (maior = mais suave)
-        self.previous_spectrum = [0.0] * num_bands
+        self.previous_spectrum = np.zeros(num_bands, dtype=np.float32)
         
         # Thread de captura
         self.capture_thread: Optional[threading.Thread] = None
         self.running = False
+        self.playback_active = playback_active or (lambda: False)
         
-        # Queue de samples de áudio
-        self.audio_queue = queue.Queue(maxsize=100)
+        # Inscrições (token → fps) e lease do polling HTTP
+        self._subscribers: Dict[int, float] = {}
+        self._next_token = 0
+        self._poll_fps = 0.0
+        self._last_poll = 0.0
         
-        print(f"AudioVisualizer initialized: {num_bands} bands @ {sample_rate}Hz")
+        # Acordam a thread: inscrição nova / toggle, e áudio novo no ring
+        self._wake = threading.Event()
+        self._audio_event = threading.Event()
+        
+        # Ring buffer de PCM (mono float32), preenchido pelo tap do player;
+        # cada frame de análise é a janela mais recente de frame_size samples
+        self.ring = PCMRingBuffer(self.frame_size * 8)
+        self.ring.data_event = self._audio_event
+        self._frame = np.zeros(self.frame_size, dtype=np.float32)
+        self._last_audio = 0.0
+        
+        # Último frame publicado, quantizado para streaming binário
+        self.frame_seq = 0
+        self.rms = 0.0
+        self.overall_peak = 0.0
+        self.spectrum_u8 = np.zeros(num_bands, dtype=np.uint8)
+        self.peaks_u8 = np.zeros(num_bands, dtype=np.uint8)
+        self._frame_lock = threading.Lock()
+        self._frame_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        
+        print(f"AudioVisualizer initialized: {num_bands} bands @ {sample_rate}Hz (FFT {self.frame_size})")
+    
+    def _build_bands(self):
+        """
+        Calcula bordas das bandas (índices de bins da FFT) em escala log
+        
+        Aumenta frame_size só se não houver bins suficientes para todas as
+        bandas (ao menos 2 bins por banda, em média). A resolução nos graves
+        continua limitada por frame_size: bandas mais estreitas que um bin
+        ficam com um bin cada.
+        """
+        offsets = np.arange(self.num_bands + 1)
+        freqs = np.geomspace(self.min_freq, self.max_freq, self.num_bands + 1)
+        
+        while True:
+            num_bins = self.frame_size // 2 + 1
+            bin_hz = self.sample_rate / self.frame_size
+            
+            # Ignora o bin DC
+            edges = np.maximum(np.floor(freqs / bin_hz).astype(np.int64), 1)
+            
+            # Cada banda precisa de ao menos um bin: força bordas estritamente
+            # crescentes (bandas graves mais estreitas que um bin são empurradas)
+            edges = np.maximum.accumulate(edges - offsets) + offsets
+            
+            if edges[-1] <= num_bins and num_bins >= 2 * self.num_bands:
+                break
+            self.frame_size *= 2
+        
+        self.band_edges = edges
+        self.band_starts = edges[:-1]
+        self.band_widths = np.diff(edges).astype(np.float32)
+        self.band_freqs = edges * bin_hz
     
     def start(self):
         """
@@ -60,99 +164,260 @@ class AudioVisualizer:
         """
         self.enabled = False
         self.running = False
+        self._wake.set()
+        self._audio_event.set()
         
         if self.capture_thread:
             self.capture_thread.join(timeout=1)
         
         print("⏹️ Visualizer stopped")
     
-    def _capture_loop(self):
+    # ========== INSCRIÇÕES ==========
+    
+    def subscribe(self, fps: Optional[float] = None) -> int:
+        """
+        Registra um cliente interessado nos frames
+        
+        Args:
+            fps: Taxa desejada (default/máximo: self.fps)
+        
+        Returns:
+            Token para unsubscribe
+        """
+        with self._frame_lock:
+            self._next_token += 1
+            token = self._next_token
+            self._subscribers[token] = min(fps or self.fps, self.fps)
+        
+        self._wake.set()
+        return token
+    
+    def unsubscribe(self, token: int):
+        with self._frame_lock:
+            self._subscribers.pop(token, None)
+    
+    def touch(self):
         """
-        Loop principal de captura (30 FPS)
+        Registra um poll HTTP (inscrição temporária de POLL_LEASE_SECONDS)
+        
+        O FPS do lease acompanha o intervalo entre polls.
         """
-        fps = 30
-        frame_time = 1.0 / fps
+        now = time.time()
+        interval = now - self._last_poll
+        self._last_poll = now
+        
+        if interval < self.POLL_LEASE_SECONDS:
+            rate = min(self.fps, 1 / max(interval, 1e-3))
+            self._poll_fps = rate if not self._poll_fps else 0.7 * self._poll_fps + 0.3 * rate
+        else:
+            self._poll_fps = min(self.fps, 10)
         
+        self._wake.set()
+    
+    def is_watched(self) -> bool:
+        """
+        True se algum cliente (inscrito ou polling) quer frames agora
+        """
+        return self._target_fps() > 0
+    
+    def _target_fps(self) -> float:
+        """
+        FPS necessário agora (0 = ninguém assistindo)
+        """
+        if not self.enabled:
+            return 0
+        
+        with self._frame_lock:
+            rates = list(self._subscribers.values())
+        
+        if time.time() - self._last_poll < self.POLL_LEASE_SECONDS:
+            rates.append(self._poll_fps)
+        
+        return min(self.fps, max(rates)) if rates else 0
+    
+    def _capture_loop(self):
+        """
+        Loop principal de captura
+        
+        Dorme (sem timeout) quando ninguém está inscrito ou quando o player
+        está parado e o espectro já decaiu; acorda com inscrição nova ou
+        áudio novo no ring buffer.
+        """
         while self.running:
+            fps = self._target_fps()
+            
+            if fps <= 0:
+                self._wake.clear()
+                if self._target_fps() <= 0:
+                    self._wake.wait()
+                continue
+            
             start_time = time.time()
             
-            if self.enabled:
-                # Processar audio da queue
-                self._process_audio_frame()
+            # Analisar a janela mais recente do ring buffer
+            active = self._process_audio_frame()
+            
+            if not active and not self.playback_active():
+                self._wait_for_audio()
+                continue
             
-            # Manter FPS constante
+            # Manter FPS
             elapsed = time.time() - start_time
-            sleep_time = max(0, frame_time - elapsed)
-            time.sleep(sleep_time)
+            time.sleep(max(0, 1.0 / fps - elapsed))
+    
+    def _wait_for_audio(self):
+        self._audio_event.clear()
+        
+        # Áudio chegou entre o último frame e o clear
+        if self.ring.write_pos != self.ring.read_pos:
+            return
+        
+        self._audio_event.wait()
+    
+    def _compute_bands(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Espectro por banda (0-1) de um frame já preparado
+        """
+        magnitude = np.abs(np.fft.rfft(frame * self.window)) / self._window_gain
+        
+        # Média da magnitude em cada banda
+        sums = np.add.reduceat(magnitude[:self.band_edges[-1]], self.band_starts)
+        amplitude = sums / self.band_widths
+        
+        # dBFS → 0-1
+        db = 20 * np.log10(amplitude + 1e-9)
+        return np.clip((db - self.DB_FLOOR) / -self.DB_FLOOR, 0.0, 1.0).astype(np.float32)
     
-    def _process_audio_frame(self):
+    def _process_audio_frame(self) -> bool:
         """
         Processa um frame de áudio e calcula espectro FFT
+        
+        Returns:
+            False se não há nada a fazer (sem áudio novo e espectro zerado)
         """
         try:
-            # Pegar samples da queue (timeout curto)
-            samples = self.audio_queue.get(timeout=0.01)
+            # Janela mais recente (sobreposta à anterior)
+            if not self.ring.read_latest(self._frame):
+                # Callbacks do VLC chegam em blocos: só decai após um silêncio real
+                if time.time() - self._last_audio <= 0.1:
+                    return True
+                return self._decay()
             
-            if len(samples) == 0:
-                return
+            self._last_audio = time.time()
+            normalized = self._compute_bands(self._frame)
             
-            # Aplicar FFT
-            fft_data = np.fft.rfft(samples)
-            fft_magnitude = np.abs(fft_data)
+            # Aplicar smoothing (in-place)
+            self.previous_spectrum *= self.smoothing_factor
+            self.previous_spectrum += (1 - self.smoothing_factor) * normalized
+            self.spectrum_data[:] = self.previous_spectrum
             
-            # Dividir em bandas
-            band_size = len(fft_magnitude) // self.num_bands
+            # Atualizar picos, com decaimento lento
+            self.peak_levels *= 0.95
+            np.maximum(self.peak_levels, self.spectrum_data, out=self.peak_levels)
             
-            for i in range(self.num_bands):
-                start_idx = i * band_size
-                end_idx = start_idx + band_size
-                
-                # Média da magnitude na banda
-                band_value = np.mean(fft_magnitude[start_idx:end_idx])
-                
-                # Normalizar (0-1)
-                normalized = min(1.0, band_value / 1000.0)
-                
-                # Aplicar smoothing
-                smoothed = (
-                    self.smoothing_factor * self.previous_spectrum[i] +
-                    (1 - self.smoothing_factor) * normalized
-                )
-                
-                self.spectrum_data[i] = smoothed
-                self.previous_spectrum[i] = smoothed
-                
-                # Atualizar picos
-                if smoothed > self.peak_levels[i]:
-                    self.peak_levels[i] = smoothed
-                else:
-                    # Decaimento lento dos picos
-                    self.peak_levels[i] *= 0.95
-        
-        except queue.Empty:
-            # Sem áudio, decair gradualmente para zero
-            for i in range(self.num_bands):
-                self.spectrum_data[i] *= 0.9
-                self.peak_levels[i] *= 0.95
+            self._publish_frame()
         
         except Exception as e:
             print(f"Error processing audio: {e}")
+        
+        return True
+    
+    def _decay(self) -> bool:
+        """
+        Sem áudio, decair gradualmente para zero
+        
+        Returns:
+            False quando o espectro já chegou a zero
+        """
+        if not self.peak_levels.any():
+            return False
+        
+        self.spectrum_data *= 0.9
+        self.previous_spectrum *= 0.9
+        self.peak_levels *= 0.95
+        
+        # Abaixo de um degrau de quantização: zera de vez
+        if self.peak_levels.max() < 1 / 255:
+            self.spectrum_data.fill(0.0)
+            self.previous_spectrum.fill(0.0)
+            self.peak_levels.fill(0.0)
+        
+        self._publish_frame()
+        return True
+    
+    def _publish_frame(self):
+        """
+        Quantiza o frame atual e acorda os streams esperando por ele
+        """
+        with self._frame_lock:
+            self.rms = float(np.sqrt(np.mean(self.spectrum_data ** 2)))
+            self.overall_peak = float(self.spectrum_data.max()) if self.num_bands else 0.0
+            self.spectrum_u8[:] = self.spectrum_data * 255 + 0.5
+            self.peaks_u8[:] = self.peak_levels * 255 + 0.5
+            self.frame_seq += 1
+            
+            waiters = self._frame_waiters
+            self._frame_waiters = []
+        
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(
+                lambda f=future: f.done() or f.set_result(True)
+            )
+    
+    def get_quantized_frame(self) -> Tuple[int, np.ndarray, np.ndarray, float, float]:
+        """
+        Retorna cópia consistente do último frame publicado
+        
+        Returns:
+            Tupla (seq, spectrum uint8, peaks uint8, rms, overall_peak)
+        """
+        with self._frame_lock:
+            return (
+                self.frame_seq,
+                self.spectrum_u8.copy(),
+                self.peaks_u8.copy(),
+                self.rms,
+                self.overall_peak
+            )
+    
+    async def wait_frame_async(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """
+        Espera um frame mais novo que after_seq (sem polling)
+        
+        Returns:
+            frame_seq atual (igual a after_seq se o timeout estourou)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        with self._frame_lock:
+            if self.frame_seq > after_seq:
+                return self.frame_seq
+            self._frame_waiters.append((loop, future))
+        
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._frame_lock:
+                if (loop, future) in self._frame_waiters:
+                    self._frame_waiters.remove((loop, future))
+        
+        return self.frame_seq
     
     def add_audio_samples(self, samples: np.ndarray):
         """
         Adiciona samples de áudio para análise
         
         Args:
-            samples: Array numpy de samples de áudio
+            samples: Array numpy de samples (int16 ou float), shape
+                (n,) mono ou (n, canais)
         """
         if not self.enabled:
             return
         
-        try:
-            self.audio_queue.put_nowait(samples)
-        except queue.Full:
-            # Queue cheia, descartar frame (não é crítico)
-            pass
+        samples = np.asarray(samples)
+        channels = samples.shape[1] if samples.ndim > 1 else 1
+        self.ring.write(samples.reshape(-1), channels)
     
     def get_spectrum_data(self) -> List[float]:
         """
@@ -161,7 +426,7 @@ class AudioVisualizer:
         Returns:
             Lista de valores 0-1 para cada banda
         """
-        return self.spectrum_data.copy()
+        return self.spectrum_data.tolist()
     
     def get_peaks(self) -> List[float]:
         """
@@ -170,7 +435,7 @@ class AudioVisualizer:
         Returns:
             Lista de valores 0-1 para cada banda
         """
-        return self.peak_levels.copy()
+        return self.peak_levels.tolist()
     
     def get_visualization_data(self) -> Dict:
         """
@@ -179,21 +444,13 @@ class AudioVisualizer:
         Returns:
             Dict com spectrum, peaks, rms, enabled
         """
-        spectrum = self.get_spectrum_data()
-        peaks = self.get_peaks()
-        
-        # Calcular RMS (Root Mean Square) do espectro
-        rms = np.sqrt(np.mean(np.array(spectrum) ** 2))
-        
-        # Detectar picos gerais
-        overall_peak = max(spectrum) if spectrum else 0.0
-        
+        # RMS e pico geral já calculados a cada frame
         return {
             'enabled': self.enabled,
-            'spectrum': spectrum,
-            'peaks': peaks,
-            'rms': float(rms),
-            'overall_peak': float(overall_peak),
+            'spectrum': self.get_spectrum_data(),
+            'peaks': self.get_peaks(),
+            'rms': self.rms,
+            'overall_peak': self.overall_peak,
             'num_bands': self.num_bands,
             'sample_rate': self.sample_rate
         }
@@ -212,7 +469,7 @@ class AudioVisualizer:
         """
         Reseta níveis de pico
         """
-        self.peak_levels = [0.0] * self.num_bands
+        self.peak_levels.fill(0.0)
     
     def toggle_enabled(self) -> bool:
         """
@@ -222,6 +479,7 @@ class AudioVisualizer:
             Estado após toggle
         """
         self.enabled = not self.enabled
+        self._wake.set()
         
         if self.enabled and not self.running:
             self.start()
@@ -242,13 +500,8 @@ class AudioVisualizer:
         if band_index < 0 or band_index >= self.num_bands:
             return (0, 0)
         
-        # Frequência máxima é metade do sample rate (Nyquist)
-        max_freq = self.sample_rate / 2
-        
-        band_width = max_freq / self.num_bands
-        
-        freq_min = band_index * band_width
-        freq_max = (band_index + 1) * band_width
+        freq_min = self.band_freqs[band_index]
+        freq_max = self.band_freqs[band_index + 1]
         
         return (int(freq_min), int(freq_max))
     
@@ -258,6 +511,82 @@ class AudioVisualizer:
         """
         self.stop()
 
+class SpectrumEncoder:
+    """
+    Codifica frames do visualizador em binário compacto (um por cliente)
+    
+    Formato (little-endian):
+        header <BBHHBB>: versão, flags, seq, num_bands, rms (u8), overall_peak (u8)
+        spectrum: num_bands bytes (uint8 0-255, ou int8 delta se FLAG_DELTA)
+        peaks: num_bands bytes com a mesma codificação (se FLAG_PEAKS)
+    
+    Com 64 bandas e picos: 8 + 64 + 64 = 136 bytes por frame. Deltas são
+    relativos ao último frame enviado a este cliente; um keyframe é enviado
+    a cada keyframe_interval frames ou quando um delta não cabe em int8.
+    """
+    
+    VERSION = 1
+    FLAG_DELTA = 0x01
+    FLAG_PEAKS = 0x02
+    HEADER = struct.Struct('<BBHHBB')
+    
+    def __init__(self, use_delta: bool = True, include_peaks: bool = True, keyframe_interval: int = 30):
+        """
+        Args:
+            use_delta: Envia diferenças contra o frame anterior
+            include_peaks: Inclui níveis de pico
+            keyframe_interval: Frames entre keyframes (frames absolutos)
+        """
+        self.use_delta = use_delta
+        self.include_peaks = include_peaks
+        self.keyframe_interval = keyframe_interval
+        
+        self._previous: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+    
+    def encode(
+        self,
+        seq: int,
+        spectrum: np.ndarray,
+        peaks: np.ndarray,
+        rms: float,
+        overall_peak: float
+    ) -> Optional[bytes]:
+        """
+        Codifica um frame (arrays uint8 de get_quantized_frame)
+        
+        Returns:
+            Bytes do frame, ou None se nada mudou desde o último enviado
+        """
+        current = np.concatenate((spectrum, peaks)) if self.include_peaks else spectrum
+        flags = self.FLAG_PEAKS if self.include_peaks else 0
+        
+        payload = None
+        if self.use_delta and self._previous is not None and self._since_keyframe < self.keyframe_interval:
+            delta = current.astype(np.int16) - self._previous
+            if not delta.any():
+                return None
+            if delta.min() >= -128 and delta.max() <= 127:
+                payload = delta.astype(np.int8).tobytes()
+                flags |= self.FLAG_DELTA
+                self._since_keyframe += 1
+        
+        if payload is None:
+            payload = current.tobytes()
+            self._since_keyframe = 0
+        
+        self._previous = current.astype(np.int16)
+        
+        header = self.HEADER.pack(
+            self.VERSION,
+            flags,
+            seq & 0xFFFF,
+            len(spectrum),
+            int(rms * 255 + 0.5),
+            int(overall_peak * 255 + 0.5)
+        )
+        return header + payload
+
 # Funções utilitárias para geração de dados de teste
 
 def generate_test_spectrum(num_bands: int = 64) -> List[float]:
@@ -0,0 +1,225 @@
+import yt_dlp
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Callable
+
+class _PooledYoutubeDL:
+    """
+    Instância YoutubeDL do pool com hooks trocáveis a cada uso
+    """
+
+    def __init__(self, opts: Dict):
+        self.progress_hooks: List[Callable] = []
+
+        opts = dict(opts)
+        opts['progress_hooks'] = [self._dispatch_progress]
+        self.ydl = yt_dlp.YoutubeDL(opts)
+        self.default_outtmpl = self.ydl.params.get('outtmpl')
+
+    def _dispatch_progress(self, d):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def bind(self, outtmpl: Optional[str], progress_hooks: Optional[List[Callable]]):
+        """
+        Configura template de saída e hooks para o uso atual
+        """
+        if outtmpl:
+            self.ydl.params['outtmpl'] = {'default': outtmpl}
+        self.progress_hooks = list(progress_hooks or [])
+
+    def unbind(self):
+        self.ydl.params['outtmpl'] = self.default_outtmpl
+        self.progress_hooks = []
+
+    def close(self):
+        try:
+            self.ydl.__exit__(None, None, None)
+        except Exception as e:
+            print(f"Error closing YoutubeDL: {e}")
+
+class YoutubeDLPool:
+    """
+    Pool de instâncias YoutubeDL pré-aquecidas, separadas por perfil de opções
+
+    Evita refazer a inicialização dos extractors, o parsing de opções e a
+    sessão HTTP a cada busca/download. Cada instância é usada por uma
+    thread por vez, então o pool pode ser compartilhado entre o
+    MusicMatcher, o AudioCache e o executor do PlaylistManager.
+    """
+
+    def __init__(self, max_per_profile: int = 8, acquire_timeout: float = 120):
+        """
+        Args:
+            max_per_profile: Número máximo de instâncias por perfil
+            acquire_timeout: Tempo máximo de espera por uma instância (segundos)
+        """
+        self.max_per_profile = max_per_profile
+        self.acquire_timeout = acquire_timeout
+
+        self.profiles: Dict[str, Dict] = {}
+        self._idle: Dict[str, List[_PooledYoutubeDL]] = {}
+        self._created: Dict[str, int] = {}
+        self._metrics: Dict[str, Dict] = {}
+        self._cond = threading.Condition()
+
+    def register_profile(self, name: str, opts: Dict, prewarm: int = 1):
+        """
+        Registra um perfil de opções (idempotente)
+
+        Args:
+            name: Nome do perfil (ex: 'search', 'download_opus')
+            opts: Opções do YoutubeDL
+            prewarm: Número de instâncias criadas antecipadamente
+        """
+        with self._cond:
+            if name in self.profiles:
+                return
+
+            self.profiles[name] = dict(opts)
+            self._idle[name] = []
+            self._created[name] = 0
+            self._metrics[name] = {
+                'acquires': 0,
+                'waits': 0,
+                'wait_time_total': 0.0,
+                'wait_time_max': 0.0,
+                'discarded': 0
+            }
+
+        for _ in range(min(prewarm, self.max_per_profile)):
+            with self._cond:
+                self._created[name] += 1
+            entry = self._create(name)
+            with self._cond:
+                self._idle[name].append(entry)
+
+    def _create(self, profile: str) -> _PooledYoutubeDL:
+        """
+        Cria instância para um slot já reservado em _created
+        """
+        try:
+            return _PooledYoutubeDL(self.profiles[profile])
+        except Exception:
+            with self._cond:
+                self._created[profile] -= 1
+                self._cond.notify_all()
+            raise
+
+    def _checkout(self, profile: str) -> _PooledYoutubeDL:
+        if profile not in self.profiles:
+            raise KeyError(f"Unknown YoutubeDL profile: {profile}")
+
+        start = time.time()
+        waited = False
+
+        with self._cond:
+            self._metrics[profile]['acquires'] += 1
+
+            while True:
+                if self._idle[profile]:
+                    entry = self._idle[profile].pop()
+                    break
+
+                if self._created[profile] < self.max_per_profile:
+                    # Reserva o slot antes de soltar o lock
+                    self._created[profile] += 1
+                    entry = None
+                    break
+
+                waited = True
+                remaining = self.acquire_timeout - (time.time() - start)
+                if remaining <= 0:
+                    raise TimeoutError(f"Timed out waiting for YoutubeDL instance ({profile})")
+                self._cond.wait(remaining)
+
+            if waited:
+                wait_time = time.time() - start
+                metrics = self._metrics[profile]
+                metrics['waits'] += 1
+                metrics['wait_time_total'] += wait_time
+                metrics['wait_time_max'] = max(metrics['wait_time_max'], wait_time)
+
+        # Cria fora do lock (inicialização é lenta)
+        return entry or self._create(profile)
+
+    def _checkin(self, profile: str, entry: _PooledYoutubeDL, discard: bool = False):
+        with self._cond:
+            if discard:
+                self._created[profile] -= 1
+                self._metrics[profile]['discarded'] += 1
+            else:
+                self._idle[profile].append(entry)
+            self._cond.notify()
+
+        if discard:
+            entry.close()
+
+    @contextmanager
+    def acquire(
+        self,
+        profile: str,
+        outtmpl: Optional[str] = None,
+        progress_hooks: Optional[List[Callable]] = None
+    ):
+        """
+        Empresta uma instância YoutubeDL do pool
+
+        Args:
+            profile: Nome do perfil registrado
+            outtmpl: Template de saída para este uso (downloads)
+            progress_hooks: Hooks de progresso para este uso
+
+        Yields:
+            Instância yt_dlp.YoutubeDL
+        """
+        entry = self._checkout(profile)
+        discard = False
+
+        try:
+            entry.bind(outtmpl, progress_hooks)
+            yield entry.ydl
+        except Exception:
+            # Não reaproveita instância que falhou no meio do uso
+            discard = True
+            raise
+        finally:
+            entry.unbind()
+            self._checkin(profile, entry, discard)
+
+    def get_stats(self) -> Dict:
+        """
+        Retorna métricas de uso por perfil
+
+        Returns:
+            Dict perfil → created, idle, in_use, acquires, waits, wait times
+        """
+        with self._cond:
+            stats = {}
+            for name, metrics in self._metrics.items():
+                idle = len(self._idle[name])
+                stats[name] = {
+                    'created': self._created[name],
+                    'idle': idle,
+                    'in_use': self._created[name] - idle,
+                    'acquires': metrics['acquires'],
+                    'waits': metrics['waits'],
+                    'avg_wait_ms': (metrics['wait_time_total'] / metrics['waits'] * 1000) if metrics['waits'] else 0,
+                    'max_wait_ms': metrics['wait_time_max'] * 1000,
+                    'discarded': metrics['discarded']
+                }
+            return stats
+
+    def close(self):
+        """
+        Fecha todas as instâncias ociosas
+        """
+        with self._cond:
+            entries = [entry for idle in self._idle.values() for entry in idle]
+            for name in self._idle:
+                self._created[name] -= len(self._idle[name])
+                self._idle[name] = []
+
+        for entry in entries:
+            entry.close()